@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import functools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import analytic
+import main as sim
+from replications import DEFAULT_CONFIDENCE, ENGINES, build_model, spawn_seeds, t_critical
+from sampling import ANTITHETIC, INVERSE, NATIVE, Exponential
+
+# ----------- Configuration -----------
+# Confidence-interval half-width targets per KPI, in the KPI's own unit
+DEFAULT_TARGETS = {"overtime": 5.0, "walkin_mean_wait": 1.5, "xray_avg_queue": 1.0}
+# Observations before the first check, so the stopping rule never acts on a poor variance estimate
+DEFAULT_INITIAL_UNITS = 20
+DEFAULT_MAX_UNITS = 2000
+
+# ----------- KPIs -----------
+# Computed in the worker from the finished model; any other name is read from the run summary.
+
+def overtime(model, summary):
+    return summary["overtime"]
+
+def walkin_mean_wait(model, summary):
+    records = model.patient_records.to_array()
+    waits = records["doctor_wait"][~records["is_appointment"]]
+    return float(waits.mean()) if len(waits) else float("nan")
+
+def xray_avg_queue(model, summary):
+    # Time-average number of patients waiting for X-ray, over all rooms and the shared line
+    # of pooled dispatch
+    rooms = sum(summary[f"xray{r+1}_avg_queue"] for r in range(model.scenario.num_xray_rooms))
+    return rooms + summary["xray_pool_avg_queue"]
+
+KPI_FUNCTIONS = {"overtime": overtime, "walkin_mean_wait": walkin_mean_wait, "xray_avg_queue": xray_avg_queue}
+
+def kpi_value(name, model, summary):
+    return KPI_FUNCTIONS[name](model, summary) if name in KPI_FUNCTIONS else float(summary[name])
+
+# ----------- Control Variates -----------
+# Run inputs whose expectation is known exactly, centred so that it is zero. They are
+# correlated with the KPIs (more referrals or walk-ins, longer queues), so regressing the KPIs
+# on them removes part of the replication-to-replication noise.
+
+def expected_walkin_arrivals(scenario, appointment_only_doctor_id):
+    # Walk-ins arrive as a Poisson process until the cutoff: cutoff / mean interarrival per doctor.
+    total = 0.0
+    for i in range(scenario.num_doctors):
+        if i == appointment_only_doctor_id:
+            continue
+        arrival = scenario.doctor_config(i)["arrival"]
+        if not isinstance(arrival, Exponential):
+            raise ValueError(f"The walkin_arrivals control needs exponential interarrival times; Dr {i+1} has {arrival}")
+        total += scenario.walkin_cutoff_time / arrival.mean
+    return total
+
+def xray_referrals(model):
+    # Realized minus expected X-ray referrals given who arrived: each decision is a draw
+    # against the doctor's xray_probability, so the difference has mean zero.
+    return model.xray_referral_count - model.expected_xray_referrals
+
+def walkin_arrivals(model):
+    return model.walk_in_arrival_count - expected_walkin_arrivals(model.scenario, model.appointment_only_doctor_id)
+
+CONTROLS = {"xray_referrals": xray_referrals, "walkin_arrivals": walkin_arrivals,
+            "analytic_waits": analytic.wait_control}
+
+# ----------- Workers -----------
+
+def run_unit(seed, scenario=sim.DEFAULT_SCENARIO, engine="simpy", kpis=tuple(DEFAULT_TARGETS), controls=(),
+             antithetic=False):
+    # One observation: the KPIs and controls of a replication or, with antithetic, their
+    # average over the pair of runs of one seed driven by u and by 1 - u.
+    rows = []
+    for variates in ((INVERSE, ANTITHETIC) if antithetic else (NATIVE,)):
+        model = build_model(seed, scenario, engine, variates=variates).run()
+        summary = model.collect_run_summary()
+        rows.append([kpi_value(name, model, summary) for name in kpis] + [CONTROLS[name](model) for name in controls])
+    return np.mean(rows, axis=0).tolist()
+
+# ----------- Estimation -----------
+
+def estimate(values, control_values, confidence=DEFAULT_CONFIDENCE):
+    # Control-variate estimate of the mean: the intercept of the least-squares fit of the KPI
+    # on the zero-mean controls, with its t interval (n - 1 - #controls degrees of freedom).
+    # Without controls this is the sample mean and its usual interval.
+    keep = ~np.isnan(values)
+    y = values[keep]
+    design = np.column_stack([np.ones(len(y)), control_values[keep]])
+    n, k = design.shape
+    result = {"n": n, "mean": float(y.mean()) if n else float("nan"), "half_width": float("nan"),
+              "plain_half_width": float("nan"), "coefficients": []}
+    if n > 1:
+        result["plain_half_width"] = t_critical(confidence, n - 1) * float(y.std(ddof=1)) / math.sqrt(n)
+    if n <= k:
+        return result
+    coefficients, _, _, _ = np.linalg.lstsq(design, y, rcond=None)
+    residuals = y - design @ coefficients
+    variance = float(residuals @ residuals) / (n - k) * float(np.linalg.pinv(design.T @ design)[0, 0])
+    result.update(mean=float(coefficients[0]), half_width=t_critical(confidence, n - k) * math.sqrt(variance),
+                  coefficients=coefficients[1:].tolist())
+    return result
+
+def target_reached(stats, target, relative):
+    limit = target * abs(stats["mean"]) if relative else target
+    return stats["half_width"] <= limit
+
+# ----------- Driver -----------
+
+def run_adaptive(targets=DEFAULT_TARGETS, relative=False, base_seed=sim.RANDOM_SEED, scenario=sim.DEFAULT_SCENARIO,
+                 engine="simpy", antithetic=False, controls=(), confidence=DEFAULT_CONFIDENCE,
+                 initial_units=DEFAULT_INITIAL_UNITS, max_units=DEFAULT_MAX_UNITS, workers=None, progress=None):
+    # Launches replications in parallel batches until every KPI's confidence half-width is
+    # below its target (a fraction of the estimate with relative) or max_units is reached.
+    # A unit is one replication, or one antithetic pair. Unit i always uses replication seed
+    # i of base_seed, as replications.py does, so the result depends on the stopping point
+    # but not on the batch sizes or worker count. Stopping on the data makes the final
+    # interval slightly optimistic; the initial units keep that effect small.
+    kpis = tuple(targets)
+    controls = tuple(controls)
+    for name in controls:
+        if name not in CONTROLS:
+            raise ValueError(f"Unknown control variate '{name}'. Choose from: {', '.join(CONTROLS)}")
+    workers = workers or os.cpu_count() or 1
+    seeds = spawn_seeds(base_seed, max_units)
+    run_one = functools.partial(run_unit, scenario=scenario, engine=engine, kpis=kpis, controls=controls,
+                                antithetic=antithetic)
+    rows = []
+    history = []
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        batch = min(initial_units, max_units)
+        while True:
+            batch_seeds = seeds[len(rows):len(rows) + batch]
+            if executor is None:
+                rows.extend(run_one(seed) for seed in batch_seeds)
+            else:
+                rows.extend(executor.map(run_one, batch_seeds, chunksize=max(1, len(batch_seeds) // (workers * 4))))
+            data = np.array(rows, dtype=float).reshape(len(rows), len(kpis) + len(controls))
+            control_values = data[:, len(kpis):]
+            estimates = {name: estimate(data[:, i], control_values, confidence) for i, name in enumerate(kpis)}
+            open_kpis = [name for name in kpis if not target_reached(estimates[name], targets[name], relative)]
+            n = len(rows)
+            history.append({"units": n, "half_widths": {name: estimates[name]["half_width"] for name in kpis}})
+            if progress is not None:
+                progress(n, estimates)
+            if not open_kpis or n >= max_units:
+                break
+            # Half-widths shrink like 1/sqrt(n): project the units the slowest KPI still needs,
+            # at most doubling the total per batch and rounding up to keep every worker busy.
+            needed = n
+            for name in open_kpis:
+                stats = estimates[name]
+                limit = targets[name] * abs(stats["mean"]) if relative else targets[name]
+                if limit > 0 and math.isfinite(stats["half_width"]):
+                    needed = max(needed, math.ceil(n * (stats["half_width"] / limit) ** 2))
+                else:
+                    needed = 2 * n
+            batch = min(max(needed - n, 1), n)
+            batch = min(math.ceil(batch / workers) * workers, max_units - n)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for name in kpis:
+        estimates[name]["target"] = targets[name]
+        estimates[name]["reached"] = name not in open_kpis
+    return {
+        "units": n,
+        "runs": n * (2 if antithetic else 1),
+        "converged": not open_kpis,
+        "antithetic": antithetic,
+        "controls": list(controls),
+        "seeds": seeds[:n],
+        "estimates": estimates,
+        "history": history,
+    }
+
+def print_adaptive_report(results, relative=False, confidence=DEFAULT_CONFIDENCE):
+    ci_header = f"{confidence:.0%} CI +/-"
+    print(f"{'KPI':<20} | {'Estimate':>10} | {ci_header:>10} | {'Target':>8} | {'Plain +/-':>10} | {'Var. ratio':>10}")
+    print("-" * 84)
+    for name, stats in results["estimates"].items():
+        target = f"{stats['target']:.0%}" if relative else f"{stats['target']:.2f}"
+        ratio = (stats["plain_half_width"] / stats["half_width"]) ** 2 if stats["half_width"] > 0 else float("nan")
+        print(f"{name:<20} | {stats['mean']:>10.2f} | {stats['half_width']:>10.2f} | {target:>8} | "
+              f"{stats['plain_half_width']:>10.2f} | {ratio:>10.2f}")
+    status = "all targets reached" if results["converged"] else "maximum reached before all targets"
+    unit = "antithetic pairs" if results["antithetic"] else "replications"
+    print(f"\nStopped after {results['units']} {unit} ({results['runs']} runs): {status}.")
+
+def parse_target(text):
+    name, _, value = text.partition("=")
+    if not name or not value:
+        raise argparse.ArgumentTypeError(f"Expected NAME=HALF_WIDTH, got '{text}'")
+    return name, float(value)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run replications until KPI confidence intervals are narrow enough.")
+    parser.add_argument("--target", action="append", type=parse_target, metavar="KPI=HALF_WIDTH",
+                        help=f"Half-width target; repeatable. KPIs: {', '.join(KPI_FUNCTIONS)} or any run summary "
+                             f"metric. Default: {', '.join(f'{k}={v:g}' for k, v in DEFAULT_TARGETS.items())}.")
+    parser.add_argument("--relative", action="store_true", help="Targets are fractions of the estimate (0.05 = 5%%).")
+    parser.add_argument("--antithetic", action="store_true",
+                        help="Run each seed as an antithetic pair (inverse-transform sampling of u and 1 - u).")
+    parser.add_argument("--controls", nargs="*", choices=tuple(CONTROLS), default=(),
+                        help="Control variates to regress out.")
+    parser.add_argument("--initial", type=int, default=DEFAULT_INITIAL_UNITS, help="Units before the first check.")
+    parser.add_argument("--max-units", type=int, default=DEFAULT_MAX_UNITS)
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED, help="Base seed for the replication seed sequence.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--engine", choices=ENGINES, default="simpy")
+    parser.add_argument("--config", metavar="PATH", help="Clinic config file (.json, .toml, .yaml), see config.py.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    scenario = sim.DEFAULT_SCENARIO
+    if args.config:
+        import config
+        scenario = config.load_config(args.config)
+    targets = dict(args.target) if args.target else DEFAULT_TARGETS
+
+    def progress(units, estimates):
+        widths = ", ".join(f"{name} +/-{stats['half_width']:.2f}" for name, stats in estimates.items())
+        print(f"  {units:>5} units: {widths}")
+
+    results = run_adaptive(targets, relative=args.relative, base_seed=args.seed, scenario=scenario,
+                           engine=args.engine, antithetic=args.antithetic, controls=args.controls,
+                           confidence=args.confidence, initial_units=args.initial, max_units=args.max_units,
+                           workers=args.workers, progress=progress)
+    print()
+    print_adaptive_report(results, relative=args.relative, confidence=args.confidence)
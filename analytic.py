@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import functools
+import math
+import time
+
+import numpy as np
+
+import main as sim
+from replications import DEFAULT_CONFIDENCE, ENGINES, run_replications
+from sampling import Exponential, Gamma, Uniform, regularized_gamma_p
+
+# ----------- Configuration -----------
+# Cells whose busiest doctor or X-ray room is offered this much work per on-duty minute
+# are pruned before simulation
+DEFAULT_MAX_LOAD = 1.5
+# Relative step of the central differences behind the analytic control variate
+SENSITIVITY_STEP = 1e-3
+
+# ----------- Moments -----------
+
+@functools.lru_cache(maxsize=None)
+def moments(spec):
+    # First two moments of a distribution spec, floor included: E[max(X, f)^k] is f^k below
+    # the floor plus the partial moment above it, in closed form for gamma and uniform.
+    if isinstance(spec, Exponential):
+        return spec.mean, 2 * spec.mean**2
+    if isinstance(spec, Gamma):
+        a, s, f = spec.shape, spec.scale, spec.floor
+        m1, m2 = a * s, a * (a + 1) * s * s
+        if f is None or f <= 0:
+            return m1, m2
+        x = np.array([f / s])
+        below = float(regularized_gamma_p(a, x)[0])
+        return (f * below + m1 * (1 - float(regularized_gamma_p(a + 1, x)[0])),
+                f * f * below + m2 * (1 - float(regularized_gamma_p(a + 2, x)[0])))
+    if isinstance(spec, Uniform):
+        low, high, f = spec.low, spec.high, spec.floor
+        if f is None or f <= low:
+            return (low + high) / 2, (low * low + low * high + high * high) / 3
+        if f >= high:
+            return f, f * f
+        width = high - low
+        return ((f * (f - low) + (high**2 - f**2) / 2) / width,
+                (f * f * (f - low) + (high**3 - f**3) / 3) / width)
+    raise ValueError(f"No moments for distribution spec {spec!r}")
+
+def scv(m1, m2):
+    # Squared coefficient of variation
+    return m2 / (m1 * m1) - 1 if m1 > 0 else 0.0
+
+# ----------- Queueing Formulas -----------
+
+def erlang_c(servers, offered):
+    # Probability that an arrival waits in M/M/c, offered = arrival rate x mean service time
+    if offered >= servers:
+        return 1.0
+    term = total = 1.0
+    for k in range(1, servers):
+        term *= offered / k
+        total += term
+    last = term * offered / servers / (1 - offered / servers)
+    return last / (total + last)
+
+def priority_waits(rates, m1, m2, ca2, servers, horizon):
+    # Random part of the mean waits of non-preemptive priority classes (highest first) that
+    # share one service time distribution: Cobham's formula, with the M/M/c delay
+    # probability for several servers, scaled by the Allen-Cunneen factor (ca2 + cs2) / 2
+    # and, for arrivals more regular than Poisson, the KLB correction.
+    # Over a stretch of only `horizon` minutes the queue cannot reach that steady state
+    # near or above saturation, so each wait is capped by the mean of a driftless reflected
+    # Brownian motion started empty, with the variance rate of the offered work.
+    total = sum(rates)
+    if total <= 0:
+        return [0.0] * len(rates)
+    cs2 = scv(m1, m2)
+    rho = total * m1 / servers
+    base = erlang_c(servers, total * m1) * m1 / servers * (ca2 + cs2) / 2
+    if ca2 < 1 and 0 < rho < 1:
+        # Kraemer and Langenbach-Belz: smoother than Poisson arrivals wait less than that
+        base *= math.exp(-2 * (1 - rho) * (1 - ca2) ** 2 / (3 * rho * (ca2 + cs2)))
+    variance_rate = total * m1 * m1 * (ca2 + cs2) / servers**2
+    cap = 2 / 3 * math.sqrt(2 * variance_rate * horizon / math.pi)
+    waits = []
+    sigma_before = 0.0
+    for rate in rates:
+        sigma = sigma_before + rate * m1 / servers
+        stationary = base / ((1 - sigma_before) * (1 - sigma)) if sigma < 1 else math.inf
+        waits.append(min(stationary, cap))
+        sigma_before = sigma
+    return waits
+
+def mean_backlog(start, drift, duration):
+    # Time average of the fluid backlog max(start + drift * t, 0) over [0, duration]
+    if drift >= 0 or start + drift * duration >= 0:
+        return start + drift * duration / 2
+    empty_at = start / -drift
+    return start * empty_at / (2 * duration)
+
+def segment_waits(segments, ca2, servers):
+    # Mean wait per priority class over a day cut into segments of constant rates:
+    # (duration, class rates, m1, m2, open) in time order, closed meaning off duty. Work
+    # beyond capacity is carried between segments as a fluid backlog, in minutes of all
+    # servers, that class k sees from the classes up to it; the random part of each open
+    # segment comes on top, and arrivals while closed also wait for the reopening. Service
+    # speed is that of the segment a service starts in, so a carried backlog is rescaled
+    # when m1 changes. Returns the class waits, the time to clear what is left at the end
+    # (fluid backlog and random wait of the lowest class) and the work.
+    classes = len(segments[0][1])
+    backlog = [0.0] * classes
+    waited = [0.0] * classes
+    arrivals = [0.0] * classes
+    work = 0.0
+    speed = None
+    for duration, rates, m1, m2, is_open in segments:
+        if duration <= 0:
+            continue
+        if speed is not None and m1 != speed and speed > 0:
+            work += (m1 / speed - 1) * backlog[-1] * servers
+            backlog = [b * m1 / speed for b in backlog]
+        speed = m1
+        work += duration * sum(rates) * m1
+        random_part = priority_waits(rates, m1, m2, ca2, servers, duration) if is_open else [duration / 2] * classes
+        offered = 0.0
+        for k, rate in enumerate(rates):
+            offered += rate * m1 / servers
+            drift = offered - (1.0 if is_open else 0.0)
+            wait = mean_backlog(backlog[k], drift, duration) + random_part[k]
+            waited[k] += rate * duration * wait
+            arrivals[k] += rate * duration
+            backlog[k] = max(backlog[k] + drift * duration, 0.0)
+    return [w / n if n > 0 else 0.0 for w, n in zip(waited, arrivals)], backlog[-1] + random_part[-1], work
+
+def boundaries(scenario, windows):
+    # Segment edges of the opening hours: lunch end (speed changes), walk-in cutoff and
+    # the given off-duty windows
+    horizon = scenario.sim_time
+    edges = {0.0, float(horizon), float(min(scenario.lunch_end, horizon)), float(min(scenario.walkin_cutoff_time, horizon))}
+    for start, end in windows:
+        edges.update(float(min(max(t, 0.0), horizon)) for t in (start, end))
+    return sorted(edges)
+
+def on_duty(windows, start, end):
+    return not any(s <= start and end <= e for s, e in windows)
+
+# ----------- Clinic Model -----------
+
+def arrival_streams(scenario, doctor_id, walkin_rate=None):
+    # ((rate, ca2) of walk-ins, (rate, ca2) of appointments) for one doctor; rates are per
+    # minute while the stream runs, i.e. until the walk-in cutoff and over the opening hours.
+    # Appointment gaps are the slot intervals plus the difference of two independent
+    # punctuality deviations.
+    config = scenario.doctor_config(doctor_id)
+    horizon = scenario.sim_time
+    walkins = appointments = (0.0, 1.0)
+    if doctor_id != scenario.appointment_only_doctor_id:
+        m1, m2 = moments(config["arrival"])
+        walkins = (walkin_rate if walkin_rate is not None else 1 / m1, scv(m1, m2))
+    if doctor_id != scenario.walkin_only_doctor_id:
+        jitter = 2 * (scenario.punctuality_max - scenario.punctuality_min) ** 2 / 12
+        template = scenario.appointment_template
+        if template is not None:
+            gaps = np.diff([0.0] + list(template.slot_times(scenario, doctor_id)))
+            if len(gaps):
+                mean_gap = float(gaps.mean())
+                appointments = (len(gaps) / horizon, (float(gaps.var()) + jitter) / max(mean_gap, 1e-9) ** 2)
+        else:
+            m1, m2 = moments(config["appointment_interval"])
+            appointments = (1 / m1, (m2 - m1 * m1 + jitter) / (m1 * m1))
+    return walkins, appointments
+
+def analyze(scenario=sim.DEFAULT_SCENARIO, walkin_rates=None, xray_probabilities=None):
+    # Approximate behaviour of the clinic day, per doctor and for the X-ray rooms. Doctors
+    # are single servers with two priority classes (appointments before walk-ins), each
+    # patient visiting once or, when referred to X-ray, twice. The X-ray rooms are one M/G/c
+    # queue, or c single-server queues under round-robin dispatch, fed by the referrals of
+    # the doctors on duty. The day is cut into segments at breaks, lunch end and the walk-in
+    # cutoff (see segment_waits). walkin_rates and xray_probabilities override the configured
+    # values per doctor (sensitivities).
+    horizon = scenario.sim_time
+    lunch_end = min(scenario.lunch_end, horizon)
+    cutoff = min(scenario.walkin_cutoff_time, horizon)
+    speedup = scenario.afternoon_speedup_factor
+    doctors = []
+    referrers = []
+    drains = []
+    all_windows = []
+    xray_counts = [0.0, 0.0]
+    xray_ca2 = 0.0
+    for i in range(scenario.num_doctors):
+        config = scenario.doctor_config(i)
+        p = xray_probabilities[i] if xray_probabilities is not None else config["xray_probability"]
+        walkins, appointments = arrival_streams(scenario, i, walkin_rates[i] if walkin_rates is not None else None)
+        a1, a2 = moments(config["type_a_first_exam"])
+        b1, b2 = moments(config["type_b_first_exam"])
+        s1, s2 = moments(config["type_a_second_exam"])
+        # One visit of a random patient: a first exam of type A or B, or a second exam.
+        m1 = (p * a1 + (1 - p) * b1 + p * s1) / (1 + p)
+        m2 = (p * a2 + (1 - p) * b2 + p * s2) / (1 + p)
+        windows = scenario.break_windows(i)
+        edges = boundaries(scenario, windows)
+        segments = []
+        on_duty_minutes = walkin_minutes = 0.0
+        for start, end in zip(edges, edges[1:]):
+            factor = speedup if start >= lunch_end else 1.0
+            rates = [appointments[0] * (1 + p), walkins[0] * (1 + p) if start < cutoff else 0.0]
+            is_open = on_duty(windows, start, end)
+            segments.append((end - start, rates, m1 * factor, m2 * factor**2, is_open))
+            if is_open:
+                on_duty_minutes += end - start
+                walkin_minutes += end - start if start < cutoff else 0.0
+        counts = [appointments[0] * horizon, walkins[0] * cutoff]
+        total = sum(counts)
+        ca2 = (counts[0] * appointments[1] + counts[1] * walkins[1]) / total if total > 0 else 1.0
+        class_waits, backlog, work = segment_waits(segments, ca2, 1)
+        doctors.append({
+            "visits": total * (1 + p),
+            "work": work,
+            "load": work / on_duty_minutes if on_duty_minutes > 0 else math.inf,
+            "appointment_wait": class_waits[0],
+            "walkin_wait": class_waits[1],
+            "mean_wait": (counts[0] * class_waits[0] + counts[1] * class_waits[1]) / total if total > 0 else 0.0,
+            "backlog": backlog,
+        })
+        # Patients who arrive during a break are referred once it ends, so a doctor's
+        # referrals are spread over the on-duty time: scaled rates while on duty, none off it.
+        scales = (horizon / on_duty_minutes if on_duty_minutes > 0 else 0.0,
+                  cutoff / walkin_minutes if walkin_minutes > 0 else 0.0)
+        referrers.append((p, appointments[0], walkins[0], scales, windows))
+        drains.append((p, s1 * speedup))
+        all_windows.extend(windows)
+        # Referrals thin each stream: scv p * ca2 + 1 - p (QNA), superposed by count.
+        for k, (count, stream_ca2) in enumerate(zip(counts, (appointments[1], walkins[1]))):
+            xray_counts[k] += count * p
+            xray_ca2 += count * p * (p * stream_ca2 + 1 - p)
+
+    rooms = scenario.num_xray_rooms
+    patients = sum(xray_counts)
+    xray_ca2 = xray_ca2 / patients if patients > 0 else 1.0
+    slowdown = sim.XRAY_MORNING_SLOWDOWN
+    x1, x2 = moments(scenario.xray_service_spec())
+    # Round-robin sends every c-th patient to each room: c single servers with an
+    # Erlang-like split of the stream, instead of one shared line.
+    round_robin = scenario.xray_dispatch == "round_robin"
+    split = rooms if round_robin else 1
+    edges = boundaries(scenario, all_windows)
+    segments = []
+    for start, end in zip(edges, edges[1:]):
+        rates = [0.0, 0.0]
+        for p, appointment_rate, walkin_rate, scales, windows in referrers:
+            if on_duty(windows, start, end):
+                rates[0] += p * appointment_rate * scales[0] / split
+                rates[1] += p * walkin_rate * scales[1] / split if start < cutoff else 0.0
+        factor = slowdown if start < lunch_end else 1.0
+        segments.append((end - start, rates, x1 * factor, x2 * factor**2, True))
+    class_waits, xray_backlog, work = segment_waits(segments, xray_ca2 / split, 1 if round_robin else rooms)
+    work *= split
+    xray = {
+        "patients": patients,
+        "work": work,
+        "load": work / (rooms * horizon),
+        "appointment_wait": class_waits[0],
+        "walkin_wait": class_waits[1],
+        "mean_wait": (xray_counts[0] * class_waits[0] + xray_counts[1] * class_waits[1]) / patients if patients > 0 else 0.0,
+        "backlog": xray_backlog,
+    }
+    # The day ends once the longest line left at closing is cleared; utilization
+    # is busy time over that whole day, as in the simulation's run summary.
+    # A doctor's last patient may still need an X-ray and a second exam after that.
+    overtime = max([doctor["backlog"] + p * (x1 + s1) for doctor, (p, s1) in zip(doctors, drains)]
+                   + [xray_backlog])
+    for doctor in doctors:
+        doctor["utilization"] = doctor["work"] / (horizon + overtime)
+    xray["utilization"] = work / rooms / (horizon + overtime)
+    return {"doctors": doctors, "xray": xray, "overtime": overtime}
+
+def analytic_summary(scenario=sim.DEFAULT_SCENARIO, result=None):
+    # Flat metrics named like the simulation's run summary, plus the busiest resource's load
+    # and the mean wait over all doctor and X-ray visits.
+    result = result if result is not None else analyze(scenario)
+    summary = {}
+    for i, doctor in enumerate(result["doctors"]):
+        summary[f"dr{i+1}_mean_wait"] = doctor["mean_wait"]
+        summary[f"dr{i+1}_utilization"] = doctor["utilization"]
+    xray = result["xray"]
+    for r in range(scenario.num_xray_rooms):
+        summary[f"xray{r+1}_mean_wait"] = xray["mean_wait"]
+        summary[f"xray{r+1}_utilization"] = xray["utilization"]
+    summary["overtime"] = result["overtime"]
+    summary["max_load"] = max([doctor["load"] for doctor in result["doctors"]] + [xray["load"]])
+    summary["mean_wait"] = overall_wait(result)
+    return summary
+
+def overall_wait(result):
+    visits = [doctor["visits"] for doctor in result["doctors"]] + [result["xray"]["patients"]]
+    waits = [doctor["mean_wait"] for doctor in result["doctors"]] + [result["xray"]["mean_wait"]]
+    total = sum(visits)
+    return sum(v * w for v, w in zip(visits, waits)) / total if total > 0 else 0.0
+
+# ----------- Screening -----------
+
+def screen(design, base_scenario=sim.DEFAULT_SCENARIO):
+    # Analytic summary of every cell of a sweep design (see sweep.py)
+    return [analytic_summary(base_scenario.replace(**cell)) for cell in design]
+
+def prune_design(design, base_scenario=sim.DEFAULT_SCENARIO, max_load=DEFAULT_MAX_LOAD):
+    # Splits a design into the cells worth simulating and those whose busiest doctor or X-ray
+    # room would be overloaded (offered load at or above max_load).
+    kept, pruned = [], []
+    for cell, summary in zip(design, screen(design, base_scenario)):
+        (kept if summary["max_load"] < max_load else pruned).append(cell)
+    return kept, pruned
+
+# ----------- Control Variate -----------
+# The analytic model's first-order prediction of how much a run's mean wait differs from
+# that of an average day, given the run's realized walk-ins and X-ray referrals per doctor.
+# It is linear in deviations whose expectation is exactly zero (walk-in counts of a Poisson
+# process, referrals given the arrivals), so it has mean zero whatever the approximation
+# error, and it can be used in adaptive.py like the other controls.
+
+@functools.lru_cache(maxsize=32)
+def wait_sensitivities(scenario):
+    rates = []
+    for i in range(scenario.num_doctors):
+        arrival = scenario.doctor_config(i)["arrival"]
+        if not isinstance(arrival, Exponential):
+            raise ValueError(f"The analytic control needs exponential interarrival times; Dr {i+1} has {arrival}")
+        rates.append(1 / arrival.mean)
+    probabilities = [scenario.doctor_config(i)["xray_probability"] for i in range(scenario.num_doctors)]
+    rate_gradient, probability_gradient = [], []
+    for values, gradient, key in ((rates, rate_gradient, "walkin_rates"),
+                                  (probabilities, probability_gradient, "xray_probabilities")):
+        for i, value in enumerate(values):
+            step = SENSITIVITY_STEP * value
+            up, down = list(values), list(values)
+            up[i], down[i] = value + step, value - step
+            gradient.append((overall_wait(analyze(scenario, **{key: up}))
+                             - overall_wait(analyze(scenario, **{key: down}))) / (2 * step))
+    return tuple(rates), tuple(rate_gradient), tuple(probability_gradient)
+
+def wait_control(model):
+    scenario = model.scenario
+    rates, rate_gradient, probability_gradient = wait_sensitivities(scenario)
+    records = model.patient_records.to_array()
+    control = 0.0
+    for i in range(scenario.num_doctors):
+        mine = records["doctor_id"] == i
+        arrivals = int(mine.sum())
+        if i != scenario.appointment_only_doctor_id:
+            walkins = int((mine & ~records["is_appointment"]).sum())
+            expected = rates[i] * scenario.walkin_cutoff_time
+            control += rate_gradient[i] * (walkins - expected) / scenario.walkin_cutoff_time
+        if arrivals:
+            referrals = int((mine & records["needs_xray"]).sum())
+            p = scenario.doctor_config(i)["xray_probability"]
+            control += probability_gradient[i] * (referrals - p * arrivals) / arrivals
+    return control
+
+# ----------- Error Against Simulation -----------
+
+def compare_with_simulation(scenario=sim.DEFAULT_SCENARIO, num_replications=20, base_seed=sim.RANDOM_SEED,
+                            workers=None, engine="simpy", confidence=DEFAULT_CONFIDENCE):
+    # Analytic metrics next to the replication means of the same metrics.
+    started = time.perf_counter()
+    approximation = analytic_summary(scenario)
+    analytic_seconds = time.perf_counter() - started
+    results = run_replications(num_replications, base_seed, workers, confidence=confidence, scenario=scenario,
+                               engine=engine)
+    rows = []
+    for metric, value in approximation.items():
+        if metric not in results["summary"]:
+            continue
+        simulated = results["summary"][metric]
+        error = value - simulated["mean"]
+        rows.append({"metric": metric, "analytic": value, "simulated": simulated["mean"],
+                     "ci_low": simulated["ci_low"], "ci_high": simulated["ci_high"], "error": error,
+                     "relative_error": error / simulated["mean"] if simulated["mean"] else float("nan")})
+    return {"rows": rows, "replications": num_replications, "analytic_seconds": analytic_seconds}
+
+def print_comparison(comparison):
+    print(f"{'Metric':<20} | {'Analytic':>9} | {'Simulated':>9} | {'CI':>17} | {'Error':>8} | {'Rel.':>7}")
+    print("-" * 86)
+    for row in comparison["rows"]:
+        ci = f"[{row['ci_low']:.2f}, {row['ci_high']:.2f}]"
+        print(f"{row['metric']:<20} | {row['analytic']:>9.2f} | {row['simulated']:>9.2f} | {ci:>17} | "
+              f"{row['error']:>+8.2f} | {row['relative_error']:>+7.0%}")
+    for kind in ("mean_wait", "utilization"):
+        errors = [abs(row["relative_error"]) for row in comparison["rows"]
+                  if row["metric"].endswith(kind) and math.isfinite(row["relative_error"])]
+        if errors:
+            print(f"Mean absolute relative error, {kind}: {np.mean(errors):.0%}")
+    print(f"Analytic estimate: {comparison['analytic_seconds'] * 1e6:.0f} us; "
+          f"simulation: {comparison['replications']} replications.")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analytic queueing approximation of the clinic, for screening.")
+    parser.add_argument("--compare", type=int, default=0, metavar="N",
+                        help="Also run N replications and report the approximation error.")
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", choices=ENGINES, default="simpy")
+    parser.add_argument("--config", metavar="PATH", help="Clinic config file (.json, .toml, .yaml), see config.py.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    scenario = sim.DEFAULT_SCENARIO
+    if args.config:
+        import config
+        scenario = config.load_config(args.config)
+    result = analyze(scenario)
+    print(f"{'Resource':<10} | {'Load':>6} | {'Util.':>6} | {'Appt wait':>9} | {'WI wait':>9} | {'Mean wait':>9}")
+    print("-" * 66)
+    for i, doctor in enumerate(result["doctors"]):
+        print(f"{'Dr ' + str(i + 1):<10} | {doctor['load']:>6.2f} | {doctor['utilization']:>6.2f} | "
+              f"{doctor['appointment_wait']:>9.1f} | {doctor['walkin_wait']:>9.1f} | {doctor['mean_wait']:>9.1f}")
+    xray = result["xray"]
+    print(f"{'X-ray':<10} | {xray['load']:>6.2f} | {xray['utilization']:>6.2f} | "
+          f"{xray['appointment_wait']:>9.1f} | {xray['walkin_wait']:>9.1f} | {xray['mean_wait']:>9.1f}")
+    print(f"Overtime: {result['overtime']:.1f} min")
+    if args.compare:
+        print()
+        print_comparison(compare_with_simulation(scenario, args.compare, args.seed, args.workers, args.engine))
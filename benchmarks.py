@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+# ----------- Configuration -----------
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_BATCH_REPLICATIONS = 1000
+STARTUP_REPEATS = 5
+
+# name -> scenario overrides, replications per measurement (None: one model run), repeats
+BENCHMARKS = {
+    "standard_day": {"scenario": {}, "replications": None, "repeats": 5},
+    "heavy_load_day": {"scenario": {"arrival_rate_factor": 2.0}, "replications": None, "repeats": 3},
+    "department_30x6": {"scenario": {"num_doctors": 30, "num_xray_rooms": 6}, "replications": None, "repeats": 3},
+    "replications_1000": {"scenario": {}, "replications": DEFAULT_BATCH_REPLICATIONS, "repeats": 1},
+}
+
+# Measured per benchmark; a rise of these beyond the threshold is a regression
+REGRESSION_METRICS = ("median_seconds", "peak_rss_mb")
+
+# ----------- Measurement -----------
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS; worker processes count via RUSAGE_CHILDREN.
+    scale = 1 / 2**20 if sys.platform == "darwin" else 1 / 2**10
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+def run_benchmark(name, engine="simpy", workers=None, replications=None, seed=None):
+    # Runs in a fresh interpreter (see measure_benchmark), so import time and peak RSS
+    # belong to this benchmark alone.
+    import_start = time.perf_counter()
+    import main as sim
+    import replications as reps
+    import_seconds = time.perf_counter() - import_start
+
+    spec = BENCHMARKS[name]
+    scenario = sim.DEFAULT_SCENARIO.replace(**spec["scenario"])
+    seed = sim.RANDOM_SEED if seed is None else seed
+    num_replications = replications or spec["replications"]
+    timings = []
+    for _ in range(spec["repeats"]):
+        start = time.perf_counter()
+        if num_replications is None:
+            model = reps.build_model(seed, scenario, engine).run()
+            summaries = [{**model.collect_run_summary(), "events_processed": model.events_processed}]
+        else:
+            summaries = reps.run_replications(num_replications, base_seed=seed, workers=workers,
+                                              scenario=scenario, engine=engine)["replications"]
+        timings.append(time.perf_counter() - start)
+
+    median_seconds = statistics.median(timings)
+    # Events processed by the engine's own loop: SimPy events, or calendar entries and
+    # arrivals in the fast engine, so throughput compares runs of the same engine only.
+    events = sum(s["events_processed"] for s in summaries)
+    patients = sum(s["patients_generated"] for s in summaries)
+    return {
+        "median_seconds": median_seconds,
+        "min_seconds": min(timings),
+        "repeats": len(timings),
+        "replications": num_replications or 1,
+        "events": events,
+        "patients": patients,
+        "events_per_second": events / median_seconds,
+        "patients_per_second": patients / median_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        "import_seconds": import_seconds,
+    }
+
+def measure_benchmark(name, engine="simpy", workers=None, replications=None):
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, "--engine", engine]
+    if workers is not None:
+        command += ["--workers", str(workers)]
+    if replications is not None:
+        command += ["--replications", str(replications)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_startup(repeats=STARTUP_REPEATS):
+    # Wall time of a fresh interpreter that imports the model, median over repeats.
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        timings.append(time.perf_counter() - start)
+    return {"median_seconds": statistics.median(timings), "repeats": repeats}
+
+def environment_info():
+    import numpy
+    import simpy
+    import main as sim
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "simpy": simpy.__version__,
+        "model_version": sim.MODEL_VERSION,
+    }
+
+def run_suite(names=None, engine="simpy", workers=None, replications=None):
+    names = list(BENCHMARKS) if not names else names
+    results = {"environment": environment_info(), "engine": engine, "startup": measure_startup(), "benchmarks": {}}
+    for name in names:
+        results["benchmarks"][name] = measure_benchmark(
+            name, engine, workers, replications if BENCHMARKS[name]["replications"] else None)
+    return results
+
+# ----------- Baselines -----------
+
+def save_baseline(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load_baseline(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def compare_to_baseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # Relative change per benchmark and metric; a rise beyond threshold is a regression.
+    rows = []
+    pairs = [("startup", "median_seconds", results["startup"], baseline.get("startup"))]
+    for name, current in results["benchmarks"].items():
+        for metric in REGRESSION_METRICS:
+            pairs.append((name, metric, current, baseline.get("benchmarks", {}).get(name)))
+    for name, metric, current, reference in pairs:
+        if not reference or not reference.get(metric):
+            continue
+        change = current[metric] / reference[metric] - 1.0
+        rows.append({"benchmark": name, "metric": metric, "baseline": reference[metric], "current": current[metric],
+                     "change": change, "regression": change > threshold})
+    return rows
+
+# ----------- Reporting -----------
+
+def print_results(results):
+    print(f"Engine: {results['engine']}, startup (import main): {results['startup']['median_seconds'] * 1000:.0f} ms")
+    print(f"{'Benchmark':<20} | {'Median (s)':>10} | {'Events/s':>10} | {'Patients/s':>10} | {'Peak RSS (MB)':>13} | {'Import (s)':>10}")
+    print("-" * 90)
+    for name, r in results["benchmarks"].items():
+        print(f"{name:<20} | {r['median_seconds']:>10.3f} | {r['events_per_second']:>10.0f} | {r['patients_per_second']:>10.0f} | "
+              f"{r['peak_rss_mb']:>13.1f} | {r['import_seconds']:>10.3f}")
+
+def print_comparison(rows, threshold):
+    print(f"\n--- Comparison with baseline (regression threshold: +{threshold:.0%}) ---")
+    print(f"{'Benchmark':<20} | {'Metric':<15} | {'Baseline':>10} | {'Current':>10} | {'Change':>8} |")
+    print("-" * 80)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['benchmark']:<20} | {row['metric']:<15} | {row['baseline']:>10.3f} | {row['current']:>10.3f} | "
+              f"{row['change']:>+8.1%} | {flag}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation engines and check for performance regressions.")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="Run only these benchmarks (repeatable).")
+    parser.add_argument("--engine", choices=("simpy", "fast"), default="simpy")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for the replication batch.")
+    parser.add_argument("--replications", type=int, default=None,
+                        help=f"Size of the replication batch (default: {DEFAULT_BATCH_REPLICATIONS}).")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a JSON baseline.")
+    parser.add_argument("--compare", metavar="PATH", help="Compare with a saved baseline; exit 1 on regression.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--child", choices=BENCHMARKS, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        print(json.dumps(run_benchmark(args.child, args.engine, args.workers, args.replications)))
+        sys.exit(0)
+    results = run_suite(args.only, args.engine, args.workers, args.replications)
+    print_results(results)
+    if args.save:
+        save_baseline(results, args.save)
+        print(f"\nSaved baseline: {args.save}")
+    if args.compare:
+        baseline = load_baseline(args.compare)
+        if baseline.get("engine") != results["engine"] or baseline.get("environment") != results["environment"]:
+            print("\nWARNING: baseline was recorded with a different engine or environment.")
+        rows = compare_to_baseline(results, baseline, args.threshold)
+        print_comparison(rows, args.threshold)
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+
+import main as sim
+
+# ----------- Configuration -----------
+DEFAULT_CACHE_DIR = ".sim_cache"
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# ----------- Keys -----------
+
+def _spec_to_dict(spec):
+    if dataclasses.is_dataclass(spec):
+        return {"family": type(spec).__name__, **dataclasses.asdict(spec)}
+    return spec
+
+def scenario_fingerprint(scenario):
+    # Everything that can change a replication's outcome: the scenario fields, the resolved
+    # distribution parameters of every doctor and of the X-ray service, and the model version.
+    doctors = [{name: _spec_to_dict(value) for name, value in sorted(scenario.doctor_config(i).items())}
+               for i in range(scenario.num_doctors)]
+    return {
+        "model_version": sim.MODEL_VERSION,
+        # Config-file profiles are covered by the resolved doctors and X-ray service below
+        "scenario": {**dataclasses.asdict(scenario),
+                     "appointment_template": _spec_to_dict(scenario.appointment_template),
+                     "doctor_profiles": None, "xray_service_time": None},
+        "doctors": doctors,
+        "xray_service": _spec_to_dict(scenario.xray_service_spec()),
+    }
+
+def cache_key(scenario, seed, engine="simpy"):
+    key = {"config": scenario_fingerprint(scenario), "seed": seed}
+    if engine != "simpy":
+        key["engine"] = engine
+    payload = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# ----------- Cache -----------
+
+class ResultCache:
+    # On-disk cache of per-replication summaries (and optional event traces), one JSON file per
+    # key. File modification times double as LRU recency: hits touch the file, and the least
+    # recently used entries are evicted once the directory exceeds max_bytes.
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = None
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def get(self, scenario, seed, with_trace=False, engine="simpy"):
+        key = cache_key(scenario, seed, engine)
+        summary_path = self._path(key, ".json")
+        if with_trace and not os.path.exists(self._path(key, ".npy")):
+            return None
+        try:
+            with open(summary_path) as f:
+                summary = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        os.utime(summary_path)
+        return summary
+
+    def trace_path(self, scenario, seed, engine="simpy"):
+        path = self._path(cache_key(scenario, seed, engine), ".npy")
+        return path if os.path.exists(path) else None
+
+    def put(self, scenario, seed, summary, trace_path=None, engine="simpy"):
+        key = cache_key(scenario, seed, engine)
+        summary_path = self._path(key, ".json")
+        os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+        cached_trace = self._path(key, ".npy")
+        # Files being overwritten no longer count towards the directory size
+        replaced = [summary_path] + ([cached_trace] if trace_path is not None else [])
+        added = -sum(os.path.getsize(path) for path in replaced if os.path.exists(path))
+        added += self._atomic_write(summary_path, json.dumps(summary).encode("utf-8"))
+        if trace_path is not None:
+            tmp_path = cached_trace + f".tmp{os.getpid()}"
+            shutil.copyfile(trace_path, tmp_path)
+            os.replace(tmp_path, cached_trace)
+            added += os.path.getsize(cached_trace)
+        if self._total_bytes is not None:
+            self._total_bytes += added
+        if self.size_bytes() > self.max_bytes:
+            self.evict()
+
+    def _atomic_write(self, path, data):
+        tmp_path = path + f".tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat
+
+    def size_bytes(self):
+        if self._total_bytes is None:
+            self._total_bytes = sum(stat.st_size for _, stat in self._entries())
+        return self._total_bytes
+
+    def evict(self):
+        # Drop whole entries (summary plus trace), least recently used first.
+        entries = {}
+        for path, stat in self._entries():
+            key = os.path.basename(path).split(".")[0]
+            size, recency = entries.get(key, (0, 0.0))
+            if path.endswith(".json"):
+                recency = stat.st_mtime
+            entries[key] = (size + stat.st_size, recency)
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            for suffix in (".json", ".npy"):
+                try:
+                    os.remove(self._path(key, suffix))
+                except FileNotFoundError:
+                    pass
+            total -= size
+        self._total_bytes = total
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self._total_bytes = 0
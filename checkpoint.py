@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import functools
+import math
+import multiprocessing
+import os
+import statistics
+
+import numpy as np
+
+import main as sim
+from queue_tracking import BreakRequest
+from replications import DEFAULT_CONFIDENCE, aggregate_summaries, spawn_seeds, t_critical
+
+# ----------- Configuration -----------
+BASELINE = "baseline"
+REPORT_METRICS = ("mean_time_in_system", "overtime", "xray_mean_wait", "departures")
+
+# ----------- Checkpoints -----------
+# A checkpoint is a ClinicModel paused at a sim time in this process. SimPy processes are
+# generators, which cannot be pickled or copied, so the state is not serialized: every branch
+# runs in a child forked from this process, which inherits the whole paused model copy-on-write
+# (queues, patients in service and their pending service ends, generator positions, random
+# stream states, breaks in progress) and continues it. The parent's copy never advances, so
+# one morning prefix serves any number of branches. Needs the fork start method (POSIX).
+
+class Checkpoint:
+
+    def __init__(self, seed=sim.RANDOM_SEED, at=sim.LUNCH_END, scenario=sim.DEFAULT_SCENARIO):
+        if not 0 < at < scenario.sim_time:
+            raise ValueError(f"Checkpoint time {at} must lie within the opening hours (0-{scenario.sim_time})")
+        self.seed = seed
+        self.at = at
+        self.model = sim.ClinicModel(seed=seed, scenario=scenario).start()
+        # Events at exactly `at` are left for the continuation, so an unchanged branch
+        # reproduces the uninterrupted run.
+        self.model.env.run(until=at)
+
+    def state(self):
+        # What the clinic looks like at the checkpoint; events due at exactly that time
+        # (e.g. the end of a break) have not happened yet.
+        model = self.model
+
+        def resource_state(resource):
+            return {"waiting": resource.waiting(), "serving": resource.serving(),
+                    "on_break": any(isinstance(request, BreakRequest) for request in resource.users)}
+
+        return {
+            "time": model.env.now,
+            "patients_generated": model.total_patients_generated,
+            "patients_in_system": model.patients_currently_in_system,
+            "departures": model.appointment_departure_count + model.walk_in_departure_count,
+            "doctors": [resource_state(doctor) for doctor in model.doctors],
+            "xray_rooms": [resource_state(room) for room in model.xray_resources],
+        }
+
+# ----------- What-if Changes -----------
+# A change is a picklable callable applied to the paused model in the branch's process.
+# Scenario fields only affect what reads them after the checkpoint: the afternoon speed-up
+# applies to every exam starting later, patients already in the clinic included; the opening
+# hours and cutoffs of running generators are already fixed.
+
+def add_xray_rooms(model, count=1):
+    for _ in range(count):
+        model.add_xray_room()
+
+def update_scenario(model, **changes):
+    model.scenario = model.scenario.replace(**changes)
+
+def combine(*changes):
+    return functools.partial(_apply_all, changes)
+
+def _apply_all(changes, model):
+    for change in changes:
+        change(model)
+
+# ----------- Branches -----------
+
+# Checkpoint inherited by forked branch workers
+_active_checkpoint = None
+
+def _run_branch(change):
+    # Runs in a freshly forked worker (one task per worker), on its own copy of the model.
+    model = _active_checkpoint.model
+    if change is not None:
+        change(model)
+    model.env.run(until=model.stop_event)
+    summary = model.collect_run_summary()
+    summary["seed"] = _active_checkpoint.seed
+    summary["xray_mean_wait"] = xray_mean_wait(model)
+    return summary
+
+def xray_mean_wait(model):
+    waits = [w for room_waits in model.xray_room_wait_times.values() for w in room_waits]
+    return float(np.mean(waits)) if waits else float("nan")
+
+def run_branches(checkpoint, branches, workers=None):
+    # branches: {name: change or None}. Each branch continues the checkpoint in its own
+    # forked process; the random streams continue too, so branches are compared on common
+    # random numbers. Returns {name: run summary}.
+    global _active_checkpoint
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError as exc:
+        raise RuntimeError("Branching from a checkpoint needs the 'fork' start method (Linux/macOS).") from exc
+    workers = min(workers or os.cpu_count() or 1, len(branches))
+    _active_checkpoint = checkpoint
+    try:
+        # maxtasksperchild=1: every branch gets a fresh fork of the untouched checkpoint.
+        with context.Pool(workers, maxtasksperchild=1) as pool:
+            summaries = pool.map(_run_branch, list(branches.values()), chunksize=1)
+        return dict(zip(branches, summaries))
+    finally:
+        _active_checkpoint = None
+
+def run_what_if(branches, at, num_replications=1, base_seed=sim.RANDOM_SEED, scenario=sim.DEFAULT_SCENARIO,
+                workers=None, confidence=DEFAULT_CONFIDENCE):
+    # Every replication simulates its morning once, up to `at`, and runs all branches from
+    # there. Branch summaries are aggregated like replications.py, and each branch's effect
+    # on REPORT_METRICS is estimated as the paired difference to the first branch.
+    results = {name: [] for name in branches}
+    for seed in spawn_seeds(base_seed, num_replications):
+        for name, summary in run_branches(Checkpoint(seed, at, scenario), branches, workers).items():
+            results[name].append(summary)
+    reference = next(iter(branches))
+    effects = {}
+    for name, summaries in results.items():
+        if name == reference:
+            continue
+        effects[name] = {}
+        for metric in REPORT_METRICS:
+            diffs = [s[metric] - r[metric] for s, r in zip(summaries, results[reference])]
+            diffs = [d for d in diffs if not math.isnan(d)]
+            half_width = (t_critical(confidence, len(diffs) - 1) * statistics.stdev(diffs) / math.sqrt(len(diffs))
+                          if len(diffs) > 1 else float("nan"))
+            effects[name][metric] = {"mean": statistics.fmean(diffs) if diffs else float("nan"),
+                                     "half_width": half_width}
+    return {
+        "at": at,
+        "reference": reference,
+        "replications": results,
+        "summary": {name: aggregate_summaries(summaries, confidence) for name, summaries in results.items()},
+        "effects": effects,
+    }
+
+def print_what_if(results):
+    print(f"Branches from t={results['at']:g} min, {len(next(iter(results['replications'].values())))} replication(s)")
+    header = " | ".join(f"{metric:>26}" for metric in REPORT_METRICS)
+    print(f"{'Branch':<20} | {header}")
+    print("-" * (23 + 29 * len(REPORT_METRICS)))
+    for name, summary in results["summary"].items():
+        cells = []
+        for metric in REPORT_METRICS:
+            if name in results["effects"]:
+                effect = results["effects"][name][metric]
+                cells.append(f"{summary[metric]['mean']:>9.2f} ({effect['mean']:+.2f}"
+                             + (f"+/-{effect['half_width']:.2f})" if not math.isnan(effect["half_width"]) else ")"))
+            else:
+                cells.append(f"{summary[metric]['mean']:>9.2f}")
+        print(f"{name:<20} | " + " | ".join(f"{cell:>26}" for cell in cells))
+    print(f"\nDifferences in brackets are paired against '{results['reference']}' (same seeds and morning).")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-simulate what-if branches from a checkpointed mid-day state.")
+    parser.add_argument("--at", type=float, default=sim.LUNCH_END, help="Checkpoint time in minutes (default: lunch end).")
+    parser.add_argument("--add-xray-rooms", type=int, nargs="*", default=[1],
+                        help="One branch per value that opens this many extra X-ray rooms at the checkpoint.")
+    parser.add_argument("--afternoon-speedup", type=float, nargs="*", default=[],
+                        help="One branch per afternoon speed-up factor applied from the checkpoint on.")
+    parser.add_argument("-n", "--replications", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED)
+    parser.add_argument("--workers", type=int, default=None, help="Parallel branches (default: all cores).")
+    parser.add_argument("--config", metavar="PATH", help="Clinic config file (.json, .toml, .yaml), see config.py.")
+    parser.add_argument("--state", action="store_true", help="Print the clinic state at the checkpoint (first seed).")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    scenario = sim.DEFAULT_SCENARIO
+    if args.config:
+        import config
+        scenario = config.load_config(args.config)
+    branches = {BASELINE: None}
+    for count in args.add_xray_rooms:
+        branches[f"+{count} X-ray room{'s' if count != 1 else ''}"] = functools.partial(add_xray_rooms, count=count)
+    for factor in args.afternoon_speedup:
+        branches[f"speed-up x{factor:g}"] = functools.partial(update_scenario, afternoon_speedup_factor=factor)
+    if args.state:
+        state = Checkpoint(spawn_seeds(args.seed, 1)[0], args.at, scenario).state()
+        print(f"State at t={state['time']:g}: {state['patients_in_system']} patients in the clinic, "
+              f"{state['departures']} departed")
+        for kind in ("doctors", "xray_rooms"):
+            for i, resource in enumerate(state[kind]):
+                status = "on break" if resource["on_break"] else ("busy" if resource["serving"] else "idle")
+                print(f"  {kind[:-1].replace('_', ' ')} {i+1}: {status}, {resource['waiting']} waiting")
+        print()
+    print_what_if(run_what_if(branches, args.at, args.replications, args.seed, scenario, args.workers))
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import hashlib
+import json
+import os
+from dataclasses import fields
+
+import main as sim
+from cache import scenario_fingerprint
+from sampling import Exponential, Gamma, Uniform
+
+# ----------- Configuration -----------
+DISTRIBUTION_FAMILIES = {"exponential": Exponential, "gamma": Gamma, "uniform": Uniform}
+DOCTOR_DISTRIBUTIONS = ("arrival", "type_a_first_exam", "type_b_first_exam", "type_a_second_exam",
+                        "appointment_interval")
+DOCTOR_ROLES = ("any", "appointment_only", "walkin_only")
+
+# Scenario fields settable in the "clinic" section; doctors, roles and X-ray rooms have their own sections
+CLINIC_FIELDS = ("sim_time", "walkin_cutoff_time", "lunch_start", "lunch_end", "afternoon_speedup_factor",
+                 "punctuality_min", "punctuality_max", "max_drain_time", "arrival_rate_factor")
+
+# ----------- Config Files -----------
+# A config file describes the whole clinic declaratively:
+#
+#   clinic:  opening hours, lunch window and the other CLINIC_FIELDS
+#   xray:    rooms, dispatch policy and service_time distribution
+#   doctors: one entry per doctor with a role, the DOCTOR_DISTRIBUTIONS and xray_probability,
+#            and optionally breaks, a list of [start, end] off-duty windows in minutes that
+#            replaces the clinic's lunch window for that doctor (e.g. staggered lunches or a
+#            late start as [0, 60])
+#
+# A distribution is {"family": "gamma", "shape": 2, "scale": 1, "floor": 0.5}; floor (optional)
+# is the minimum value a draw can take. Files are validated once and compiled into a Scenario
+# of frozen distribution specs, which pickles cheaply to worker processes and hashes to the
+# same result-cache key as an equivalent scenario built in code.
+
+def read_config_file(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    if extension == ".toml":
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as exc:
+            raise ImportError("Reading YAML config files requires PyYAML (pip install pyyaml).") from exc
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f)
+    raise ValueError(f"Unsupported config file type '{extension}'. Use .json, .toml, .yaml or .yml")
+
+def _check_keys(section, allowed, where):
+    if not isinstance(section, dict):
+        raise ValueError(f"{where} must be a table of settings")
+    unknown = sorted(set(section) - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown setting(s) {', '.join(unknown)} in {where}. Choose from: {', '.join(allowed)}")
+
+def _number(value, where, minimum=None, positive=False):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{where} must be a number, got {value!r}")
+    if positive and value <= 0:
+        raise ValueError(f"{where} must be positive, got {value}")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{where} must be at least {minimum}, got {value}")
+    return value
+
+def compile_distribution(spec, where):
+    _check_keys(spec, ("family", "mean", "shape", "scale", "low", "high", "floor"), where)
+    family = str(spec.get("family", "")).lower()
+    if family not in DISTRIBUTION_FAMILIES:
+        raise ValueError(f"Unknown distribution family '{spec.get('family')}' in {where}. "
+                         f"Choose from: {', '.join(DISTRIBUTION_FAMILIES)}")
+    cls = DISTRIBUTION_FAMILIES[family]
+    names = [f.name for f in fields(cls)]
+    _check_keys({k: v for k, v in spec.items() if k != "family"}, names, f"{where} ({family})")
+    missing = [name for name in names if name != "floor" and name not in spec]
+    if missing:
+        raise ValueError(f"{where} ({family}) is missing {', '.join(missing)}")
+    params = {name: _number(spec[name], f"{where}.{name}") for name in names if spec.get(name) is not None}
+    for name in ("mean", "shape", "scale"):
+        if name in params:
+            _number(params[name], f"{where}.{name}", positive=True)
+    if family == "uniform" and params["low"] >= params["high"]:
+        raise ValueError(f"{where}: low ({params['low']}) must be below high ({params['high']})")
+    return cls(**params)
+
+def compile_doctor(entry, where):
+    _check_keys(entry, ("name", "role", "xray_probability") + DOCTOR_DISTRIBUTIONS, where)
+    missing = [name for name in ("xray_probability",) + DOCTOR_DISTRIBUTIONS if name not in entry]
+    if missing:
+        raise ValueError(f"{where} is missing {', '.join(missing)}")
+    role = entry.get("role", "any")
+    if role not in DOCTOR_ROLES:
+        raise ValueError(f"Unknown role '{role}' in {where}. Choose from: {', '.join(DOCTOR_ROLES)}")
+    xray_probability = _number(entry["xray_probability"], f"{where}.xray_probability", minimum=0)
+    if xray_probability > 1:
+        raise ValueError(f"{where}.xray_probability must be at most 1, got {xray_probability}")
+    profile = sim.DoctorProfile(
+        **{name: compile_distribution(entry[name], f"{where}.{name}") for name in DOCTOR_DISTRIBUTIONS},
+        xray_probability=xray_probability)
+    return profile, role
+
+def compile_breaks(breaks, where):
+    if not isinstance(breaks, list) or not all(isinstance(window, list) and len(window) == 2 for window in breaks):
+        raise ValueError(f"{where} must be a list of [start, end] windows, got {breaks!r}")
+    return tuple((_number(start, f"{where}[{i}]", minimum=0), _number(end, f"{where}[{i}]", minimum=0))
+                 for i, (start, end) in enumerate(breaks))
+
+def compile_clinic(clinic):
+    _check_keys(clinic, CLINIC_FIELDS, "clinic")
+    return {name: _number(value, f"clinic.{name}") for name, value in clinic.items()}
+
+def compile_config(data, base_scenario=sim.DEFAULT_SCENARIO):
+    # Validates a parsed config and compiles it into a Scenario; settings the file leaves
+    # out keep their values from base_scenario.
+    _check_keys(data, ("clinic", "xray", "doctors"), "config")
+    changes = compile_clinic(data.get("clinic", {}))
+
+    xray = data.get("xray", {})
+    _check_keys(xray, ("rooms", "dispatch", "service_time"), "xray")
+    if "rooms" in xray:
+        rooms = xray["rooms"]
+        if isinstance(rooms, bool) or not isinstance(rooms, int) or rooms < 1:
+            raise ValueError(f"xray.rooms must be a positive integer, got {rooms!r}")
+        changes["num_xray_rooms"] = rooms
+    if "dispatch" in xray:
+        if xray["dispatch"] not in sim.DISPATCHERS:
+            raise ValueError(f"Unknown X-ray dispatch policy '{xray['dispatch']}'. Choose from: {', '.join(sim.DISPATCHERS)}")
+        changes["xray_dispatch"] = xray["dispatch"]
+    if "service_time" in xray:
+        changes["xray_service_time"] = compile_distribution(xray["service_time"], "xray.service_time")
+
+    if "doctors" in data:
+        doctors = data["doctors"]
+        if not isinstance(doctors, list) or not doctors:
+            raise ValueError("doctors must be a non-empty list of doctor entries")
+        compiled = [compile_doctor({k: v for k, v in entry.items() if k != "breaks"}, f"doctors[{i}]")
+                    for i, entry in enumerate(doctors)]
+        roles = {}
+        for i, (_, role) in enumerate(compiled):
+            if role != "any":
+                if role in roles:
+                    raise ValueError(f"Only one doctor can be {role} (doctors[{roles[role]}] and doctors[{i}])")
+                roles[role] = i
+        changes["num_doctors"] = len(compiled)
+        changes["doctor_profiles"] = tuple(profile for profile, _ in compiled)
+        changes["appointment_only_doctor_id"] = roles.get("appointment_only")
+        changes["walkin_only_doctor_id"] = roles.get("walkin_only")
+        breaks = [compile_breaks(entry["breaks"], f"doctors[{i}].breaks") if "breaks" in entry else None
+                  for i, entry in enumerate(doctors)]
+        changes["doctor_breaks"] = tuple(breaks) if any(b is not None for b in breaks) else None
+
+    scenario = base_scenario.replace(**changes)
+    validate_scenario(scenario)
+    return scenario
+
+def validate_scenario(scenario):
+    if not 0 <= scenario.lunch_start <= scenario.lunch_end <= scenario.sim_time:
+        raise ValueError(f"Lunch window {scenario.lunch_start}-{scenario.lunch_end} must lie within 0-{scenario.sim_time}")
+    if not 0 < scenario.walkin_cutoff_time <= scenario.sim_time:
+        raise ValueError(f"Walk-in cutoff {scenario.walkin_cutoff_time} must lie within 0-{scenario.sim_time}")
+    if scenario.punctuality_min > scenario.punctuality_max:
+        raise ValueError("clinic.punctuality_min must not exceed clinic.punctuality_max")
+    for name in ("max_drain_time", "arrival_rate_factor", "afternoon_speedup_factor"):
+        _number(getattr(scenario, name), f"clinic.{name}", positive=True)
+    for i in range(scenario.num_doctors):
+        scenario.break_windows(i)
+
+def load_config(path, base_scenario=sim.DEFAULT_SCENARIO):
+    return compile_config(read_config_file(path), base_scenario)
+
+def config_hash(scenario):
+    # Stable identifier of an experiment definition (the result-cache fingerprint, hashed).
+    payload = json.dumps(scenario_fingerprint(scenario), sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+# ----------- Department Files -----------
+# Multi-specialty departments (department.py) use a "clinic" section as above plus:
+#
+#   modalities:  name, rooms, service_time, optional morning_factor and dispatch
+#   specialties: name, clinicians, optional pooled (default true), a doctor profile
+#                (the DOCTOR_DISTRIBUTIONS and xray_probability) and an optional routing
+#                graph {node: {next node: probability}} over exam, review, modalities and exit
+
+def compile_department(data, base_scenario=sim.DEFAULT_SCENARIO):
+    import department
+    _check_keys(data, ("clinic", "modalities", "specialties"), "department config")
+    scenario = base_scenario.replace(**compile_clinic(data.get("clinic", {})))
+    validate_scenario(scenario)
+
+    modalities = []
+    for i, entry in enumerate(data.get("modalities", [])):
+        where = f"modalities[{i}]"
+        _check_keys(entry, ("name", "rooms", "service_time", "morning_factor", "dispatch"), where)
+        if entry.get("dispatch", sim.DEFAULT_DISPATCH) not in sim.DISPATCHERS:
+            raise ValueError(f"Unknown dispatch policy '{entry['dispatch']}' in {where}. Choose from: {', '.join(sim.DISPATCHERS)}")
+        modalities.append(department.Modality(
+            name=str(entry["name"]), rooms=int(_number(entry["rooms"], f"{where}.rooms", minimum=1)),
+            service_time=compile_distribution(entry["service_time"], f"{where}.service_time"),
+            morning_factor=_number(entry.get("morning_factor", 1.0), f"{where}.morning_factor", positive=True),
+            dispatch=entry.get("dispatch", sim.DEFAULT_DISPATCH)))
+
+    specialties = []
+    entries = data.get("specialties", [])
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("specialties must be a non-empty list of specialty entries")
+    for i, entry in enumerate(entries):
+        where = f"specialties[{i}]"
+        _check_keys(entry, ("name", "clinicians", "pooled", "profile", "routing"), where)
+        profile, _ = compile_doctor(entry.get("profile", {}), f"{where}.profile")
+        routing = entry.get("routing")
+        if routing is not None:
+            _check_keys(routing, list(routing), f"{where}.routing")
+            routing = department.routing_graph({node: {target: _number(p, f"{where}.routing.{node}.{target}")
+                                                       for target, p in targets.items()}
+                                                for node, targets in routing.items()})
+        specialties.append(department.Specialty(
+            name=str(entry["name"]), clinicians=int(_number(entry["clinicians"], f"{where}.clinicians", minimum=1)),
+            profile=profile, pooled=bool(entry.get("pooled", True)), routing=routing))
+
+    result = department.Department(tuple(specialties), tuple(modalities))
+    result.validate()
+    return result, scenario
+
+def load_department(path, base_scenario=sim.DEFAULT_SCENARIO):
+    return compile_department(read_config_file(path), base_scenario)
+
+# ----------- Export -----------
+
+def distribution_to_dict(spec):
+    params = {f.name: getattr(spec, f.name) for f in fields(spec)}
+    return {"family": type(spec).__name__.lower(), **{k: v for k, v in params.items() if v is not None}}
+
+def scenario_to_config(scenario):
+    # Inverse of compile_config for the settings a config file covers.
+    doctors = []
+    for i in range(scenario.num_doctors):
+        # Profiles as configured; arrival_rate_factor is written to the clinic section instead
+        config = scenario.replace(arrival_rate_factor=1.0).doctor_config(i)
+        role = ("appointment_only" if i == scenario.appointment_only_doctor_id
+                else "walkin_only" if i == scenario.walkin_only_doctor_id else "any")
+        doctors.append({"name": f"Doctor {i + 1}", "role": role,
+                        **{name: distribution_to_dict(config[name]) for name in DOCTOR_DISTRIBUTIONS},
+                        "xray_probability": config["xray_probability"]})
+        breaks = scenario.doctor_breaks[i % len(scenario.doctor_breaks)] if scenario.doctor_breaks else None
+        if breaks is not None:
+            doctors[-1]["breaks"] = [list(window) for window in breaks]
+    return {
+        "clinic": {name: getattr(scenario, name) for name in CLINIC_FIELDS},
+        "xray": {"rooms": scenario.num_xray_rooms, "dispatch": scenario.xray_dispatch,
+                 "service_time": distribution_to_dict(scenario.xray_service_spec())},
+        "doctors": doctors,
+    }
+
+def save_config(scenario, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(scenario_to_config(scenario), f, indent=2)
+        f.write("\n")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Validate clinic config files or write the built-in configuration as one.")
+    parser.add_argument("paths", nargs="*", help="Config files to validate (.json, .toml, .yaml).")
+    parser.add_argument("--write-default", metavar="PATH", help="Write the built-in configuration as JSON.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.write_default:
+        save_config(sim.DEFAULT_SCENARIO, args.write_default)
+        print(f"Saved config: {args.write_default}")
+    for path in args.paths:
+        scenario = load_config(path)
+        print(f"{path}: OK, {scenario.num_doctors} doctors, {scenario.num_xray_rooms} X-ray rooms, "
+              f"config hash {config_hash(scenario)}")
@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import bisect
+import functools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Optional
+
+import numpy as np
+import simpy
+
+import main as sim
+import replications
+from dispatch import DEFAULT_DISPATCH, build_dispatcher
+from patient_records import RecordBuffer
+from queue_tracking import TrackedPriorityResource
+from sampling import Exponential, Gamma, UNIT_UNIFORM, Uniform, SamplerStreams
+
+# ----------- Configuration -----------
+EXAM, REVIEW, EXIT = "exam", "review", "exit"
+# Node ids in visit records: exams and reviews at the specialty, then one id per modality
+EXAM_NODE, REVIEW_NODE, FIRST_MODALITY_NODE = 0, 1, 2
+EXIT_NODE = -1
+# Longest route a patient can take through a routing graph with cycles
+MAX_ROUTE_LENGTH = 32
+DEFAULT_DEPARTMENT_REPLICATIONS = 10
+
+# One row per departed patient and one per stage visited (exam, imaging, review). Both grow
+# with the number of patients only; server is the clinician or room index, -1 for a pool.
+DEPARTMENT_PATIENT_DTYPE = np.dtype([
+    ("patient_id", "i4"),
+    ("specialty", "i2"),
+    ("is_appointment", "?"),
+    ("visits", "i1"),
+    ("arrival_time", "f8"),
+    ("total_wait", "f4"),
+    ("time_in_system", "f8"),
+])
+VISIT_DTYPE = np.dtype([
+    ("patient_id", "i4"),
+    ("specialty", "i2"),
+    ("node", "i2"),
+    ("server", "i4"),
+    ("request_time", "f8"),
+    ("wait", "f4"),
+    ("service", "f4"),
+])
+
+# ----------- Department Definition -----------
+
+def routing_graph(transitions):
+    # {node: {next node: probability}} -> the hashable form Specialty.routing stores. Nodes
+    # are "exam" (the entry), "review" (a follow-up exam with the same clinician or pool),
+    # modality names and "exit"; a node without transitions leads to the exit.
+    return tuple((node, tuple(targets.items())) for node, targets in transitions.items())
+
+def imaging_routing(probability, modality="xray"):
+    # The clinic's patient flow: an exam, then with the given probability an imaging visit
+    # followed by a review exam.
+    return routing_graph({EXAM: {modality: probability, EXIT: 1.0 - probability},
+                          modality: {REVIEW: 1.0},
+                          REVIEW: {EXIT: 1.0}})
+
+@dataclass(frozen=True)
+class Modality:
+    name: str
+    rooms: int
+    service_time: object
+    # Service time multiplier before the end of lunch (the clinic's X-ray rooms use
+    # sim.XRAY_MORNING_SLOWDOWN)
+    morning_factor: float = 1.0
+    dispatch: str = DEFAULT_DISPATCH
+
+@dataclass(frozen=True)
+class Specialty:
+    # profile.arrival is the walk-in rate of one clinician, as in the clinic; the
+    # specialty's walk-ins are the superposition over its clinicians.
+    name: str
+    clinicians: int
+    profile: sim.DoctorProfile
+    # Pooled: one shared line served by all clinicians of the specialty. Otherwise every
+    # clinician has a line; appointments are booked with one clinician and walk-ins join
+    # the shortest line.
+    pooled: bool = True
+    # See routing_graph(); None sends profile.xray_probability of patients to X-ray
+    routing: Optional[tuple] = None
+
+    def transitions(self):
+        return dict(self.routing if self.routing is not None else imaging_routing(self.profile.xray_probability))
+
+@dataclass(frozen=True)
+class Department:
+    specialties: tuple
+    modalities: tuple
+
+    @property
+    def num_clinicians(self):
+        return sum(specialty.clinicians for specialty in self.specialties)
+
+    def validate(self):
+        names = [s.name for s in self.specialties] + [m.name for m in self.modalities]
+        if len(set(names)) != len(names):
+            raise ValueError("Specialty and modality names must be unique")
+        modality_names = {m.name for m in self.modalities}
+        reserved = modality_names & {EXAM, REVIEW, EXIT}
+        if reserved:
+            raise ValueError(f"Modality names {', '.join(sorted(reserved))} are reserved for routing")
+        for modality in self.modalities:
+            if modality.rooms < 1:
+                raise ValueError(f"Modality '{modality.name}' needs at least one room")
+        for specialty in self.specialties:
+            if specialty.clinicians < 1:
+                raise ValueError(f"Specialty '{specialty.name}' needs at least one clinician")
+            transitions = specialty.transitions()
+            if EXAM not in transitions:
+                raise ValueError(f"Routing of '{specialty.name}' has no '{EXAM}' entry node")
+            for node, targets in transitions.items():
+                if node not in modality_names | {EXAM, REVIEW}:
+                    raise ValueError(f"Unknown routing node '{node}' in '{specialty.name}'")
+                for target, probability in targets:
+                    if target not in modality_names | {EXAM, REVIEW, EXIT}:
+                        raise ValueError(f"Unknown routing target '{target}' from '{node}' in '{specialty.name}'")
+                    if probability < 0:
+                        raise ValueError(f"Negative routing probability from '{node}' to '{target}' in '{specialty.name}'")
+                total = sum(probability for _, probability in targets)
+                if not math.isclose(total, 1.0, abs_tol=1e-9):
+                    raise ValueError(f"Routing probabilities from '{node}' in '{specialty.name}' sum to {total:g}, not 1")
+
+def example_department(num_specialties=10, clinicians_per_specialty=20, pooled=True):
+    # A hospital outpatient department built from the clinic: specialties take the clinic's
+    # doctor profiles in turn, X-ray rooms keep the clinic's ratio of 2 rooms per 7 doctors,
+    # and a CT modality takes 5% of imaging referrals. With dozens of rooms one shared line
+    # per modality keeps rooms from idling next to long queues.
+    ct_share = 0.05
+    specialties = []
+    for i in range(num_specialties):
+        profile = sim.doctor_configs[i % len(sim.doctor_configs)]
+        p = profile.xray_probability
+        routing = routing_graph({EXAM: {"xray": p * (1 - ct_share), "ct": p * ct_share, EXIT: 1.0 - p},
+                                 "xray": {REVIEW: 1.0}, "ct": {REVIEW: 1.0}, REVIEW: {EXIT: 1.0}})
+        specialties.append(Specialty(f"specialty{i + 1}", clinicians_per_specialty, profile, pooled, routing))
+    num_clinicians = num_specialties * clinicians_per_specialty
+    modalities = (
+        Modality("xray", max(1, round(num_clinicians * 2 / 7)), sim.base_xray_service_time,
+                 morning_factor=sim.XRAY_MORNING_SLOWDOWN, dispatch="pooled"),
+        Modality("ct", max(1, round(num_clinicians / 20)), Gamma(3, 2, floor=2), dispatch="pooled"),
+    )
+    return Department(tuple(specialties), modalities)
+
+# ----------- Department Model -----------
+
+class DepartmentModel:
+    # One day of a multi-specialty department. Processes are per specialty rather than per
+    # clinician (one walk-in and one appointment generator each; only the lunch break is a
+    # short-lived process per clinician), and all statistics are appended to typed record
+    # buffers and reduced with numpy at the end, so memory grows with the number of patients,
+    # not with clinicians. Opening hours, lunch, punctuality and the afternoon speed-up come
+    # from the scenario; its doctor, role and X-ray settings do not apply.
+
+    def __init__(self, seed=sim.RANDOM_SEED, department=None, scenario=sim.DEFAULT_SCENARIO):
+        department = example_department() if department is None else department
+        department.validate()
+        self.seed = seed
+        self.department = department
+        self.scenario = scenario
+        self.streams = streams = SamplerStreams(seed)
+        self.env = env = simpy.Environment()
+        self.stop_event = env.event()
+        self.system_empty_event = None
+
+        self.node_ids = {EXAM: EXAM_NODE, REVIEW: REVIEW_NODE,
+                         **{m.name: FIRST_MODALITY_NODE + i for i, m in enumerate(department.modalities)}}
+
+        # Clinician resources: one pool per pooled specialty, one resource per clinician otherwise.
+        self.clinician_offsets = list(accumulate((s.clinicians for s in department.specialties), initial=0))
+        self.specialty_resources = []
+        self.walkin_dispatchers = []
+        self.samplers = []
+        self.routes = []
+        for idx, specialty in enumerate(department.specialties):
+            profile = specialty.profile
+            if specialty.pooled:
+                resources = [TrackedPriorityResource(env, capacity=specialty.clinicians)]
+                dispatcher = None
+            else:
+                resources = [TrackedPriorityResource(env, capacity=1) for _ in range(specialty.clinicians)]
+                expected_exam = profile.type_b_first_exam.expected_value()
+                dispatcher = build_dispatcher(DEFAULT_DISPATCH, env, resources,
+                                              streams.sampler("clinician_choice", UNIT_UNIFORM, idx),
+                                              lambda now, expected=expected_exam: expected)
+            self.specialty_resources.append(resources)
+            self.walkin_dispatchers.append(dispatcher)
+            walkin_mean = profile.arrival.mean / (specialty.clinicians * scenario.arrival_rate_factor)
+            self.samplers.append({
+                "arrival": streams.sampler("arrival", Exponential(walkin_mean), idx),
+                "type_a_first_exam": streams.sampler("type_a_first_exam", profile.type_a_first_exam, idx),
+                "type_b_first_exam": streams.sampler("type_b_first_exam", profile.type_b_first_exam, idx),
+                "type_a_second_exam": streams.sampler("type_a_second_exam", profile.type_a_second_exam, idx),
+                "punctuality": streams.sampler("punctuality", Uniform(scenario.punctuality_min, scenario.punctuality_max), idx),
+                "routing": streams.sampler("routing", UNIT_UNIFORM, idx),
+            })
+            # Per node: cumulative probabilities and target node ids, for one draw per step
+            self.routes.append({
+                self.node_ids[node]: (list(accumulate(p for _, p in targets)),
+                                      [self.node_ids.get(target, EXIT_NODE) for target, _ in targets])
+                for node, targets in specialty.transitions().items()})
+
+        self.modality_rooms = []
+        self.modality_dispatchers = []
+        self.modality_samplers = []
+        lunch_end = scenario.lunch_end
+        for m_idx, modality in enumerate(department.modalities):
+            rooms = [TrackedPriorityResource(env, capacity=1) for _ in range(modality.rooms)]
+            expected = modality.service_time.expected_value()
+            self.modality_rooms.append(rooms)
+            self.modality_dispatchers.append(build_dispatcher(
+                modality.dispatch, env, rooms, streams.sampler("imaging_room_choice", UNIT_UNIFORM, m_idx),
+                lambda now, expected=expected, factor=modality.morning_factor: expected * factor if now < lunch_end else expected))
+            self.modality_samplers.append(streams.sampler("imaging_service", modality.service_time, m_idx))
+
+        # ----------- Statistics Tracking -----------
+        self.total_patients_generated = 0
+        self.patients_currently_in_system = 0
+        self.patient_records = RecordBuffer(DEPARTMENT_PATIENT_DTYPE)
+        self.visit_records = RecordBuffer(VISIT_DTYPE)
+
+    # ----------- Run Setup -----------
+
+    def appointment_arrivals(self, specialty_idx):
+        # (arrival time, scheduled time, clinician) of the specialty's booked patients in
+        # arrival order; every clinician's slots are drawn from their own stream.
+        scenario = self.scenario
+        specialty = self.department.specialties[specialty_idx]
+        punctuality = self.samplers[specialty_idx]["punctuality"]
+        arrivals = []
+        for clinician in range(specialty.clinicians):
+            interval = self.streams.sampler("appointment_interval", specialty.profile.appointment_interval,
+                                            self.clinician_offsets[specialty_idx] + clinician)
+            scheduled_time = interval()
+            while scheduled_time < scenario.sim_time:
+                arrival_time = max(0.0, scheduled_time + punctuality())
+                if arrival_time < scenario.sim_time:
+                    arrivals.append((arrival_time, scheduled_time, clinician))
+                scheduled_time += interval()
+        arrivals.sort()
+        return arrivals
+
+    def run(self):
+        env = self.env
+        for idx in range(len(self.department.specialties)):
+            env.process(self.walkin_generator(idx))
+            env.process(self.appointment_generator(idx, self.appointment_arrivals(idx)))
+            for resource in self.specialty_resources[idx]:
+                for _ in range(resource.capacity):
+                    env.process(self.lunch_break(resource))
+        env.process(self.simulation_ender())
+        env.run(until=self.stop_event)
+        return self
+
+    # ----------- Simulation Processes -----------
+
+    def sample_route(self, specialty_idx):
+        transitions = self.routes[specialty_idx]
+        draw = self.samplers[specialty_idx]["routing"]
+        path = []
+        node = EXAM_NODE
+        while node != EXIT_NODE and len(path) < MAX_ROUTE_LENGTH:
+            path.append(node)
+            if node not in transitions:
+                break
+            cumulative, targets = transitions[node]
+            node = targets[min(bisect.bisect_right(cumulative, draw()), len(targets) - 1)]
+        return path
+
+    def admit(self, specialty_idx, clinician, is_appointment, arrival_time, scheduled_time=None):
+        self.total_patients_generated += 1
+        self.patients_currently_in_system += 1
+        priority = scheduled_time if is_appointment else sim.WALKIN_PRIORITY_OFFSET + arrival_time
+        self.env.process(self.patient(self.total_patients_generated, specialty_idx, clinician, is_appointment,
+                                      arrival_time, priority))
+
+    def walkin_generator(self, specialty_idx):
+        env = self.env
+        arrival = self.samplers[specialty_idx]["arrival"]
+        dispatcher = self.walkin_dispatchers[specialty_idx]
+        walkin_cutoff_time = self.scenario.walkin_cutoff_time
+        while True:
+            interarrival_time = arrival()
+            if env.now + interarrival_time >= walkin_cutoff_time:
+                break
+            yield env.timeout(interarrival_time)
+            self.admit(specialty_idx, dispatcher.select() if dispatcher is not None else 0, False, env.now)
+
+    def appointment_generator(self, specialty_idx, arrivals):
+        env = self.env
+        for arrival_time, scheduled_time, clinician in arrivals:
+            if arrival_time > env.now:
+                yield env.timeout(arrival_time - env.now)
+            self.admit(specialty_idx, clinician if not self.department.specialties[specialty_idx].pooled else 0,
+                       True, env.now, scheduled_time)
+
+    def lunch_break(self, resource):
+        # As in the clinic, a clinician goes on lunch once their current patient is finished;
+        # a pool takes one break request per clinician.
+        env = self.env
+        lunch_start, lunch_end = self.scenario.lunch_start, self.scenario.lunch_end
+        yield env.timeout(lunch_start)
+        with resource.request_break() as req:
+            yield req
+            if env.now < lunch_end:
+                yield env.timeout(lunch_end - env.now)
+
+    def patient(self, pid, specialty_idx, clinician, is_appointment, arrival_time, priority):
+        env = self.env
+        scenario = self.scenario
+        lunch_end = scenario.lunch_end
+        afternoon_speedup_factor = scenario.afternoon_speedup_factor
+        samplers = self.samplers[specialty_idx]
+        clinician_resource = self.specialty_resources[specialty_idx][clinician]
+        # Clinician index across the department, -1 when a pool serves the patient
+        server = -1 if self.department.specialties[specialty_idx].pooled else self.clinician_offsets[specialty_idx] + clinician
+        add_visit = self.visit_records.append
+        path = self.sample_route(specialty_idx)
+        needs_imaging = any(node >= FIRST_MODALITY_NODE for node in path)
+        total_wait = 0.0
+
+        try:
+            for node in path:
+                if node < FIRST_MODALITY_NODE:
+                    # Exam or review with the specialty
+                    request_time = env.now
+                    with clinician_resource.request(priority=priority) as req:
+                        yield req
+                        wait = env.now - request_time
+                        if node == EXAM_NODE:
+                            service = samplers["type_a_first_exam"]() if needs_imaging else samplers["type_b_first_exam"]()
+                        else:
+                            service = samplers["type_a_second_exam"]()
+                        if env.now >= lunch_end:
+                            service *= afternoon_speedup_factor
+                        yield env.timeout(service)
+                    add_visit((pid, specialty_idx, node, server, request_time, wait, service))
+                else:
+                    m_idx = node - FIRST_MODALITY_NODE
+                    modality = self.department.modalities[m_idx]
+                    dispatcher = self.modality_dispatchers[m_idx]
+                    pool = dispatcher.pool
+                    request_time = env.now
+                    with (pool.request(priority=priority) if pool is not None else nullcontext()) as req_pool:
+                        if req_pool is not None:
+                            yield req_pool
+                        room_idx = dispatcher.select()
+                        with self.modality_rooms[m_idx][room_idx].request(priority=priority) as req_room:
+                            yield req_room
+                            wait = env.now - request_time
+                            service = self.modality_samplers[m_idx]()
+                            if env.now < lunch_end:
+                                service *= modality.morning_factor
+                            yield env.timeout(service)
+                    add_visit((pid, specialty_idx, node, room_idx, request_time, wait, service))
+                total_wait += wait
+
+            self.patient_records.append((pid, specialty_idx, is_appointment, len(path), arrival_time, total_wait,
+                                         env.now - arrival_time))
+        finally:
+            self.patients_currently_in_system -= 1
+            if self.patients_currently_in_system == 0 and self.system_empty_event is not None:
+                if not self.system_empty_event.triggered:
+                    self.system_empty_event.succeed()
+
+    def simulation_ender(self):
+        env = self.env
+        if env.now < self.scenario.sim_time:
+            yield env.timeout(self.scenario.sim_time - env.now)
+        if self.patients_currently_in_system > 0:
+            self.system_empty_event = env.event()
+            yield self.system_empty_event | env.timeout(self.scenario.max_drain_time)
+        self.stop_event.succeed()
+
+    # ----------- Run Summary -----------
+
+    def collect_run_summary(self):
+        return summarize_department(self)
+
+# ----------- Run Summary -----------
+
+def _grouped(values, keys, num_groups):
+    # Values split by integer key, in key order.
+    order = np.argsort(keys, kind="stable")
+    counts = np.bincount(keys, minlength=num_groups)
+    return np.split(values[order], np.cumsum(counts)[:-1])
+
+def _mean_and_p90(values):
+    if not len(values):
+        return float("nan"), float("nan")
+    return float(values.mean()), float(np.percentile(values, 90))
+
+def summarize_department(model):
+    # Flat per-replication metrics like summarize_run, per specialty and modality rather than
+    # per clinician and room.
+    end_time = model.env.now
+    department = model.department
+    patients = model.patient_records.to_array()
+    visits = model.visit_records.to_array()
+    time_in_system = patients["time_in_system"]
+    summary = {
+        "end_time": end_time,
+        "overtime": max(0.0, end_time - model.scenario.sim_time),
+        "patients_generated": model.total_patients_generated,
+        "appointment_departures": int(patients["is_appointment"].sum()),
+        "walkin_departures": int((~patients["is_appointment"]).sum()),
+        "departures": len(patients),
+        "imaging_visits": int((visits["node"] >= FIRST_MODALITY_NODE).sum()),
+    }
+    summary["mean_time_in_system"], summary["p90_time_in_system"] = _mean_and_p90(time_in_system)
+
+    exams = visits[visits["node"] < FIRST_MODALITY_NODE]
+    exam_waits = _grouped(exams["wait"].astype(np.float64), exams["specialty"], len(department.specialties))
+    for idx, specialty in enumerate(department.specialties):
+        resources = model.specialty_resources[idx]
+        capacity = specialty.clinicians if specialty.pooled else 1
+        name = specialty.name
+        summary[f"{name}_exams"] = len(exam_waits[idx])
+        summary[f"{name}_mean_wait"], summary[f"{name}_p90_wait"] = _mean_and_p90(exam_waits[idx])
+        summary[f"{name}_avg_queue"] = float(sum(r.trace.average_queue_length(end_time) for r in resources))
+        summary[f"{name}_utilization"] = float(np.mean([r.trace.utilization(capacity, end_time) for r in resources]))
+
+    imaging = visits[visits["node"] >= FIRST_MODALITY_NODE]
+    imaging_waits = _grouped(imaging["wait"].astype(np.float64), imaging["node"] - FIRST_MODALITY_NODE,
+                             len(department.modalities))
+    for m_idx, modality in enumerate(department.modalities):
+        rooms = model.modality_rooms[m_idx]
+        pool = model.modality_dispatchers[m_idx].pool
+        name = modality.name
+        summary[f"{name}_visits"] = len(imaging_waits[m_idx])
+        summary[f"{name}_mean_wait"], summary[f"{name}_p90_wait"] = _mean_and_p90(imaging_waits[m_idx])
+        summary[f"{name}_avg_queue"] = float(sum(r.trace.average_queue_length(end_time) for r in rooms)
+                                             + (pool.trace.average_queue_length(end_time) if pool is not None else 0.0))
+        summary[f"{name}_utilization"] = float(np.mean([r.trace.utilization(1, end_time) for r in rooms]))
+    return summary
+
+# ----------- Replications -----------
+
+def run_department_replication(seed, department, scenario=sim.DEFAULT_SCENARIO):
+    summary = DepartmentModel(seed, department, scenario).run().collect_run_summary()
+    summary["seed"] = seed
+    return summary
+
+def run_department_replications(department, num_replications=DEFAULT_DEPARTMENT_REPLICATIONS,
+                                base_seed=sim.RANDOM_SEED, workers=None, scenario=sim.DEFAULT_SCENARIO,
+                                confidence=replications.DEFAULT_CONFIDENCE):
+    # The department definition is frozen dataclasses of distribution specs, so it pickles
+    # to the workers once per task.
+    seeds = replications.spawn_seeds(base_seed, num_replications)
+    workers = workers or os.cpu_count() or 1
+    run_one = functools.partial(run_department_replication, department=department, scenario=scenario)
+    if workers == 1 or num_replications <= 1:
+        summaries = [run_one(seed) for seed in seeds]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            summaries = list(executor.map(run_one, seeds))
+    return {
+        "base_seed": base_seed,
+        "seeds": seeds,
+        "replications": summaries,
+        "cache_hits": 0,
+        "summary": replications.aggregate_summaries(summaries, confidence),
+    }
+
+def print_department_day(model, summary):
+    department = model.department
+    pooling = ", ".join(sorted({"pooled" if s.pooled else "per-clinician lines" for s in department.specialties}))
+    print(f"Department: {len(department.specialties)} specialties, {department.num_clinicians} clinicians ({pooling}), "
+          f"{sum(m.rooms for m in department.modalities)} imaging rooms")
+    print(f"Patients: {summary['patients_generated']} generated, {summary['departures']} departed, "
+          f"end time {summary['end_time']:.1f} min (overtime {summary['overtime']:.1f}), "
+          f"mean time in system {summary['mean_time_in_system']:.1f} min")
+    print(f"\n{'Specialty / Modality':<22} | {'Visits':>7} | {'Mean Wait':>9} | {'P90 Wait':>8} | {'Avg Queue':>9} | {'Util':>6}")
+    print("-" * 78)
+    for name, count_key in [(s.name, "exams") for s in department.specialties] + [(m.name, "visits") for m in department.modalities]:
+        print(f"{name:<22} | {summary[f'{name}_{count_key}']:>7} | {summary[f'{name}_mean_wait']:>9.2f} | "
+              f"{summary[f'{name}_p90_wait']:>8.2f} | {summary[f'{name}_avg_queue']:>9.2f} | {summary[f'{name}_utilization']:>6.1%}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a multi-specialty department with shared imaging.")
+    parser.add_argument("--specialties", type=int, default=10)
+    parser.add_argument("--clinicians", type=int, default=20, help="Clinicians per specialty.")
+    parser.add_argument("--per-clinician-lines", action="store_true",
+                        help="One line per clinician instead of one pooled line per specialty.")
+    parser.add_argument("--config", metavar="PATH", help="Department config file (see config.load_department).")
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED)
+    parser.add_argument("-n", "--replications", type=int, default=None,
+                        help="Run independent replications instead of one detailed day.")
+    parser.add_argument("--workers", type=int, default=None)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    scenario = sim.DEFAULT_SCENARIO
+    if args.config:
+        import config
+        department, scenario = config.load_department(args.config)
+    else:
+        department = example_department(args.specialties, args.clinicians, pooled=not args.per_clinician_lines)
+    if args.replications is None:
+        start = time.perf_counter()
+        model = DepartmentModel(args.seed, department, scenario).run()
+        wall = time.perf_counter() - start
+        print_department_day(model, model.collect_run_summary())
+        print(f"\nWall time: {wall:.2f} s")
+    else:
+        results = run_department_replications(department, args.replications, base_seed=args.seed,
+                                              workers=args.workers, scenario=scenario)
+        print(f"Replications: {args.replications}, base seed: {args.seed}")
+        replications.print_summary_table(results)
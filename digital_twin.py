@@ -0,0 +1,627 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from operator import attrgetter
+from typing import Optional
+
+import numpy as np
+
+import main as sim
+from event_log import (
+    EV_ARRIVED, EV_DEPARTED, EV_EXAM1_END, EV_EXAM1_START, EV_EXAM2_END, EV_EXAM2_START,
+    EV_XRAY_END, EV_XRAY_REQUEST, EV_XRAY_START, EventSink,
+)
+from replications import spawn_seeds
+
+# ----------- Configuration -----------
+DEFAULT_RUNS = 32
+MIN_RUNS = 8
+# Wall-clock seconds allowed from an event to the forecast that includes it
+DEFAULT_LATENCY_BUDGET = 2.0
+# Wall-clock seconds between forecasts while no event arrives, and the pause after an event
+# so that a burst of events is forecast once
+DEFAULT_REFRESH = 180.0
+DEFAULT_DEBOUNCE = 0.2
+# Forecast grid step and how far past closing it reaches, in minutes
+DEFAULT_STEP = 5.0
+DRAIN_HORIZON = 60.0
+FILE_POLL_INTERVAL = 0.1
+# Draws tried for a service time longer than the part already done
+RESIDUAL_TRIES = 1000
+FORECAST_QUANTILES = (0.1, 0.9)
+
+# ----------- Feed Events -----------
+# One JSON object per line. t is the clinic clock in minutes since opening, doctor and room
+# are 0-based as in the event log, patient is any id unique within the day.
+#
+#   {"t": 12.4, "event": "arrival", "patient": "p17", "doctor": 1, "appointment": true, "scheduled": 15}
+#   {"t": 20.0, "event": "exam_start", "patient": "p17"}              first or second exam
+#   {"t": 31.5, "event": "exam_end", "patient": "p17", "xray": true}  xray after the first exam only
+#   {"t": 33.0, "event": "xray_start", "patient": "p17", "room": 0}
+#   {"t": 41.2, "event": "xray_end", "patient": "p17"}
+#   {"t": 0.0, "event": "booking", "doctor": 1, "scheduled": 15}      the day's appointment book
+#   {"t": 45.0, "event": "clock"}                                     time passes, nothing happens
+
+WAITING_DOCTOR, EXAM, WAITING_XRAY, XRAY, WAITING_SECOND_EXAM, SECOND_EXAM = (
+    "waiting_doctor", "exam", "waiting_xray", "xray", "waiting_second_exam", "second_exam")
+IN_SERVICE = (EXAM, XRAY, SECOND_EXAM)
+# Stage of patient() a live patient continues at: the line it waits in, or the one after
+# the service it is in
+RESUME_STAGES = {
+    WAITING_DOCTOR: sim.STAGE_FIRST_EXAM,
+    EXAM: sim.STAGE_XRAY,
+    WAITING_XRAY: sim.STAGE_XRAY,
+    XRAY: sim.STAGE_SECOND_EXAM,
+    WAITING_SECOND_EXAM: sim.STAGE_SECOND_EXAM,
+    SECOND_EXAM: sim.STAGE_DEPARTURE,
+}
+
+@dataclass(frozen=True)
+class LivePatient:
+    pid: str
+    doctor: int
+    is_appointment: bool
+    arrival: float
+    scheduled: Optional[float]
+    stage: str
+    # When the current wait or service began
+    since: float
+    # Known once the first exam has ended
+    needs_xray: Optional[bool] = None
+    room: Optional[int] = None
+
+@dataclass(frozen=True)
+class Snapshot:
+    time: float
+    patients: tuple
+    # Appointments still expected per doctor, or None if the feed carries no bookings
+    bookings: Optional[tuple]
+    departures: int
+
+# ----------- Live State -----------
+
+class ClinicState:
+    # The clinic as observed on the feed. Patients are immutable records replaced on every
+    # change, so a snapshot is a cheap tuple that can be sent to worker processes.
+
+    def __init__(self, scenario=sim.DEFAULT_SCENARIO):
+        self.scenario = scenario
+        self.now = 0.0
+        self.patients = {}
+        self.bookings = [[] for _ in range(scenario.num_doctors)]
+        self.has_bookings = False
+        # Scheduled time of every appointment patient that came (None if not on the feed)
+        self.arrived_appointments = [[] for _ in range(scenario.num_doctors)]
+        self.departures = 0
+        self.events = 0
+
+    def apply(self, event):
+        # Raises KeyError, TypeError or ValueError for an event that does not fit the state,
+        # which is then left unchanged.
+        t = float(event["t"])
+        kind = event.get("event")
+        if kind == "arrival":
+            pid = str(event["patient"])
+            if pid in self.patients:
+                raise ValueError(f"Patient {pid} is already in the clinic")
+            doctor = self._index(event, "doctor", self.scenario.num_doctors)
+            is_appointment = bool(event.get("appointment", False))
+            scheduled = event.get("scheduled")
+            scheduled = float(scheduled) if scheduled is not None else None
+            self.patients[pid] = LivePatient(pid, doctor, is_appointment, t, scheduled, WAITING_DOCTOR, t)
+            if is_appointment:
+                self.arrived_appointments[doctor].append(scheduled)
+        elif kind == "exam_start":
+            patient = self._patient(event, (WAITING_DOCTOR, WAITING_SECOND_EXAM))
+            stage = EXAM if patient.stage == WAITING_DOCTOR else SECOND_EXAM
+            self.patients[patient.pid] = replace(patient, stage=stage, since=t)
+        elif kind == "exam_end":
+            patient = self._patient(event, (EXAM, SECOND_EXAM))
+            if patient.stage == EXAM and "xray" not in event:
+                raise ValueError(f"exam_end of a first exam needs 'xray' (patient {patient.pid})")
+            if patient.stage == EXAM and event["xray"]:
+                self.patients[patient.pid] = replace(patient, stage=WAITING_XRAY, since=t, needs_xray=True)
+            else:
+                del self.patients[patient.pid]
+                self.departures += 1
+        elif kind == "xray_start":
+            patient = self._patient(event, (WAITING_XRAY,))
+            room = self._index(event, "room", self.scenario.num_xray_rooms)
+            self.patients[patient.pid] = replace(patient, stage=XRAY, since=t, room=room)
+        elif kind == "xray_end":
+            patient = self._patient(event, (XRAY,))
+            self.patients[patient.pid] = replace(patient, stage=WAITING_SECOND_EXAM, since=t, room=None)
+        elif kind == "booking":
+            self.bookings[self._index(event, "doctor", self.scenario.num_doctors)].append(float(event["scheduled"]))
+            self.has_bookings = True
+        elif kind != "clock":
+            raise ValueError(f"Unknown event '{kind}'")
+        # Late events still change the state, but the clock never runs backwards.
+        self.now = max(self.now, t)
+        self.events += 1
+
+    def _patient(self, event, stages):
+        pid = str(event["patient"])
+        patient = self.patients.get(pid)
+        if patient is None:
+            raise ValueError(f"Patient {pid} is not in the clinic")
+        if patient.stage not in stages:
+            raise ValueError(f"'{event['event']}' does not follow '{patient.stage}' (patient {pid})")
+        return patient
+
+    @staticmethod
+    def _index(event, name, count):
+        value = int(event[name])
+        if not 0 <= value < count:
+            raise ValueError(f"{name} {value} out of range (0-{count - 1})")
+        return value
+
+    def remaining_bookings(self, doctor_id):
+        # Booked times whose patient has not come yet: arrivals are matched to their slot, or
+        # to the earliest open one if the feed has no scheduled time, and slots that even the
+        # latest punctual patient would have reached by now count as no-shows.
+        remaining = sorted(self.bookings[doctor_id])
+        unmatched = 0
+        for scheduled in self.arrived_appointments[doctor_id]:
+            if scheduled in remaining:
+                remaining.remove(scheduled)
+            else:
+                unmatched += 1
+        remaining = remaining[unmatched:]
+        latest = self.now - self.scenario.punctuality_max
+        return tuple(s for s in remaining if s >= latest)
+
+    def snapshot(self):
+        bookings = None
+        if self.has_bookings:
+            bookings = tuple(self.remaining_bookings(i) for i in range(self.scenario.num_doctors))
+        return Snapshot(self.now, tuple(self.patients.values()), bookings, self.departures)
+
+    def describe(self):
+        # Patients per doctor and X-ray room by stage, for status output
+        doctors = [{stage: 0 for stage in (WAITING_DOCTOR, EXAM, WAITING_SECOND_EXAM, SECOND_EXAM)}
+                   for _ in range(self.scenario.num_doctors)]
+        waiting_xray = 0
+        rooms = [0] * self.scenario.num_xray_rooms
+        for patient in self.patients.values():
+            if patient.stage == WAITING_XRAY:
+                waiting_xray += 1
+            elif patient.stage == XRAY:
+                rooms[patient.room] += 1
+            else:
+                doctors[patient.doctor][patient.stage] += 1
+        return {"time": self.now, "in_clinic": len(self.patients), "departures": self.departures,
+                "doctors": doctors, "waiting_xray": waiting_xray, "xray_rooms_busy": rooms}
+
+# ----------- Look-ahead Model -----------
+
+class ForecastModel(sim.ClinicModel):
+    # The rest of the day from a snapshot: the clock starts at the snapshot time, patients in
+    # the clinic resume patient() where they are and the generators add those still to come.
+    # Walk-in arrivals are memoryless, so the generators simply start now.
+
+    def __init__(self, snapshot, seed=sim.RANDOM_SEED, scenario=sim.DEFAULT_SCENARIO):
+        super().__init__(seed=seed, scenario=scenario, start_time=snapshot.time)
+        self.snapshot = snapshot
+
+    def break_windows(self, doctor_id):
+        return [(start, end) for start, end in super().break_windows(doctor_id) if end > self.env.now]
+
+    def generate_appointment_schedules(self):
+        if self.snapshot.bookings is not None:
+            self.all_doctors_schedules = [list(bookings) for bookings in self.snapshot.bookings]
+            return self.all_doctors_schedules
+        # No appointment book on the feed: draw one as a simulated day would and keep the
+        # slots whose patients could still be on their way.
+        latest = self.env.now - self.scenario.punctuality_max
+        self.all_doctors_schedules = [[s for s in schedule if s >= latest]
+                                      for schedule in super().generate_appointment_schedules()]
+        return self.all_doctors_schedules
+
+    def start(self):
+        if not self._roles_validated:
+            self.validate_special_roles()
+        self.generate_appointment_schedules()
+        waiting = self.resume_patients()
+        self.start_processes()
+        self.env.process(self.rejoin_lines(waiting))
+        return self
+
+    def resume_patients(self):
+        # Patients in service keep their doctor or room, taken here before anything else
+        # requests it; the waiting ones are returned to rejoin their lines.
+        waiting = []
+        for live in self.snapshot.patients:
+            self.total_patients_generated += 1
+            self.patients_currently_in_system += 1
+            doctor_id = live.doctor
+            needs_xray = live.needs_xray
+            if needs_xray is None:
+                xray_probability = self.scenario.doctor_config(doctor_id)["xray_probability"]
+                needs_xray = self.doctor_samplers[doctor_id]["xray_decision"]() < xray_probability
+            patient = sim.Patient(self.total_patients_generated, self.total_patients_generated, doctor_id,
+                                  live.is_appointment, needs_xray, live.arrival,
+                                  live.scheduled if live.scheduled is not None else live.arrival)
+            patient.stage = RESUME_STAGES[live.stage]
+            if live.stage in IN_SERVICE:
+                self.env.process(self.finish_service(patient, live))
+            else:
+                patient.wait_start = live.since
+                waiting.append(patient)
+        return waiting
+
+    def rejoin_lines(self, waiting):
+        # One step after the break managers, so a doctor whose break is under way takes it
+        # before the patients already waiting; they rejoin in the order they queued.
+        yield self.env.timeout(0)
+        for patient in sorted(waiting, key=attrgetter("wait_start")):
+            self.env.process(self.patient(patient))
+
+    def finish_service(self, patient, live):
+        env = self.env
+        if live.stage == XRAY:
+            pool = self.xray_dispatcher.pool
+            resources = ([pool] if pool is not None else []) + [self.xray_resources[live.room]]
+        else:
+            resources = [self.doctors[live.doctor]]
+        requests = [resource.request(priority=patient.priority) for resource in resources]
+        for request in requests:
+            yield request
+        yield env.timeout(remaining_service_time(self.service_time_sampler(patient, live), env.now - live.since))
+        for resource, request in zip(reversed(resources), reversed(requests)):
+            resource.release(request)
+        env.process(self.patient(patient))
+
+    def service_time_sampler(self, patient, live):
+        # Durations as patient() draws them for a service that began at live.since
+        lunch_end = self.lunch_window()[1]
+        if live.stage == XRAY:
+            return lambda: sim.get_actual_xray_service_time(self.xray_service_sampler, live.since, lunch_end)
+        samplers = self.doctor_samplers[patient.doctor_id]
+        if live.stage == EXAM:
+            sampler = samplers["type_a_first_exam"] if patient.needs_xray else samplers["type_b_first_exam"]
+        else:
+            sampler = samplers["type_a_second_exam"]
+        factor = self.scenario.afternoon_speedup_factor if live.since >= lunch_end else 1.0
+        return lambda: sampler() * factor
+
+def remaining_service_time(draw, elapsed):
+    # Rest of a service already `elapsed` long: a duration drawn given that it is longer.
+    for _ in range(RESIDUAL_TRIES):
+        duration = draw()
+        if duration > elapsed:
+            return duration - elapsed
+    # Far past its usual length: the service is taken to end now.
+    return 0.0
+
+# ----------- Forecasts -----------
+
+def forecast_grid(now, scenario, step=DEFAULT_STEP):
+    return np.arange(now, max(now, scenario.sim_time) + DRAIN_HORIZON + step / 2, step)
+
+def forecast_runs(seeds, snapshot, scenario, grid):
+    # Worker side: one look-ahead run per seed, returned compactly.
+    runs = []
+    for seed in seeds:
+        model = ForecastModel(snapshot, seed, scenario).run()
+        runs.append({
+            "queues": model.sample_queue_lengths(grid),
+            "doctor_waits": [(sum(model.doctor_wait_times[i]), len(model.doctor_wait_times[i]))
+                             for i in range(len(model.doctors))],
+            "xray_waits": [(sum(model.xray_room_wait_times[r]), len(model.xray_room_wait_times[r]))
+                           for r in range(len(model.xray_resources))],
+            "end_time": model.env.now,
+        })
+    return runs
+
+def summarize_forecast(snapshot, grid, runs):
+    # Queue lengths on the grid (mean and quantile band over runs), the mean wait of the
+    # services still to start (patients already waiting included, with their whole wait) and
+    # the time the clinic empties.
+    forecast = {"time": snapshot.time, "runs": len(runs), "grid": grid.tolist()}
+    for kind, waits_key in (("doctors", "doctor_waits"), ("xray_rooms", "xray_waits")):
+        queues = np.stack([run["queues"][kind] for run in runs]).astype(np.float64)
+        low, high = np.quantile(queues, FORECAST_QUANTILES, axis=0)
+        waits = np.array([run[waits_key] for run in runs], dtype=np.float64)
+        totals, counts = waits[:, :, 0].sum(axis=0), waits[:, :, 1].sum(axis=0)
+        forecast[kind] = [{
+            "queue_mean": np.round(queues[:, i].mean(axis=0), 3).tolist(),
+            "queue_low": low[i].tolist(),
+            "queue_high": high[i].tolist(),
+            "mean_wait": float(totals[i] / counts[i]) if counts[i] else float("nan"),
+            "services": float(counts[i] / len(runs)),
+        } for i in range(queues.shape[1])]
+    end_times = np.array([run["end_time"] for run in runs])
+    forecast["empty_at"] = {"mean": float(end_times.mean()), "high": float(np.quantile(end_times, FORECAST_QUANTILES[1]))}
+    return forecast
+
+def print_forecast(forecast, horizons=(30, 60, 120)):
+    latency = forecast.get("latency_seconds")
+    latency_text = f", {latency:.2f} s after the event" if latency is not None else ""
+    print(f"Forecast at t={forecast['time']:.1f} min ({forecast['runs']} runs, "
+          f"{forecast.get('compute_seconds', float('nan')):.2f} s{latency_text})")
+    grid = np.asarray(forecast["grid"])
+    columns = [(h, int(np.searchsorted(grid, forecast["time"] + h))) for h in horizons]
+    columns = [(h, i) for h, i in columns if i < len(grid)]
+    header = " | ".join(f"{'queue +' + str(h):>10}" for h, _ in columns)
+    print(f"{'Resource':<12} | {'now':>5} | {header} | {'mean wait':>9} | {'services':>8}")
+    for kind, label in (("doctors", "Dr"), ("xray_rooms", "X-ray")):
+        for r, resource in enumerate(forecast[kind]):
+            cells = " | ".join(f"{resource['queue_mean'][i]:>4.1f} [{resource['queue_low'][i]:g}-{resource['queue_high'][i]:g}]"
+                               .rjust(10) for _, i in columns)
+            print(f"{label + ' ' + str(r + 1):<12} | {resource['queue_mean'][0]:>5.1f} | {cells} | "
+                  f"{resource['mean_wait']:>9.1f} | {resource['services']:>8.1f}")
+    print(f"Clinic empty at {forecast['empty_at']['mean']:.0f} min (90%: {forecast['empty_at']['high']:.0f})\n")
+
+def write_forecast(forecast, path):
+    # Atomically, so a dashboard polling the file never reads half a forecast
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(forecast, f)
+    os.replace(tmp_path, path)
+
+# ----------- Service -----------
+
+class DigitalTwin:
+    # The asyncio side. Events are applied to the live state as they come in; the forecast
+    # loop sends a snapshot to a process pool that lives as long as the service, so a
+    # forecast costs the look-ahead runs only. Every forecast uses the same seeds, so
+    # consecutive forecasts differ by what happened in the clinic, not by sampling noise.
+    #
+    # An event arriving during a forecast waits for it and for the next one, so the run count
+    # is adapted to the measured speed of the workers: two forecasts (plus the debounce) must
+    # fit in latency_budget. It never exceeds `runs` and never drops below MIN_RUNS.
+
+    def __init__(self, scenario=sim.DEFAULT_SCENARIO, runs=DEFAULT_RUNS, workers=None, base_seed=sim.RANDOM_SEED,
+                 refresh=DEFAULT_REFRESH, debounce=DEFAULT_DEBOUNCE, step=DEFAULT_STEP,
+                 latency_budget=DEFAULT_LATENCY_BUDGET, publish=print_forecast):
+        self.state = ClinicState(scenario)
+        self.scenario = scenario
+        self.seeds = spawn_seeds(base_seed, runs)
+        self.runs = runs
+        self.latency_budget = latency_budget
+        self.workers = min(workers or os.cpu_count() or 1, runs)
+        self.refresh = refresh
+        self.debounce = debounce
+        self.step = step
+        self.publish = publish
+        self.forecast = None
+        self.rejected = 0
+        self._executor = None
+        self._changed = None
+        # Receive time of the oldest event not yet in a forecast
+        self._pending_since = None
+
+    def ingest(self, event):
+        try:
+            self.state.apply(event)
+        except (KeyError, TypeError, ValueError) as exc:
+            self.rejected += 1
+            print(f"Rejected event {event!r}: {exc}", file=sys.stderr)
+            return False
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        if self._changed is not None:
+            self._changed.set()
+        return True
+
+    def ingest_line(self, line):
+        line = line.strip()
+        if not line:
+            return False
+        try:
+            event = json.loads(line)
+        except ValueError as exc:
+            self.rejected += 1
+            print(f"Rejected line {line!r}: {exc}", file=sys.stderr)
+            return False
+        if not isinstance(event, dict):
+            self.rejected += 1
+            print(f"Rejected line {line!r}: not a JSON object", file=sys.stderr)
+            return False
+        return self.ingest(event)
+
+    async def forecast_now(self):
+        snapshot = self.state.snapshot()
+        grid = forecast_grid(snapshot.time, self.scenario, self.step)
+        loop = asyncio.get_running_loop()
+        seeds = self.seeds[:self.runs]
+        chunks = [seeds[i::self.workers] for i in range(self.workers) if seeds[i::self.workers]]
+        parts = await asyncio.gather(*(loop.run_in_executor(self._executor, forecast_runs, chunk, snapshot,
+                                                            self.scenario, grid) for chunk in chunks))
+        return summarize_forecast(snapshot, grid, [run for part in parts for run in part])
+
+    async def _update(self):
+        received, self._pending_since = self._pending_since, None
+        self._changed.clear()
+        started = time.monotonic()
+        forecast = await self.forecast_now()
+        finished = time.monotonic()
+        forecast["compute_seconds"] = finished - started
+        forecast["latency_seconds"] = finished - received if received is not None else None
+        forecast["rejected_events"] = self.rejected
+        self.forecast = forecast
+        self._fit_runs(finished - started)
+        if self.publish is not None:
+            self.publish(forecast)
+        return forecast
+
+    def _fit_runs(self, compute_seconds):
+        # Each worker ran ceil(runs / workers) look-aheads one after the other.
+        per_run = compute_seconds / -(-self.runs // self.workers)
+        allowed = (self.latency_budget - self.debounce) / 2
+        fitting = int(allowed / per_run) * self.workers if per_run > 0 else len(self.seeds)
+        self.runs = max(MIN_RUNS, min(len(self.seeds), fitting))
+
+    async def forecast_loop(self):
+        # A forecast after every burst of events, and every `refresh` seconds regardless.
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.refresh)
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                pass
+            await self._update()
+
+    async def run(self, *sources):
+        # Serves until cancelled. If every source ends (e.g. a file read without following),
+        # a last forecast is made and returned.
+        self._changed = asyncio.Event()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        forecaster = asyncio.create_task(self.forecast_loop())
+        try:
+            await asyncio.gather(*sources)
+            forecaster.cancel()
+            return await self._update()
+        finally:
+            forecaster.cancel()
+            self._executor.shutdown(cancel_futures=True)
+
+# ----------- Feed Sources -----------
+
+async def follow_file(twin, path, follow=True):
+    # Tails a JSON-lines file as it is appended to; a line is taken once it is complete.
+    with open(path, "r", encoding="utf-8") as f:
+        partial = ""
+        while True:
+            line = f.readline()
+            if line.endswith("\n"):
+                twin.ingest_line(partial + line)
+                partial = ""
+            elif line:
+                partial += line
+            elif follow:
+                await asyncio.sleep(FILE_POLL_INTERVAL)
+            else:
+                if partial:
+                    twin.ingest_line(partial)
+                return
+
+async def serve_feed(twin, host="127.0.0.1", port=None, unix_path=None):
+    # Accepts any number of local feed connections sending JSON lines.
+    async def handle(reader, writer):
+        try:
+            async for line in reader:
+                twin.ingest_line(line.decode("utf-8", errors="replace"))
+        finally:
+            writer.close()
+
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(handle, path=unix_path)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+# ----------- Stand-in Feed -----------
+# A simulated day replayed as a feed, for trying the twin without a hospital connection.
+
+class FeedSink(EventSink):
+    # Turns the model's structured events into feed events. Whether a first exam leads to an
+    # X-ray is only known from the patient's next event, so its exam_end waits for that.
+    wants_events = True
+
+    def __init__(self):
+        self.events = []
+        self._open_exams = {}
+
+    def emit(self, time, patient_id, event_code, resource_id, value):
+        event = {"t": round(float(time), 4), "patient": int(patient_id)}
+        if event_code == EV_ARRIVED:
+            event.update(event="arrival", doctor=int(resource_id), appointment=bool(value))
+        elif event_code in (EV_EXAM1_START, EV_EXAM2_START):
+            event["event"] = "exam_start"
+        elif event_code == EV_EXAM1_END:
+            self._open_exams[patient_id] = event
+            return
+        elif event_code == EV_XRAY_REQUEST or (event_code == EV_DEPARTED and patient_id in self._open_exams):
+            exam_end = self._open_exams.pop(patient_id)
+            exam_end.update(event="exam_end", xray=event_code == EV_XRAY_REQUEST)
+            event = exam_end
+        elif event_code == EV_EXAM2_END:
+            event["event"] = "exam_end"
+        elif event_code == EV_XRAY_START:
+            event.update(event="xray_start", room=int(resource_id))
+        elif event_code == EV_XRAY_END:
+            event["event"] = "xray_end"
+        else:
+            return
+        self.events.append(event)
+
+def simulated_feed(seed=sim.RANDOM_SEED, scenario=sim.DEFAULT_SCENARIO):
+    sink = FeedSink()
+    model = sim.ClinicModel(seed=seed, event_sink=sink, scenario=scenario).run()
+    bookings = [{"t": 0.0, "event": "booking", "doctor": i, "scheduled": round(s, 4)}
+                for i, schedule in enumerate(model.all_doctors_schedules) for s in schedule]
+    return bookings + sink.events
+
+async def write_feed(path, events, speed=60.0, start=0.0):
+    # Appends the events to path in clinic time, `speed` clinic minutes per wall second,
+    # skipping ahead to `start`.
+    with open(path, "a", encoding="utf-8") as f:
+        started = time.monotonic()
+        for event in events:
+            if event["t"] > start:
+                delay = (event["t"] - start) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            f.write(json.dumps(event) + "\n")
+            f.flush()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Digital twin: forecast the rest of the clinic day from a live event feed.")
+    parser.add_argument("--tail", metavar="PATH", help="Follow a JSON-lines feed file.")
+    parser.add_argument("--no-follow", action="store_true", help="Read the feed file to its end, forecast once and exit.")
+    parser.add_argument("--listen", metavar="PORT", type=int, help="Accept feed connections on 127.0.0.1:PORT.")
+    parser.add_argument("--unix", metavar="PATH", help="Accept feed connections on a unix socket.")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="Maximum look-ahead runs per forecast.")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY_BUDGET,
+                        help="Seconds from an event to its forecast; fewer runs are made on slow machines.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--refresh", type=float, default=DEFAULT_REFRESH, help="Seconds between forecasts without events.")
+    parser.add_argument("--step", type=float, default=DEFAULT_STEP, help="Forecast grid step in minutes.")
+    parser.add_argument("--out", metavar="PATH", help="Also write every forecast to this JSON file.")
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED)
+    parser.add_argument("--config", metavar="PATH", help="Clinic config file (.json, .toml, .yaml), see config.py.")
+    parser.add_argument("--write-demo-feed", metavar="PATH",
+                        help="Instead of serving, append a simulated day to PATH as a feed, in clinic time.")
+    parser.add_argument("--speed", type=float, default=60.0, help="Demo feed: clinic minutes per second.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    scenario = sim.DEFAULT_SCENARIO
+    if args.config:
+        import config
+        scenario = config.load_config(args.config)
+    if args.write_demo_feed:
+        asyncio.run(write_feed(args.write_demo_feed, simulated_feed(args.seed, scenario), args.speed))
+        sys.exit(0)
+
+    def publish(forecast):
+        print_forecast(forecast)
+        if args.out:
+            write_forecast(forecast, args.out)
+
+    twin = DigitalTwin(scenario, runs=args.runs, workers=args.workers, base_seed=args.seed,
+                       refresh=args.refresh, step=args.step, latency_budget=args.latency, publish=publish)
+    sources = []
+    if args.tail:
+        sources.append(follow_file(twin, args.tail, follow=not args.no_follow))
+    if args.listen is not None:
+        sources.append(serve_feed(twin, port=args.listen))
+    if args.unix:
+        sources.append(serve_feed(twin, unix_path=args.unix))
+    if not sources:
+        sys.exit("Give a feed: --tail PATH, --listen PORT or --unix PATH")
+    try:
+        asyncio.run(twin.run(*sources))
+    except KeyboardInterrupt:
+        pass
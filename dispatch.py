@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+
+from queue_tracking import TrackedPriorityResource
+
+# ----------- Configuration -----------
+DEFAULT_DISPATCH = "shortest_queue"
+
+# ----------- Dispatchers -----------
+# A dispatcher picks the X-ray room for each patient. Room state is kept up to date by the
+# rooms' change hooks (TrackedPriorityResource.watch), so a decision never scans all rooms.
+# A dispatcher with a pool attribute gives all rooms one shared waiting line: patients wait
+# for a unit of the pool first and are then sent to an idle room. add_room() is called after
+# a room has been appended to the rooms list mid-run (what-if branches, see checkpoint.py).
+
+class ShortestQueueDispatcher:
+    # Join the shortest queue, ties broken at random with one draw per decision. Rooms sit
+    # in buckets by queue length and the minimum moves by one step per change, so a
+    # decision costs O(k log k) for k tied rooms.
+    pool = None
+
+    def __init__(self, env, rooms, choice_sampler, expected_service):
+        self.rooms = rooms
+        self.choice_sampler = choice_sampler
+        self.lengths = [0] * len(rooms)
+        self.buckets = {0: set(range(len(rooms)))}
+        self.min_length = 0
+        for room_idx, room in enumerate(rooms):
+            room.watch(lambda room_idx=room_idx: self._room_changed(room_idx))
+
+    def _room_changed(self, room_idx):
+        # Patients only: a pending break (department clinicians) is not a longer line
+        length = self.rooms[room_idx].waiting()
+        old_length = self.lengths[room_idx]
+        if length == old_length:
+            return
+        self.lengths[room_idx] = length
+        buckets = self.buckets
+        buckets[old_length].discard(room_idx)
+        buckets.setdefault(length, set()).add(room_idx)
+        if length < self.min_length:
+            self.min_length = length
+        else:
+            while not buckets.get(self.min_length):
+                self.min_length += 1
+
+    def add_room(self):
+        room_idx = len(self.lengths)
+        self.lengths.append(0)
+        self.buckets.setdefault(0, set()).add(room_idx)
+        self.min_length = 0
+        self.rooms[room_idx].watch(lambda: self._room_changed(room_idx))
+
+    def select(self):
+        candidates = sorted(self.buckets[self.min_length])
+        return candidates[int(self.choice_sampler() * len(candidates))]
+
+class ShortestWorkloadDispatcher:
+    # Join the room expected to clear its committed work first: the expected end of the
+    # patient in service plus one expected service time per waiting patient. Idle rooms
+    # come first (longest idle first). Rooms sit in a min-heap keyed on that estimate with
+    # stale entries skipped lazily, so a decision costs O(log n).
+    pool = None
+
+    def __init__(self, env, rooms, choice_sampler, expected_service):
+        self.env = env
+        self.rooms = rooms
+        self.expected_service = expected_service
+        self.in_service = [None] * len(rooms)
+        self.service_end = [env.now] * len(rooms)
+        self.keys = [(0, env.now, room_idx) for room_idx in range(len(rooms))]
+        self.heap = list(self.keys)
+        heapq.heapify(self.heap)
+        for room_idx, room in enumerate(rooms):
+            room.watch(lambda room_idx=room_idx: self._room_changed(room_idx))
+
+    def _room_changed(self, room_idx):
+        room = self.rooms[room_idx]
+        now = self.env.now
+        current = room.users[0] if room.users else None
+        if current is not self.in_service[room_idx]:
+            self.in_service[room_idx] = current
+            self.service_end[room_idx] = now + self.expected_service(now) if current is not None else now
+        waiting = room.waiting()
+        if current is None and not waiting:
+            key = (0, self.service_end[room_idx], room_idx)
+        else:
+            key = (1, self.service_end[room_idx] + waiting * self.expected_service(now), room_idx)
+        if key != self.keys[room_idx]:
+            self.keys[room_idx] = key
+            heapq.heappush(self.heap, key)
+
+    def add_room(self):
+        room_idx = len(self.keys)
+        now = self.env.now
+        self.in_service.append(None)
+        self.service_end.append(now)
+        self.keys.append((0, now, room_idx))
+        heapq.heappush(self.heap, self.keys[room_idx])
+        self.rooms[room_idx].watch(lambda: self._room_changed(room_idx))
+
+    def select(self):
+        heap = self.heap
+        while heap[0] != self.keys[heap[0][2]]:
+            heapq.heappop(heap)
+        return heap[0][2]
+
+class PooledDispatcher:
+    # One shared line for all rooms (M/G/c): the pool has one unit per room, and a patient
+    # admitted by it takes the lowest-numbered idle room from a heap of idle rooms.
+
+    def __init__(self, env, rooms, choice_sampler, expected_service):
+        self.rooms = rooms
+        self.pool = TrackedPriorityResource(env, capacity=len(rooms))
+        self.idle = [True] * len(rooms)
+        self.idle_heap = list(range(len(rooms)))
+        for room_idx, room in enumerate(rooms):
+            room.watch(lambda room_idx=room_idx: self._room_changed(room_idx))
+
+    def _room_changed(self, room_idx):
+        room = self.rooms[room_idx]
+        idle = not room.users and not room.put_queue
+        if idle and not self.idle[room_idx]:
+            heapq.heappush(self.idle_heap, room_idx)
+        self.idle[room_idx] = idle
+
+    def add_room(self):
+        # One more unit in the shared line, which admits its first waiting patient at once
+        room_idx = len(self.idle)
+        self.idle.append(True)
+        heapq.heappush(self.idle_heap, room_idx)
+        self.rooms[room_idx].watch(lambda: self._room_changed(room_idx))
+        self.pool._capacity += 1
+        self.pool._trigger_put(None)
+
+    def select(self):
+        # A room can be taken without select() (a patient resumed in service, see
+        # digital_twin.py); its heap entry is then stale, or doubled once it frees up again.
+        idle_heap = self.idle_heap
+        while not self.idle[idle_heap[0]]:
+            heapq.heappop(idle_heap)
+        room_idx = heapq.heappop(idle_heap)
+        self.idle[room_idx] = False
+        return room_idx
+
+class RoundRobinDispatcher:
+    # Rooms in turn, regardless of their state: O(1).
+    pool = None
+
+    def __init__(self, env, rooms, choice_sampler, expected_service):
+        self.num_rooms = len(rooms)
+        self.next_room = 0
+
+    def add_room(self):
+        self.num_rooms += 1
+
+    def select(self):
+        room_idx = self.next_room
+        self.next_room = (room_idx + 1) % self.num_rooms
+        return room_idx
+
+DISPATCHERS = {
+    "shortest_queue": ShortestQueueDispatcher,
+    "shortest_workload": ShortestWorkloadDispatcher,
+    "pooled": PooledDispatcher,
+    "round_robin": RoundRobinDispatcher,
+}
+
+def build_dispatcher(policy, env, rooms, choice_sampler, expected_service):
+    # expected_service(now): expected X-ray service time of a patient starting at now.
+    if policy not in DISPATCHERS:
+        raise ValueError(f"Unknown X-ray dispatch policy '{policy}'. Choose from: {', '.join(DISPATCHERS)}")
+    return DISPATCHERS[policy](env, rooms, choice_sampler, expected_service)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+import numpy as np
+
+# ----------- Configuration -----------
+DEFAULT_COMPRESSION = 200
+# Values buffered before a t-digest folds them into its centroids
+BUFFER_FACTOR = 5
+
+# ----------- Moments -----------
+
+class RunningMoments:
+    # Welford mean/variance in constant memory. Batches are folded in with the parallel
+    # (Chan et al.) update, so partial results from workers or replications merge exactly.
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            batch_mean = float(values.mean())
+            self._combine(len(values), batch_mean, float(np.square(values - batch_mean).sum()))
+        return self
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+        return self
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.count > 1 else float("nan")
+
+# ----------- Quantiles -----------
+
+class TDigest:
+    # Merging t-digest: a sorted set of weighted centroids whose sizes follow the arcsine
+    # scale function, so centroids are tiny in the tails (accurate p99) and large in the
+    # middle. Compression is vectorized: points are sorted, each is assigned to the unit-width
+    # bucket of the scale function at its cumulative rank, and each bucket becomes one centroid.
+    # Memory stays around compression/2 centroids regardless of how many values were added.
+    __slots__ = ("compression", "means", "weights", "count", "min", "max", "_pending_means",
+                 "_pending_weights", "_pending_count")
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._pending_means = []
+        self._pending_weights = []
+        self._pending_count = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self._add(values, np.ones(len(values)), float(values.min()), float(values.max()))
+        return self
+
+    def merge(self, other):
+        other._compress()
+        if other.count:
+            self._add(other.means, other.weights, other.min, other.max)
+        return self
+
+    def _add(self, means, weights, low, high):
+        self._pending_means.append(means)
+        self._pending_weights.append(weights)
+        self._pending_count += len(means)
+        self.count += float(weights.sum())
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+        if self._pending_count >= BUFFER_FACTOR * self.compression:
+            self._compress()
+
+    def _compress(self):
+        if not self._pending_count:
+            return
+        means = np.concatenate([self.means, *self._pending_means])
+        weights = np.concatenate([self.weights, *self._pending_weights])
+        self._pending_means, self._pending_weights, self._pending_count = [], [], 0
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / cumulative[-1]
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)
+        bucket = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(weights * means, starts) / self.weights
+
+    def quantile(self, q):
+        # q in [0, 1] (scalar or array); linear interpolation between centroid centres,
+        # pinned to the exact minimum and maximum at the ends.
+        self._compress()
+        if not self.count:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else float("nan")
+        centres = np.cumsum(self.weights) - self.weights / 2
+        ranks = np.concatenate(([0.0], centres, [self.count]))
+        values = np.concatenate(([self.min], self.means, [self.max]))
+        result = np.interp(np.asarray(q, dtype=np.float64) * self.count, ranks, values)
+        return float(result) if np.ndim(result) == 0 else result
+
+    def __len__(self):
+        self._compress()
+        return len(self.means)
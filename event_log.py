@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+import numpy as np
+
+# ----------- Event Codes -----------
+EV_ARRIVED = 0
+EV_LUNCH_WAIT = 1  # no longer emitted: breaks block the doctor (MODEL_VERSION 2)
+EV_DOCTOR_REQUEST = 2
+EV_EXAM1_START = 3
+EV_EXAM1_END = 4
+EV_XRAY_REQUEST = 5
+EV_XRAY_START = 6
+EV_XRAY_END = 7
+EV_EXAM2_REQUEST = 8
+EV_EXAM2_START = 9
+EV_EXAM2_END = 10
+EV_DEPARTED = 11
+
+EVENT_NAMES = {
+    EV_ARRIVED: "arrived",
+    EV_LUNCH_WAIT: "lunch_wait",
+    EV_DOCTOR_REQUEST: "doctor_request",
+    EV_EXAM1_START: "exam1_start",
+    EV_EXAM1_END: "exam1_end",
+    EV_XRAY_REQUEST: "xray_request",
+    EV_XRAY_START: "xray_start",
+    EV_XRAY_END: "xray_end",
+    EV_EXAM2_REQUEST: "exam2_request",
+    EV_EXAM2_START: "exam2_start",
+    EV_EXAM2_END: "exam2_end",
+    EV_DEPARTED: "departed",
+}
+
+# One row per event. `value` carries the event's measurement: queue length on requests,
+# wait on *_start, service duration on *_end, time in system on departure.
+EVENT_DTYPE = np.dtype([
+    ("time", "f8"),
+    ("patient_id", "i4"),
+    ("event_code", "i1"),
+    ("resource_id", "i2"),
+    ("value", "f4"),
+])
+
+# ----------- Sinks -----------
+
+class EventSink:
+    # Base sink: the model asks once whether text and/or structured events are wanted and
+    # skips building strings or tuples entirely for the parts a sink does not consume.
+    wants_text = False
+    wants_events = False
+
+    def write(self, message):
+        pass
+
+    def emit(self, time, patient_id, event_code, resource_id, value):
+        pass
+
+    def close(self):
+        pass
+
+class ConsoleSink(EventSink):
+    wants_text = True
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def write(self, message):
+        self.stream.write(message + "\n")
+
+class ColumnarEventLog(EventSink):
+    wants_events = True
+
+    def __init__(self, chunk_size=65536):
+        self.chunk_size = chunk_size
+        self._pending = []
+        self._chunks = []
+
+    def emit(self, time, patient_id, event_code, resource_id, value):
+        pending = self._pending
+        pending.append((time, patient_id, event_code, resource_id, value))
+        if len(pending) >= self.chunk_size:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        if self._pending:
+            self._chunks.append(np.array(self._pending, dtype=EVENT_DTYPE))
+            self._pending = []
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._chunks) + len(self._pending)
+
+    def to_array(self):
+        self._flush_pending()
+        if not self._chunks:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0]
+
+    def save(self, path):
+        events = self.to_array()
+        path = str(path)
+        if path.endswith(".parquet"):
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as exc:
+                raise ImportError("Writing Parquet event logs requires pyarrow (pip install pyarrow).") from exc
+            table = pa.table({name: events[name] for name in EVENT_DTYPE.names})
+            pq.write_table(table, path)
+        else:
+            np.save(path, events)
+        return path
+
+def load_event_log(path):
+    path = str(path)
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        events = np.empty(table.num_rows, dtype=EVENT_DTYPE)
+        for name in EVENT_DTYPE.names:
+            events[name] = table.column(name).to_numpy()
+        return events
+    return np.load(path, mmap_mode="r")
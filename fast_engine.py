@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import heapq
+import math
+import time
+from array import array
+from collections import defaultdict
+
+import numpy as np
+
+import main as sim
+from dispatch import DEFAULT_DISPATCH
+import replications
+from patient_records import PatientRecords
+from queue_tracking import BREAK_PRIORITY, StepTrace
+from sampling import NATIVE, UNIT_UNIFORM, SamplerStreams
+
+# ----------- Configuration -----------
+DEFAULT_VALIDATION_REPLICATIONS = 200
+
+# Event kinds on the calendar
+ARRIVAL = 0
+BREAK_START = 1
+EXAM_END = 2
+XRAY_END = 3
+BREAK_END = 4
+
+# ----------- Fast Clinic Model -----------
+
+class FastClinicModel:
+    # The exam -> X-ray -> exam network of ClinicModel.patient() on a plain heap-based event
+    # calendar, without SimPy processes. It draws from the same per-(stream, doctor) random
+    # streams in the same order and applies the same rules (priorities, doctor breaks, afternoon
+    # speed-up, slower X-ray before lunch end, shortest-queue room choice), so a replication
+    # reproduces the SimPy run up to the order of events that fall on exactly the same instant.
+    # Patients live in parallel lists indexed by patient id instead of generator frames.
+
+    def __init__(self, seed=sim.RANDOM_SEED, scenario=sim.DEFAULT_SCENARIO, variates=NATIVE):
+        if scenario.xray_dispatch != DEFAULT_DISPATCH:
+            raise ValueError(f"The fast engine only implements '{DEFAULT_DISPATCH}' X-ray dispatch; "
+                             f"use the simpy engine for '{scenario.xray_dispatch}'.")
+        self.seed = seed
+        self.scenario = scenario
+        num_doctors = scenario.num_doctors
+        num_xray_rooms = scenario.num_xray_rooms
+        self.streams = SamplerStreams(seed, variates=variates)
+        self.doctor_samplers = [sim.build_doctor_samplers(self.streams, scenario, i) for i in range(num_doctors)]
+        self.xray_service_sampler = self.streams.sampler("xray_service", scenario.xray_service_spec())
+        self.xray_room_choice_sampler = self.streams.sampler("xray_room_choice", UNIT_UNIFORM)
+        self.appointment_only_doctor_id = self._valid_doctor_id(scenario.appointment_only_doctor_id)
+        self.walkin_only_doctor_id = self._valid_doctor_id(scenario.walkin_only_doctor_id)
+
+        self.now = 0.0
+        self.doctor_traces = [StepTrace() for _ in range(num_doctors)]
+        self.xray_traces = [StepTrace() for _ in range(num_xray_rooms)]
+        self.all_doctors_schedules = []
+
+        # ----------- Statistics Tracking (same names as ClinicModel) -----------
+        self.doctor_patient_count = [0] * num_doctors
+        self.xray_patient_count = 0
+        self.doctor_second_exam_count = [0] * num_doctors
+        self.appointment_arrival_count = 0
+        self.appointment_departure_count = 0
+        self.walk_in_arrival_count = 0
+        self.xray_referral_count = 0
+        self.expected_xray_referrals = 0.0
+        self.walk_in_departure_count = 0
+        self.total_patients_generated = 0
+        self.patients_currently_in_system = 0
+        # Calendar events and arrivals processed by run(), for throughput benchmarks
+        self.events_processed = 0
+        self.doctor_wait_times = defaultdict(list)
+        self.xray_room_wait_times = defaultdict(list)
+        self.xray_room_patient_count = [0] * num_xray_rooms
+        self.time_in_system_values = []
+        self.patient_records = PatientRecords()
+
+        # ----------- Patient Table -----------
+        self.p_doctor = []
+        self.p_priority = []
+        self.p_needs_xray = []
+        self.p_arrival = []
+        self.p_is_appointment = []
+
+    def _valid_doctor_id(self, doctor_id):
+        if doctor_id is not None and 0 <= doctor_id < self.scenario.num_doctors:
+            return doctor_id
+        return None
+
+    # ----------- Arrivals -----------
+
+    def _add_patient(self, doctor_id, arrival_time, is_appointment, needs_xray, priority):
+        self.p_doctor.append(doctor_id)
+        self.p_priority.append(priority)
+        self.p_needs_xray.append(needs_xray)
+        self.p_arrival.append(arrival_time)
+        self.p_is_appointment.append(is_appointment)
+
+    def generate_arrivals(self):
+        # Arrival times follow the SimPy generators' clock arithmetic exactly (now + delay),
+        # so equal draws give bit-identical event times.
+        scenario = self.scenario
+        walkin_cutoff_time = scenario.walkin_cutoff_time
+        sim_time = scenario.sim_time
+        for i in range(scenario.num_doctors):
+            samplers = self.doctor_samplers[i]
+            xray_probability = scenario.doctor_config(i)["xray_probability"]
+            xray_decision = samplers["xray_decision"]
+
+            schedule = []
+            if i != self.walkin_only_doctor_id and scenario.appointment_template is not None:
+                schedule = list(scenario.appointment_template.slot_times(scenario, i))
+            elif i != self.walkin_only_doctor_id:
+                appointment_interval = samplers["appointment_interval"]
+                current_scheduled_time = 0
+                while True:
+                    next_scheduled_time = current_scheduled_time + appointment_interval()
+                    if next_scheduled_time >= sim_time:
+                        break
+                    schedule.append(next_scheduled_time)
+                    current_scheduled_time = next_scheduled_time
+            self.all_doctors_schedules.append(schedule)
+
+            # Walk-ins and appointments of one doctor share the X-ray decision stream, which
+            # SimPy consumes in arrival order, so both arrival lists are merged before drawing.
+            arrivals = []
+            if i != self.appointment_only_doctor_id:
+                arrival = samplers["arrival"]
+                now = 0.0
+                while True:
+                    interarrival_time = arrival()
+                    if now + interarrival_time >= walkin_cutoff_time:
+                        break
+                    now = now + max(0, interarrival_time)
+                    if now >= walkin_cutoff_time:
+                        break
+                    arrivals.append((now, False, sim.WALKIN_PRIORITY_OFFSET + now))
+
+            punctuality = samplers["punctuality"]
+            now = 0.0
+            for scheduled_time in schedule:
+                delay = max(0, scheduled_time + punctuality()) - now
+                if delay > 0:
+                    now = now + delay
+                if now >= sim_time:
+                    continue
+                arrivals.append((now, True, scheduled_time))
+
+            arrivals.sort(key=lambda a: a[0])
+            for arrival_time, is_appointment, priority in arrivals:
+                if is_appointment:
+                    self.appointment_arrival_count += 1
+                else:
+                    self.walk_in_arrival_count += 1
+                needs_xray = xray_decision() < xray_probability
+                self.xray_referral_count += needs_xray
+                self.expected_xray_referrals += xray_probability
+                self._add_patient(i, arrival_time, is_appointment, needs_xray, priority)
+        self.total_patients_generated = len(self.p_doctor)
+
+    # ----------- Event Loop -----------
+
+    def run(self):
+        self.generate_arrivals()
+        scenario = self.scenario
+        sim_time = scenario.sim_time
+        stop_time = sim_time + scenario.max_drain_time
+        lunch_end = scenario.lunch_end
+        afternoon_speedup_factor = scenario.afternoon_speedup_factor
+        xray_morning_slowdown = sim.XRAY_MORNING_SLOWDOWN
+
+        p_doctor = self.p_doctor
+        p_priority = self.p_priority
+        p_needs_xray = self.p_needs_xray
+        p_arrival = self.p_arrival
+        p_is_appointment = self.p_is_appointment
+        num_patients = len(p_doctor)
+        p_second_exam = [False] * num_patients
+        p_room = [-1] * num_patients
+        nan = math.nan
+        p_first_wait = [nan] * num_patients
+        p_xray_wait = [nan] * num_patients
+        p_second_wait = [nan] * num_patients
+        add_record = self.patient_records.add
+
+        first_exam_samplers = [(s["type_a_first_exam"], s["type_b_first_exam"]) for s in self.doctor_samplers]
+        second_exam_samplers = [s["type_a_second_exam"] for s in self.doctor_samplers]
+        xray_service = self.xray_service_sampler
+        xray_room_choice = self.xray_room_choice_sampler
+        doctor_wait_times = [self.doctor_wait_times[i] for i in range(scenario.num_doctors)]
+        xray_room_wait_times = [self.xray_room_wait_times[r] for r in range(scenario.num_xray_rooms)]
+        doctor_patient_count = self.doctor_patient_count
+        doctor_second_exam_count = self.doctor_second_exam_count
+        xray_room_patient_count = self.xray_room_patient_count
+        time_in_system_values = self.time_in_system_values
+        # Trace points go to flat float buffers during the run and become StepTraces at the end.
+        doctor_points = [array("d") for _ in range(scenario.num_doctors)]
+        xray_points = [array("d") for _ in range(scenario.num_xray_rooms)]
+
+        # Waiting lines are heaps of (priority, request time, sequence, patient), the same
+        # ordering as SimPy's PriorityResource; busy flags stand in for the single server.
+        doctor_queues = [[] for _ in range(scenario.num_doctors)]
+        doctor_busy = [False] * scenario.num_doctors
+        # A doctor on a break is busy without a patient; a break that comes due during an
+        # exam waits at the head of the line as -1 - break index (see breaks below).
+        doctor_on_break = [False] * scenario.num_doctors
+        doctor_breaks_waiting = [0] * scenario.num_doctors
+        xray_queues = [[] for _ in range(scenario.num_xray_rooms)]
+        xray_busy = [False] * scenario.num_xray_rooms
+        room_indices = range(scenario.num_xray_rooms)
+
+        # Calendar entries are (time, sequence, kind, patient); the sequence number keeps
+        # simultaneous events in scheduling order, as SimPy's event ids do. Arrivals are known
+        # up front, so they are merged in from a sorted list instead of crowding the heap.
+        arrival_order = sorted(range(num_patients), key=p_arrival.__getitem__)
+        arrival_order.append(None)
+        next_arrival = 0
+        next_arrival_time = p_arrival[arrival_order[0]] if num_patients else math.inf
+        # Break entries carry the index into breaks in place of a patient id.
+        breaks = [(d, start, end) for d in range(scenario.num_doctors) for start, end in scenario.break_windows(d)]
+        calendar = [(start, i, BREAK_START, i) for i, (_, start, _) in enumerate(breaks)]
+        heapq.heapify(calendar)
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        seq = len(breaks)
+        in_system = 0
+        end_time = sim_time
+        completed = 0
+        processed = 0
+
+        while True:
+            if calendar and calendar[0][0] < next_arrival_time:
+                now, _, kind, pid = heappop(calendar)
+            elif next_arrival_time < math.inf:
+                now = next_arrival_time
+                kind = ARRIVAL
+                pid = arrival_order[next_arrival]
+                next_arrival += 1
+                nxt = arrival_order[next_arrival]
+                next_arrival_time = math.inf if nxt is None else p_arrival[nxt]
+            else:
+                break
+            if now > sim_time and in_system == 0:
+                break
+            if now > stop_time:
+                end_time = stop_time
+                break
+
+            processed += 1
+            if kind == BREAK_START:
+                doctor_id, _, break_end = breaks[pid]
+                if doctor_busy[doctor_id]:
+                    heappush(doctor_queues[doctor_id], (BREAK_PRIORITY, now, seq, -1 - pid))
+                    doctor_breaks_waiting[doctor_id] += 1
+                else:
+                    doctor_busy[doctor_id] = True
+                    doctor_on_break[doctor_id] = True
+                    heappush(calendar, (now + (break_end - now), seq, BREAK_END, pid))
+                seq += 1
+                continue
+            if kind == BREAK_END:
+                doctor_id = breaks[pid][0]
+                doctor_on_break[doctor_id] = False
+            else:
+                doctor_id = p_doctor[pid]
+
+            if kind == EXAM_END or kind == BREAK_END:
+                if kind == EXAM_END:
+                    second_exam = p_second_exam[pid]
+                    if second_exam:
+                        doctor_second_exam_count[doctor_id] += 1
+                    else:
+                        doctor_patient_count[doctor_id] += 1
+                # The doctor is free for the head of the line: a break (one whose window has
+                # already passed is taken and ended at once) or the next patient.
+                queue = doctor_queues[doctor_id]
+                while queue:
+                    _, request_time, _, nxt = heappop(queue)
+                    if nxt < 0:
+                        doctor_breaks_waiting[doctor_id] -= 1
+                        break_end = breaks[-1 - nxt][2]
+                        if break_end <= now:
+                            continue
+                        doctor_on_break[doctor_id] = True
+                        heappush(calendar, (now + (break_end - now), seq, BREAK_END, -1 - nxt))
+                        seq += 1
+                        if kind == EXAM_END:
+                            doctor_points[doctor_id].extend((now, len(queue) - doctor_breaks_waiting[doctor_id], 0))
+                        break
+                    wait = now - request_time
+                    doctor_wait_times[doctor_id].append(wait)
+                    if p_second_exam[nxt]:
+                        p_second_wait[nxt] = wait
+                        exam_time = second_exam_samplers[doctor_id]()
+                    else:
+                        p_first_wait[nxt] = wait
+                        exam_time = first_exam_samplers[doctor_id][0 if p_needs_xray[nxt] else 1]()
+                    if now >= lunch_end:
+                        exam_time = exam_time * afternoon_speedup_factor
+                    heappush(calendar, (now + exam_time, seq, EXAM_END, nxt))
+                    seq += 1
+                    doctor_points[doctor_id].extend((now, len(queue) - doctor_breaks_waiting[doctor_id], 1))
+                    break
+                else:
+                    doctor_busy[doctor_id] = False
+                    if kind == EXAM_END:
+                        doctor_points[doctor_id].extend((now, 0, 0))
+                if kind == BREAK_END:
+                    continue
+
+                if not second_exam and p_needs_xray[pid]:
+                    # Shortest X-ray queue, ties broken at random.
+                    room_queue_lengths = [len(q) for q in xray_queues]
+                    min_queue_len = min(room_queue_lengths)
+                    candidates = [r for r in room_indices if room_queue_lengths[r] == min_queue_len]
+                    room = candidates[int(xray_room_choice() * len(candidates))]
+                    p_room[pid] = room
+                    queue = xray_queues[room]
+                    if xray_busy[room]:
+                        heappush(queue, (p_priority[pid], now, seq, pid))
+                    else:
+                        xray_busy[room] = True
+                        xray_room_wait_times[room].append(0.0)
+                        p_xray_wait[pid] = 0.0
+                        service_time = xray_service()
+                        if now < lunch_end:
+                            service_time = service_time * xray_morning_slowdown
+                        heappush(calendar, (now + service_time, seq, XRAY_END, pid))
+                    seq += 1
+                    xray_points[room].extend((now, len(queue), 1))
+                    continue
+
+                # Departure
+                if p_is_appointment[pid]:
+                    self.appointment_departure_count += 1
+                else:
+                    self.walk_in_departure_count += 1
+                time_in_system_values.append(now - p_arrival[pid])
+                add_record(pid, doctor_id, p_is_appointment[pid], p_needs_xray[pid], p_room[pid], p_arrival[pid],
+                           p_first_wait[pid], p_xray_wait[pid], p_second_wait[pid], now - p_arrival[pid])
+                in_system -= 1
+                completed += 1
+                if in_system == 0 and now >= sim_time:
+                    end_time = now
+                    break
+                continue
+
+            if kind == XRAY_END:
+                room = p_room[pid]
+                self.xray_patient_count += 1
+                xray_room_patient_count[room] += 1
+                queue = xray_queues[room]
+                if queue:
+                    _, request_time, _, nxt = heappop(queue)
+                    xray_room_wait_times[room].append(now - request_time)
+                    p_xray_wait[nxt] = now - request_time
+                    service_time = xray_service()
+                    if now < lunch_end:
+                        service_time = service_time * xray_morning_slowdown
+                    heappush(calendar, (now + service_time, seq, XRAY_END, nxt))
+                    seq += 1
+                    xray_points[room].extend((now, len(queue), 1))
+                else:
+                    xray_busy[room] = False
+                    xray_points[room].extend((now, 0, 0))
+                p_second_exam[pid] = True
+            elif kind == ARRIVAL:
+                in_system += 1
+
+            queue = doctor_queues[doctor_id]
+            if doctor_busy[doctor_id]:
+                heappush(queue, (p_priority[pid], now, seq, pid))
+                busy = 0 if doctor_on_break[doctor_id] else 1
+            else:
+                busy = 1
+                doctor_busy[doctor_id] = True
+                doctor_wait_times[doctor_id].append(0.0)
+                if p_second_exam[pid]:
+                    p_second_wait[pid] = 0.0
+                    exam_time = second_exam_samplers[doctor_id]()
+                else:
+                    p_first_wait[pid] = 0.0
+                    exam_time = first_exam_samplers[doctor_id][0 if p_needs_xray[pid] else 1]()
+                if now >= lunch_end:
+                    exam_time = exam_time * afternoon_speedup_factor
+                heappush(calendar, (now + exam_time, seq, EXAM_END, pid))
+            seq += 1
+            doctor_points[doctor_id].extend((now, len(queue) - doctor_breaks_waiting[doctor_id], busy))
+
+        self.now = end_time
+        self.events_processed = processed
+        self.doctor_traces = [StepTrace.from_points(points) for points in doctor_points]
+        self.xray_traces = [StepTrace.from_points(points) for points in xray_points]
+        self.patients_currently_in_system = self.total_patients_generated - completed
+        return self
+
+    # ----------- Run Summary -----------
+
+    def collect_run_summary(self):
+        return sim.summarize_run(self, self.now, self.doctor_traces, self.xray_traces)
+
+    def sample_queue_lengths(self, grid):
+        return {
+            "doctors": np.array([trace.sample(grid) for trace in self.doctor_traces], dtype=np.int16),
+            "xray_rooms": np.array([trace.sample(grid) for trace in self.xray_traces], dtype=np.int16),
+        }
+
+# ----------- Validation -----------
+
+def _timed_runs(model_factory, seeds):
+    start = time.perf_counter()
+    summaries = [model_factory(seed).run().collect_run_summary() for seed in seeds]
+    return summaries, (time.perf_counter() - start) / len(seeds)
+
+def validate_against_simpy(num_replications=DEFAULT_VALIDATION_REPLICATIONS, base_seed=sim.RANDOM_SEED,
+                           scenario=sim.DEFAULT_SCENARIO):
+    # Runs both engines on the same seeds and compares them replication by replication
+    # (exact agreement) and metric by metric (Welch t statistic of the difference in means).
+    seeds = replications.spawn_seeds(base_seed, num_replications)
+    simpy_runs, simpy_seconds = _timed_runs(lambda s: sim.ClinicModel(seed=s, scenario=scenario), seeds)
+    fast_runs, fast_seconds = _timed_runs(lambda s: FastClinicModel(seed=s, scenario=scenario), seeds)
+
+    identical = sum(1 for a, b in zip(simpy_runs, fast_runs)
+                    if all(a[k] == b[k] or (math.isnan(a[k]) and math.isnan(b[k])) for k in a))
+    metrics = {}
+    for name in simpy_runs[0]:
+        a = np.array([s[name] for s in simpy_runs], dtype=float)
+        b = np.array([s[name] for s in fast_runs], dtype=float)
+        a, b = a[~np.isnan(a)], b[~np.isnan(b)]
+        se = math.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b)) if len(a) > 1 and len(b) > 1 else 0.0
+        diff = float(b.mean() - a.mean()) if len(a) and len(b) else float("nan")
+        metrics[name] = {"simpy_mean": float(a.mean()) if len(a) else float("nan"),
+                         "fast_mean": float(b.mean()) if len(b) else float("nan"),
+                         "t": diff / se if se > 0 else 0.0}
+    return {
+        "replications": num_replications,
+        "identical_replications": identical,
+        "simpy_seconds_per_replication": simpy_seconds,
+        "fast_seconds_per_replication": fast_seconds,
+        "speedup": simpy_seconds / fast_seconds,
+        "metrics": metrics,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Validate the fast engine against the SimPy model.")
+    parser.add_argument("-n", "--replications", type=int, default=DEFAULT_VALIDATION_REPLICATIONS)
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = validate_against_simpy(args.replications, base_seed=args.seed)
+    print(f"Replications: {report['replications']}, identical to SimPy: {report['identical_replications']}")
+    print(f"Per replication: SimPy {report['simpy_seconds_per_replication'] * 1000:.2f} ms, "
+          f"fast {report['fast_seconds_per_replication'] * 1000:.2f} ms ({report['speedup']:.1f}x)")
+    print(f"{'Metric':<24} | {'SimPy mean':>10} | {'Fast mean':>10} | {'t':>6}")
+    print("-" * 60)
+    for name, stats in report["metrics"].items():
+        flag = "  <-- check" if abs(stats["t"]) > 3 else ""
+        print(f"{name:<24} | {stats['simpy_mean']:>10.3f} | {stats['fast_mean']:>10.3f} | {stats['t']:>6.2f}{flag}")
@@ -1,12 +1,23 @@
 # -*- coding: utf-8 -*-
 
 import simpy
-import random
-import matplotlib.pyplot as plt
 import numpy as np
 from collections import defaultdict
 import sys
 import datetime
+from contextlib import nullcontext
+from dataclasses import dataclass, fields, replace
+from typing import Optional
+
+from dispatch import DEFAULT_DISPATCH, DISPATCHERS, build_dispatcher
+from event_log import (
+    ConsoleSink, EV_ARRIVED, EV_DOCTOR_REQUEST, EV_EXAM1_START, EV_EXAM1_END,
+    EV_XRAY_REQUEST, EV_XRAY_START, EV_XRAY_END, EV_EXAM2_REQUEST, EV_EXAM2_START, EV_EXAM2_END,
+    EV_DEPARTED,
+)
+from patient_records import PatientRecords, WaitStatistics, print_wait_statistics
+from queue_tracking import TrackedPriorityResource
+from sampling import NATIVE, Exponential, Gamma, Uniform, UNIT_UNIFORM, SamplerStreams
 
 sys.setrecursionlimit(2000)
 
@@ -18,13 +29,19 @@ LUNCH_END = 300
 NUM_DOCTORS = 7
 NUM_XRAY_ROOMS = 2
 RANDOM_SEED = 42
-QUEUE_TRACK_INTERVAL = 1
+# Bump whenever a change alters simulated outcomes or the run summary (invalidates cached results)
+MODEL_VERSION = 4
 AFTERNOON_SPEEDUP_FACTOR = 0.85
+# X-ray exams starting before the end of lunch take this much longer
+XRAY_MORNING_SLOWDOWN = 1.25
 
 # --- Uniform distribution parameters for appointment punctuality ---
 UNIFORM_MIN_DEVIATION_MINUTES = -5
 UNIFORM_MAX_DEVIATION_MINUTES = 10
 
+# Longest drain phase after SIM_TIME before a run is force-stopped
+MAX_DRAIN_TIME = 3 * SIM_TIME
+
 # Large offset to separate walk-in priority from appointment priority
 WALKIN_PRIORITY_OFFSET = SIM_TIME * 1000
 
@@ -32,566 +49,817 @@ WALKIN_PRIORITY_OFFSET = SIM_TIME * 1000
 APPOINTMENT_ONLY_DOCTOR_ID = 0
 WALKIN_ONLY_DOCTOR_ID = 1
 
-random.seed(RANDOM_SEED)
+@dataclass(frozen=True)
+class DoctorProfile:
+    # Distribution specs of one doctor, sampled through per-doctor streams in sampling.py
+    arrival: Exponential
+    type_a_first_exam: Gamma
+    type_b_first_exam: Gamma
+    type_a_second_exam: Gamma
+    appointment_interval: Uniform
+    xray_probability: float
 
-xray_resources = []
-doctors = []
+    def as_config(self):
+        return {f.name: getattr(self, f.name) for f in fields(self)}
 
-# Doctor configurations
+# Doctor configurations (configs/default.json holds the same values as a config file)
 doctor_configs = [
-    {  # Doctor 1 (ID 0)
-        "arrival": lambda: random.expovariate(1 / 10),
-        "type_a_first_exam": lambda: max(random.gammavariate(1.15, 2.41), 0.25),
-        "type_b_first_exam": lambda: max(random.gammavariate(0.80, 4.71), 0.70),
-        "type_a_second_exam": lambda: max(random.gammavariate(2.3, 1.5), 0.25),
-        "appointment_interval": lambda: max(random.uniform(9, 15), 10),
-        "xray_probability": 0.76
-    },
-    {  # Doctor 2 (ID 1)
-        "arrival": lambda: random.expovariate(1 / 12),
-        "type_a_first_exam": lambda: max(random.gammavariate(3, 1), 0.5),
-        "type_b_first_exam": lambda: max(random.gammavariate(3, 1), 0.5),
-        "type_a_second_exam": lambda: max(random.gammavariate(4, 1), 0.5),
-        "appointment_interval": lambda: max(random.uniform(13, 17), 1),
-        "xray_probability": 0.80
-    },
-    {  # Doctor 3 (ID 2)
-        "arrival": lambda: random.expovariate(1 / 12),
-        "type_a_first_exam": lambda: max(random.gammavariate(2, 1), 0.5),
-        "type_b_first_exam": lambda: max(random.gammavariate(4, 1), 0.5),
-        "type_a_second_exam": lambda: max(random.gammavariate(6, 1), 0.5),
-        "appointment_interval": lambda: max(random.uniform(11, 15), 1),
-        "xray_probability": 0.78
-    },
-    {  # Doctor 4 (ID 3)
-        "arrival": lambda: random.expovariate(1 / 11),
-        "type_a_first_exam": lambda: max(random.gammavariate(2, 1), 0.5),
-        "type_b_first_exam": lambda: max(random.gammavariate(3, 1), 0.5),
-        "type_a_second_exam": lambda: max(random.gammavariate(4, 1), 0.5),
-        "appointment_interval": lambda: max(random.uniform(8, 12), 1),
-        "xray_probability": 0.60
-    },
-    {  # Doctor 5 (ID 4)
-        "arrival": lambda: random.expovariate(1 / 13),
-        "type_a_first_exam": lambda: max(random.gammavariate(2, 1), 0.5),
-        "type_b_first_exam": lambda: max(random.gammavariate(3, 1), 0.5),
-        "type_a_second_exam": lambda: max(random.gammavariate(5, 1), 0.5),
-        "appointment_interval": lambda: max(random.uniform(9, 13), 1),
-        "xray_probability": 0.65
-    },
-    {  # Doctor 6 (ID 5)
-        "arrival": lambda: random.expovariate(1 / 10),
-        "type_a_first_exam": lambda: max(random.gammavariate(2, 1), 0.5),
-        "type_b_first_exam": lambda: max(random.gammavariate(5, 1), 0.5),
-        "type_a_second_exam": lambda: max(random.gammavariate(2, 1), 0.5),
-        "appointment_interval": lambda: max(random.uniform(11, 17), 1),
-        "xray_probability": 0.90
-    },
-    {  # Doctor 7 (ID 6)
-        "arrival": lambda: random.expovariate(1 / 14),
-        "type_a_first_exam": lambda: max(random.gammavariate(2, 1), 0.5),
-        "type_b_first_exam": lambda: max(random.gammavariate(5, 1), 0.5),
-        "type_a_second_exam": lambda: max(random.gammavariate(3, 1), 0.5),
-        "appointment_interval": lambda: max(random.uniform(10, 16), 1),
-        "xray_probability": 0.87
-    }
+    DoctorProfile(  # Doctor 1 (ID 0)
+        arrival=Exponential(mean=10),
+        type_a_first_exam=Gamma(1.15, 2.41, floor=0.25),
+        type_b_first_exam=Gamma(0.80, 4.71, floor=0.70),
+        type_a_second_exam=Gamma(2.3, 1.5, floor=0.25),
+        appointment_interval=Uniform(9, 15, floor=10),
+        xray_probability=0.76
+    ),
+    DoctorProfile(  # Doctor 2 (ID 1)
+        arrival=Exponential(mean=12),
+        type_a_first_exam=Gamma(3, 1, floor=0.5),
+        type_b_first_exam=Gamma(3, 1, floor=0.5),
+        type_a_second_exam=Gamma(4, 1, floor=0.5),
+        appointment_interval=Uniform(13, 17, floor=1),
+        xray_probability=0.80
+    ),
+    DoctorProfile(  # Doctor 3 (ID 2)
+        arrival=Exponential(mean=12),
+        type_a_first_exam=Gamma(2, 1, floor=0.5),
+        type_b_first_exam=Gamma(4, 1, floor=0.5),
+        type_a_second_exam=Gamma(6, 1, floor=0.5),
+        appointment_interval=Uniform(11, 15, floor=1),
+        xray_probability=0.78
+    ),
+    DoctorProfile(  # Doctor 4 (ID 3)
+        arrival=Exponential(mean=11),
+        type_a_first_exam=Gamma(2, 1, floor=0.5),
+        type_b_first_exam=Gamma(3, 1, floor=0.5),
+        type_a_second_exam=Gamma(4, 1, floor=0.5),
+        appointment_interval=Uniform(8, 12, floor=1),
+        xray_probability=0.60
+    ),
+    DoctorProfile(  # Doctor 5 (ID 4)
+        arrival=Exponential(mean=13),
+        type_a_first_exam=Gamma(2, 1, floor=0.5),
+        type_b_first_exam=Gamma(3, 1, floor=0.5),
+        type_a_second_exam=Gamma(5, 1, floor=0.5),
+        appointment_interval=Uniform(9, 13, floor=1),
+        xray_probability=0.65
+    ),
+    DoctorProfile(  # Doctor 6 (ID 5)
+        arrival=Exponential(mean=10),
+        type_a_first_exam=Gamma(2, 1, floor=0.5),
+        type_b_first_exam=Gamma(5, 1, floor=0.5),
+        type_a_second_exam=Gamma(2, 1, floor=0.5),
+        appointment_interval=Uniform(11, 17, floor=1),
+        xray_probability=0.90
+    ),
+    DoctorProfile(  # Doctor 7 (ID 6)
+        arrival=Exponential(mean=14),
+        type_a_first_exam=Gamma(2, 1, floor=0.5),
+        type_b_first_exam=Gamma(5, 1, floor=0.5),
+        type_a_second_exam=Gamma(3, 1, floor=0.5),
+        appointment_interval=Uniform(10, 16, floor=1),
+        xray_probability=0.87
+    ),
 ]
 
-base_xray_service_time = lambda: max(random.gammavariate(1.25, 1.9), 1)
+base_xray_service_time = Gamma(1.25, 1.9, floor=1)
 
-def get_actual_xray_service_time(env_now_time):
-    service_time = base_xray_service_time()
-    if env_now_time < LUNCH_END:
-        return service_time * 1.25
+def get_actual_xray_service_time(xray_service_sampler, env_now_time, lunch_end=LUNCH_END):
+    service_time = xray_service_sampler()
+    if env_now_time < lunch_end:
+        return service_time * XRAY_MORNING_SLOWDOWN
     else:
         return service_time
 
-# ----------- Statistics Tracking -----------
-queue_lengths = defaultdict(list)
-xray_room_queue_lengths = defaultdict(list)
-timestamps = []
-doctor_patient_count = [0] * NUM_DOCTORS
-xray_patient_count = 0
-doctor_second_exam_count = [0] * NUM_DOCTORS
-appointment_arrival_count = 0
-appointment_departure_count = 0
-walk_in_arrival_count = 0
-walk_in_departure_count = 0
-total_patients_generated = 0
-patients_currently_in_system = 0
-appointment_actual_arrival_times = defaultdict(list)
-appointment_scheduled_times = defaultdict(list)
-
-# ----------- Doctor Lunch State -----------
-doctor_is_on_lunch_break = [False] * NUM_DOCTORS
-
-# ----------- Simulation Processes -----------
-
-def manage_doctor_lunch_state(env, doctor_id):
-    global doctor_is_on_lunch_break
-    yield env.timeout(max(0, LUNCH_START - env.now))
-    print(f"--- {env.now:.2f} - Dr {doctor_id+1} LUNCH BREAK PERIOD STARTED (will finish current patient) ---")
-    doctor_is_on_lunch_break[doctor_id] = True
-    yield env.timeout(max(0, LUNCH_END - env.now))
-    print(f"--- {env.now:.2f} - Dr {doctor_id+1} LUNCH BREAK PERIOD ENDED (back to service) ---")
-    doctor_is_on_lunch_break[doctor_id] = False
-
-def patient(env, name, doctor_id, doctor_resource, is_appointment, needs_xray,
-            actual_arrival_time, scheduled_arrival_time_for_priority=None):
-    global doctor_patient_count, xray_patient_count, doctor_second_exam_count
-    global appointment_departure_count, walk_in_departure_count
-    global patients_currently_in_system, doctor_is_on_lunch_break
-    global xray_resources
-
-    if is_appointment:
-        request_priority = scheduled_arrival_time_for_priority
-        type_str_detail = f"Sched@{scheduled_arrival_time_for_priority:.2f}"
-    else:
-        request_priority = WALKIN_PRIORITY_OFFSET + actual_arrival_time
-        type_str_detail = "Walk-in"
-
-    type_str_base = f"{'Appointment' if is_appointment else 'Walk-in'} Type-{'A' if needs_xray else 'B'}"
-    print(f"{actual_arrival_time:.2f} - {name} ({type_str_base}, {type_str_detail}) ARRIVED for Dr {doctor_id+1}.")
-
-    try:
-        # First Examination
-        if doctor_is_on_lunch_break[doctor_id] and LUNCH_START <= env.now < LUNCH_END:
-            if actual_arrival_time < LUNCH_END:
-                wait_duration = LUNCH_END - env.now
-                if wait_duration > 0:
-                    print(f"{env.now:.2f} - {name} waiting until lunch ends ({LUNCH_END:.2f}) for Dr {doctor_id+1} (before 1st exam). Remaining: {wait_duration:.2f} min.")
-                    yield env.timeout(wait_duration)
-                    print(f"{env.now:.2f} - {name} continues after lunch for Dr {doctor_id+1} (1st exam).")
-
-        print(f"{env.now:.2f} - {name} requests Dr {doctor_id+1} (Prio: {request_priority:.2f}). Queue: {len(doctor_resource.queue)}")
-        start_wait_doc1 = env.now
-        with doctor_resource.request(priority=request_priority) as req:
-            yield req
-            wait_time_doc1 = env.now - start_wait_doc1
-            print(f"{env.now:.2f} - {name} 1st EXAM STARTED with Dr {doctor_id+1}. Wait: {wait_time_doc1:.2f} min. (Req Prio: {request_priority:.2f})")
-
-            service_start_time_doc1 = env.now
-            base_exam_time = doctor_configs[doctor_id]["type_a_first_exam"]() if needs_xray else doctor_configs[doctor_id]["type_b_first_exam"]()
-            exam_time = base_exam_time
-            speed_up_applied_doc1 = False
-            if service_start_time_doc1 >= LUNCH_END:
-                exam_time = base_exam_time * AFTERNOON_SPEEDUP_FACTOR
-                speed_up_applied_doc1 = True
-
-            yield env.timeout(exam_time)
-            doctor_patient_count[doctor_id] += 1
-            print(f"{env.now:.2f} - {name} 1st EXAM ENDED with Dr {doctor_id+1} (Duration: {exam_time:.2f} min {'[Sped up]' if speed_up_applied_doc1 else ''}).")
-
-        # X-ray Process
-        if needs_xray:
-            xray_priority = request_priority
-            print(f"{env.now:.2f} - {name} looking for an available X-ray room (Prio: {xray_priority:.2f}).")
-
-            room_queue_lengths = [len(xr.queue) for xr in xray_resources]
-            min_queue_len = min(room_queue_lengths)
-            candidate_room_indices = [i for i, q_len in enumerate(room_queue_lengths) if q_len == min_queue_len]
-            selected_xray_room_idx = random.choice(candidate_room_indices)
-            chosen_xray_resource = xray_resources[selected_xray_room_idx]
-
-            print(f"{env.now:.2f} - {name} requests X-ray Room {selected_xray_room_idx+1}. Room queue: {len(chosen_xray_resource.queue)}")
-            start_wait_xray = env.now
-            with chosen_xray_resource.request(priority=xray_priority) as req_xray:
-                yield req_xray
-                wait_time_xray = env.now - start_wait_xray
-                print(f"{env.now:.2f} - {name} X-ray STARTED in Room {selected_xray_room_idx+1}. Wait: {wait_time_xray:.2f} min.")
-
-                xray_time_val = get_actual_xray_service_time(env.now)
-                yield env.timeout(xray_time_val)
-                xray_patient_count += 1
-                print(f"{env.now:.2f} - {name} X-ray ENDED in Room {selected_xray_room_idx+1} (Duration: {xray_time_val:.2f} min).")
-
-            # Second Examination
-            second_exam_priority = request_priority
-            if doctor_is_on_lunch_break[doctor_id] and LUNCH_START <= env.now < LUNCH_END:
-                if actual_arrival_time < LUNCH_END:
-                    wait_duration_doc2 = LUNCH_END - env.now
-                    if wait_duration_doc2 > 0:
-                        print(f"{env.now:.2f} - {name} waiting until lunch ends ({LUNCH_END:.2f}) for Dr {doctor_id+1} (before 2nd exam). Remaining: {wait_duration_doc2:.2f} min.")
-                        yield env.timeout(wait_duration_doc2)
-                        print(f"{env.now:.2f} - {name} continues after lunch for Dr {doctor_id+1} (2nd exam).")
-
-            print(f"{env.now:.2f} - {name} requests Dr {doctor_id+1} for 2nd exam (Prio: {second_exam_priority:.2f}). Queue: {len(doctor_resource.queue)}")
-            start_wait_doc2 = env.now
-            with doctor_resource.request(priority=second_exam_priority) as req_doc2:
-                yield req_doc2
-                wait_time_doc2 = env.now - start_wait_doc2
-                print(f"{env.now:.2f} - {name} 2nd EXAM STARTED with Dr {doctor_id+1}. Wait: {wait_time_doc2:.2f} min.")
-
-                service_start_time_doc2 = env.now
-                base_second_exam_time = doctor_configs[doctor_id]["type_a_second_exam"]()
-                second_exam_time = base_second_exam_time
-                speed_up_applied_doc2 = False
-                if service_start_time_doc2 >= LUNCH_END:
-                    second_exam_time = base_second_exam_time * AFTERNOON_SPEEDUP_FACTOR
-                    speed_up_applied_doc2 = True
-
-                yield env.timeout(second_exam_time)
-                doctor_second_exam_count[doctor_id] += 1
-                print(f"{env.now:.2f} - {name} 2nd EXAM ENDED with Dr {doctor_id+1} (Duration: {second_exam_time:.2f} min {'[Sped up]' if speed_up_applied_doc2 else ''}).")
-
-        # Departure
-        departure_time = env.now
+# ----------- Scenario -----------
+
+@dataclass(frozen=True)
+class Scenario:
+    # Policy knobs of one run; defaults are the module-level configuration above.
+    num_doctors: int = NUM_DOCTORS
+    num_xray_rooms: int = NUM_XRAY_ROOMS
+    appointment_only_doctor_id: Optional[int] = APPOINTMENT_ONLY_DOCTOR_ID
+    walkin_only_doctor_id: Optional[int] = WALKIN_ONLY_DOCTOR_ID
+    sim_time: float = SIM_TIME
+    walkin_cutoff_time: float = WALKIN_CUTOFF_TIME
+    lunch_start: float = LUNCH_START
+    lunch_end: float = LUNCH_END
+    afternoon_speedup_factor: float = AFTERNOON_SPEEDUP_FACTOR
+    punctuality_min: float = UNIFORM_MIN_DEVIATION_MINUTES
+    punctuality_max: float = UNIFORM_MAX_DEVIATION_MINUTES
+    max_drain_time: float = MAX_DRAIN_TIME
+    # Multiplies every doctor's walk-in arrival rate (2.0 = twice as many walk-ins)
+    arrival_rate_factor: float = 1.0
+    # X-ray room dispatch policy, see dispatch.DISPATCHERS
+    xray_dispatch: str = DEFAULT_DISPATCH
+    # Deterministic appointment slot template (see schedule_optimizer.py); None draws random
+    # slot intervals from each doctor's appointment_interval
+    appointment_template: Optional[object] = None
+    # Doctor profiles and X-ray service time loaded from a config file (see config.py); None
+    # uses doctor_configs and base_xray_service_time above
+    doctor_profiles: Optional[tuple] = None
+    xray_service_time: Optional[object] = None
+    # Per-doctor off-duty timetables, reused cyclically like the profiles: each entry is a
+    # tuple of (start, end) windows in minutes of the day, or None for the lunch break above.
+    # A late start is a window from 0, an early finish one up to the end of the drain phase.
+    doctor_breaks: Optional[tuple] = None
+
+    def doctor_config(self, doctor_id):
+        # Departments larger than the configured profiles reuse them cyclically.
+        profiles = self.doctor_profiles or doctor_configs
+        config = profiles[doctor_id % len(profiles)].as_config()
+        if self.arrival_rate_factor != 1.0:
+            config = {**config, "arrival": replace(config["arrival"], mean=config["arrival"].mean / self.arrival_rate_factor)}
+        return config
+
+    def xray_service_spec(self):
+        return base_xray_service_time if self.xray_service_time is None else self.xray_service_time
+
+    def break_windows(self, doctor_id):
+        windows = None
+        if self.doctor_breaks:
+            windows = self.doctor_breaks[doctor_id % len(self.doctor_breaks)]
+        if windows is None:
+            windows = ((self.lunch_start, self.lunch_end),)
+        windows = sorted((float(start), float(end)) for start, end in windows)
+        for (start, end), following in zip(windows, windows[1:] + [None]):
+            if not 0 <= start < end or (following is not None and following[0] < end):
+                raise ValueError(f"Dr {doctor_id+1}: break windows must be non-overlapping (start, end) pairs with 0 <= start < end, got {windows}")
+        return tuple(windows)
+
+    def replace(self, **changes):
+        return replace(self, **changes)
+
+DEFAULT_SCENARIO = Scenario()
+
+# ----------- Patient Record -----------
+
+# Stages of a visit, in order; a patient resumed mid-visit starts at its stage
+STAGE_FIRST_EXAM, STAGE_XRAY, STAGE_SECOND_EXAM, STAGE_DEPARTURE = 0, 1, 2, 3
+
+class Patient:
+    __slots__ = ("pid", "index", "doctor_id", "is_appointment", "needs_xray",
+                 "arrival_time", "scheduled_time", "priority", "stage", "wait_start")
+
+    def __init__(self, pid, index, doctor_id, is_appointment, needs_xray, arrival_time, scheduled_time=None):
+        self.pid = pid
+        self.index = index
+        self.doctor_id = doctor_id
+        self.is_appointment = is_appointment
+        self.needs_xray = needs_xray
+        self.arrival_time = arrival_time
+        self.scheduled_time = scheduled_time
+        # Appointments are prioritized by scheduled time, walk-ins always come after them.
         if is_appointment:
-            appointment_departure_count += 1
+            self.priority = scheduled_time
         else:
-            walk_in_departure_count += 1
-        print(f"{departure_time:.2f} - {name} DEPARTED. Time in system: {departure_time - actual_arrival_time:.2f} min.")
-    finally:
-        patients_currently_in_system -= 1
-        if patients_currently_in_system < 0:
-            print(f"!!!! ERROR !!!! Patient counter dropped below zero at {env.now:.2f} for {name}!")
-            patients_currently_in_system = 0
-
-def patient_generator(env, doctor_id, doctor_resource):
-    global total_patients_generated, walk_in_arrival_count, patients_currently_in_system
-
-    if APPOINTMENT_ONLY_DOCTOR_ID is not None and doctor_id == APPOINTMENT_ONLY_DOCTOR_ID:
-        print(f"--- Dr {doctor_id+1} is APPOINTMENT-ONLY, so walk-in generator is not started for this doctor. ---")
-        return
-
-    patient_idx_walkin = 0
-    while True:
-        interarrival_time = doctor_configs[doctor_id]["arrival"]()
-        potential_next_arrival = env.now + interarrival_time
-        if potential_next_arrival >= WALKIN_CUTOFF_TIME:
-            print(f"{env.now:.2f} - Dr {doctor_id+1} walk-in generator STOPPING. Next arrival ({potential_next_arrival:.2f}) would exceed cutoff ({WALKIN_CUTOFF_TIME}).")
-            break
-        yield env.timeout(max(0, interarrival_time))
-        actual_arrival_time = env.now
-        if actual_arrival_time >= WALKIN_CUTOFF_TIME:
-            break
-
-        patient_idx_walkin += 1
-        total_patients_generated += 1
-        walk_in_arrival_count += 1
-        patients_currently_in_system += 1
-        is_xray_needed = random.random() < doctor_configs[doctor_id]["xray_probability"]
-        patient_name = f"Patient-WI-{doctor_id+1}-{patient_idx_walkin}"
-        env.process(patient(env, patient_name, doctor_id, doctor_resource, False, is_xray_needed,
-                            actual_arrival_time, scheduled_arrival_time_for_priority=None))
-
-def appointment_generator(env, doctor_id, doctor_resource, scheduled_times_for_this_doctor):
-    global total_patients_generated, appointment_arrival_count, patients_currently_in_system
-    global appointment_actual_arrival_times
-
-    if WALKIN_ONLY_DOCTOR_ID is not None and doctor_id == WALKIN_ONLY_DOCTOR_ID:
-        print(f"--- Dr {doctor_id+1} is WALK-IN-ONLY, so appointment generator is not started for this doctor. ---")
-        return
-
-    patient_idx_appt = 0
-    for scheduled_time in scheduled_times_for_this_doctor:
-        patient_idx_appt += 1
-        punctuality_deviation = random.uniform(UNIFORM_MIN_DEVIATION_MINUTES, UNIFORM_MAX_DEVIATION_MINUTES)
-        actual_arrival_time_candidate = max(0, scheduled_time + punctuality_deviation)
-
-        delay_until_actual_arrival = actual_arrival_time_candidate - env.now
-        if delay_until_actual_arrival > 0:
-            yield env.timeout(delay_until_actual_arrival)
-
-        current_actual_arrival_time = env.now
-        if current_actual_arrival_time >= SIM_TIME:
-            continue
-
-        appointment_actual_arrival_times[doctor_id].append(current_actual_arrival_time)
-        total_patients_generated += 1
-        appointment_arrival_count += 1
-        patients_currently_in_system += 1
-        is_xray_needed = random.random() < doctor_configs[doctor_id]["xray_probability"]
-        patient_name = f"Patient-AP-{doctor_id+1}-{patient_idx_appt}"
-        env.process(patient(env, patient_name, doctor_id, doctor_resource, True, is_xray_needed,
-                            current_actual_arrival_time, scheduled_arrival_time_for_priority=scheduled_time))
-
-def track_queues(env, doctors_list, stop_event_tracker):
-    global timestamps, xray_resources, xray_room_queue_lengths
-    while not stop_event_tracker.triggered:
-        current_time_track = env.now
-        timestamps.append(current_time_track)
-        for i, d_res in enumerate(doctors_list):
-            queue_lengths[i].append(len(d_res.queue))
-
-        for room_idx in range(NUM_XRAY_ROOMS):
-            xray_room_queue_lengths[room_idx].append(len(xray_resources[room_idx].queue))
-
-        start_wait_track = env.now
-        timeout_duration = QUEUE_TRACK_INTERVAL
-        while timeout_duration > 0 and not stop_event_tracker.triggered:
-            yield env.timeout(min(timeout_duration, 0.5))
-            timeout_duration = QUEUE_TRACK_INTERVAL - (env.now - start_wait_track)
-
-    current_time_track = env.now
-    timestamps.append(current_time_track)
-    for i, d_res in enumerate(doctors_list):
-        queue_lengths[i].append(len(d_res.queue))
-    for room_idx in range(NUM_XRAY_ROOMS):
-        xray_room_queue_lengths[room_idx].append(len(xray_resources[room_idx].queue))
-    print(f"{env.now:.2f} - Queue tracking stopped.")
-
-def simulation_ender(env, stop_event_obj, doctors_list_for_check):
-    global xray_resources
-    if env.now < SIM_TIME:
-        yield env.timeout(SIM_TIME - env.now)
-
-    print(f"--- {env.now:.2f} - APPOINTMENT CUTOFF ({SIM_TIME} min) reached. Walk-ins stopped at {WALKIN_CUTOFF_TIME} min. Existing patients are finishing. ---")
-
-    check_interval = 2
-    while True:
-        if patients_currently_in_system <= 0:
-            all_doc_queues_empty = all(len(d.queue) == 0 for d in doctors_list_for_check)
-            all_doc_resources_free = all(d.count == 0 for d in doctors_list_for_check)
-
-            all_xray_queues_empty = all(len(xr.queue) == 0 for xr in xray_resources)
-            all_xray_resources_free = all(xr.count == 0 for xr in xray_resources)
-
-            if all_doc_queues_empty and all_doc_resources_free and all_xray_queues_empty and all_xray_resources_free:
-                print(f"--- {env.now:.2f} - SYSTEM EMPTY (PatientCounter={patients_currently_in_system}, all queues/resources empty). Stopping simulation. ---")
-                if not stop_event_obj.triggered:
-                    stop_event_obj.succeed()
-                break
+            self.priority = WALKIN_PRIORITY_OFFSET + arrival_time
+        self.stage = STAGE_FIRST_EXAM
+        self.wait_start = None
+
+    @property
+    def name(self):
+        return f"Patient-{'AP' if self.is_appointment else 'WI'}-{self.doctor_id+1}-{self.index}"
+
+# ----------- Random Streams -----------
+
+def build_doctor_samplers(streams, scenario, doctor_id):
+    config = scenario.doctor_config(doctor_id)
+    samplers = {name: streams.sampler(name, config[name], doctor_id)
+                for name in ("arrival", "type_a_first_exam", "type_b_first_exam",
+                             "type_a_second_exam", "appointment_interval")}
+    punctuality = Uniform(scenario.punctuality_min, scenario.punctuality_max)
+    samplers["punctuality"] = streams.sampler("punctuality", punctuality, doctor_id)
+    samplers["xray_decision"] = streams.sampler("xray_decision", UNIT_UNIFORM, doctor_id)
+    return samplers
+
+# ----------- Clinic Model -----------
+
+class ClinicModel:
+    # One self-contained simulation run: environment, resources, random streams and statistics.
+    # Without an event sink nothing is logged and no log message is ever formatted.
+    # variates selects native or inverse-transform (optionally antithetic) sampling, see sampling.py.
+    # start_time starts the clock later in the day, for runs resumed from a live state.
+
+    def __init__(self, seed=RANDOM_SEED, event_sink=None, scenario=DEFAULT_SCENARIO, variates=NATIVE,
+                 start_time=0.0):
+        self.seed = seed
+        self.scenario = scenario
+        num_doctors = scenario.num_doctors
+        num_xray_rooms = scenario.num_xray_rooms
+        self.streams = SamplerStreams(seed, variates=variates)
+        self.doctor_samplers = [build_doctor_samplers(self.streams, scenario, i) for i in range(num_doctors)]
+        self.xray_service_sampler = self.streams.sampler("xray_service", scenario.xray_service_spec())
+        self.xray_room_choice_sampler = self.streams.sampler("xray_room_choice", UNIT_UNIFORM)
+        self.event_sink = event_sink
+        self._log = event_sink.write if event_sink is not None and event_sink.wants_text else None
+        self._emit = event_sink.emit if event_sink is not None and event_sink.wants_events else None
+        self.appointment_only_doctor_id = scenario.appointment_only_doctor_id
+        self.walkin_only_doctor_id = scenario.walkin_only_doctor_id
+        self._roles_validated = False
+
+        self.env = simpy.Environment(start_time)
+        self.stop_event = self.env.event()
+        self.system_empty_event = None
+        # Queue traces are recorded by the resources themselves whenever a queue changes.
+        self.doctors = [TrackedPriorityResource(self.env, capacity=1) for _ in range(num_doctors)]
+        self.xray_resources = [TrackedPriorityResource(self.env, capacity=1) for _ in range(num_xray_rooms)]
+        self.xray_dispatcher = build_dispatcher(scenario.xray_dispatch, self.env, self.xray_resources,
+                                                self.xray_room_choice_sampler, self.expected_xray_service_time)
+        self.all_doctors_schedules = []
+        # Start of the current clinic day; schedules, cutoffs and lunch are relative to it.
+        self.day_start = 0.0
+
+        # ----------- Statistics Tracking -----------
+        self.doctor_patient_count = [0] * num_doctors
+        self.xray_patient_count = 0
+        self.doctor_second_exam_count = [0] * num_doctors
+        self.appointment_arrival_count = 0
+        self.appointment_departure_count = 0
+        self.walk_in_arrival_count = 0
+        # X-ray referrals drawn and their expected number given who arrived (a control variate)
+        self.xray_referral_count = 0
+        self.expected_xray_referrals = 0.0
+        self.walk_in_departure_count = 0
+        self.total_patients_generated = 0
+        self.patients_currently_in_system = 0
+        # Events processed by run(), for throughput benchmarks
+        self.events_processed = 0
+        self.appointment_actual_arrival_times = defaultdict(list)
+        self.appointment_scheduled_times = defaultdict(list)
+        self.doctor_wait_times = defaultdict(list)
+        self.xray_room_wait_times = defaultdict(list)
+        self.xray_room_patient_count = [0] * num_xray_rooms
+        self.time_in_system_values = []
+        self.patient_records = PatientRecords()
+
+    # ----------- Run Setup -----------
+
+    def validate_special_roles(self):
+        log = self._log
+        self._roles_validated = True
+        if self.appointment_only_doctor_id is not None:
+            if 0 <= self.appointment_only_doctor_id < self.scenario.num_doctors:
+                if log is not None:
+                    log(f"SPECIAL ROLE: Doctor {self.appointment_only_doctor_id + 1} is APPOINTMENT-ONLY.")
             else:
-                if int(env.now) % (check_interval * 5) < check_interval:
-                    xray_q_details = [len(xr.queue) for xr in xray_resources]
-                    xray_u_details = [xr.count for xr in xray_resources]
-                    print(f"WARNING: {env.now:.2f} - PatientCounter={patients_currently_in_system} but queues/resources not empty. Re-checking. DocQ: {[len(d.queue) for d in doctors_list_for_check]}, XrayQ: {xray_q_details}, DocUsers: {[d.count for d in doctors_list_for_check]}, XrayUsers: {xray_u_details}")
-
-        elif env.now > SIM_TIME + 3 * SIM_TIME:
-            print(f"--- {env.now:.2f} - LONG RUN WARNING. PatientCounter={patients_currently_in_system}. Forcing stop. ---")
-            if not stop_event_obj.triggered:
-                stop_event_obj.succeed()
-            break
-        yield env.timeout(check_interval)
-
-# ----------- Main Simulation Execution -----------
-def main():
-    global APPOINTMENT_ONLY_DOCTOR_ID
-    global WALKIN_ONLY_DOCTOR_ID
-
-    start_real_time = datetime.datetime.now()
-    print(f"Starting simulation - Appointment cutoff: {SIM_TIME} min, Walk-in cutoff: {WALKIN_CUTOFF_TIME} min")
-    print(f"Lunch break PERIOD: {LUNCH_START} - {LUNCH_END} min")
-    print(f"AFTERNOON SPEEDUP (doctors): service times multiplied by {AFTERNOON_SPEEDUP_FACTOR:.0%} (time >= {LUNCH_END})")
-    print(f"Doctors: {NUM_DOCTORS}, X-ray rooms: {NUM_XRAY_ROOMS}")
-    print(f"X-ray service time: 1.25x slower before lunch end, normal after.")
-    print(f"Appointment punctuality (Uniform): min dev={UNIFORM_MIN_DEVIATION_MINUTES} min, max dev={UNIFORM_MAX_DEVIATION_MINUTES} min")
-    print(f"Random seed: {RANDOM_SEED}")
-
-    if APPOINTMENT_ONLY_DOCTOR_ID is not None:
-        if 0 <= APPOINTMENT_ONLY_DOCTOR_ID < NUM_DOCTORS:
-            print(f"SPECIAL ROLE: Doctor {APPOINTMENT_ONLY_DOCTOR_ID + 1} is APPOINTMENT-ONLY.")
-        else:
-            print(f"WARNING: APPOINTMENT_ONLY_DOCTOR_ID ({APPOINTMENT_ONLY_DOCTOR_ID}) invalid. Disabling.")
-            APPOINTMENT_ONLY_DOCTOR_ID = None
-
-    if WALKIN_ONLY_DOCTOR_ID is not None:
-        if 0 <= WALKIN_ONLY_DOCTOR_ID < NUM_DOCTORS:
-            print(f"SPECIAL ROLE: Doctor {WALKIN_ONLY_DOCTOR_ID + 1} is WALK-IN-ONLY.")
-        else:
-            print(f"WARNING: WALKIN_ONLY_DOCTOR_ID ({WALKIN_ONLY_DOCTOR_ID}) invalid. Disabling.")
-            WALKIN_ONLY_DOCTOR_ID = None
-
-    if APPOINTMENT_ONLY_DOCTOR_ID is not None and APPOINTMENT_ONLY_DOCTOR_ID == WALKIN_ONLY_DOCTOR_ID:
-        print(f"WARNING: APPOINTMENT_ONLY_DOCTOR_ID and WALKIN_ONLY_DOCTOR_ID assigned to same doctor ({APPOINTMENT_ONLY_DOCTOR_ID+1}). This doctor may see no patients. Please adjust IDs.")
-
-    global doctors, xray_resources, doctor_is_on_lunch_break
-    global queue_lengths, xray_room_queue_lengths, timestamps
-    global doctor_patient_count, xray_patient_count, doctor_second_exam_count
-    global appointment_arrival_count, appointment_departure_count
-    global walk_in_arrival_count, walk_in_departure_count
-    global total_patients_generated, patients_currently_in_system
-    global appointment_actual_arrival_times, appointment_scheduled_times
-
-    queue_lengths.clear(); xray_room_queue_lengths.clear(); timestamps.clear()
-    appointment_actual_arrival_times.clear(); appointment_scheduled_times.clear()
-    doctor_patient_count[:] = [0] * NUM_DOCTORS
-    xray_patient_count = 0
-    doctor_second_exam_count[:] = [0] * NUM_DOCTORS
-    appointment_arrival_count = 0
-    appointment_departure_count = 0
-    walk_in_arrival_count = 0
-    walk_in_departure_count = 0
-    total_patients_generated = 0
-    patients_currently_in_system = 0
-    doctor_is_on_lunch_break[:] = [False] * NUM_DOCTORS
-    xray_resources = []
-
-    all_doctors_schedules = []
-    print("\n--- Generating scheduled appointment times ---")
-    for i in range(NUM_DOCTORS):
-        if WALKIN_ONLY_DOCTOR_ID is not None and i == WALKIN_ONLY_DOCTOR_ID:
-            all_doctors_schedules.append([])
-            appointment_scheduled_times[i] = []
-            print(f"  Dr {i+1} (Walk-in-only): no appointments scheduled.")
-            continue
-
-        doctor_schedule = []
-        current_scheduled_time = 0
-        while True:
-            interval = doctor_configs[i]["appointment_interval"]()
-            next_scheduled_time = current_scheduled_time + interval
-            if next_scheduled_time < SIM_TIME:
-                doctor_schedule.append(next_scheduled_time)
-                current_scheduled_time = next_scheduled_time
+                if log is not None:
+                    log(f"WARNING: APPOINTMENT_ONLY_DOCTOR_ID ({self.appointment_only_doctor_id}) invalid. Disabling.")
+                self.appointment_only_doctor_id = None
+
+        if self.walkin_only_doctor_id is not None:
+            if 0 <= self.walkin_only_doctor_id < self.scenario.num_doctors:
+                if log is not None:
+                    log(f"SPECIAL ROLE: Doctor {self.walkin_only_doctor_id + 1} is WALK-IN-ONLY.")
             else:
-                break
-
-        all_doctors_schedules.append(doctor_schedule)
-        appointment_scheduled_times[i] = doctor_schedule
-        last_sched_time_str = f"{doctor_schedule[-1]:.2f}" if doctor_schedule else "None"
-        print(f"  Dr {i+1}: {len(doctor_schedule)} appointments scheduled. Last scheduled: {last_sched_time_str} (Limit: {SIM_TIME})")
-    print("--- Scheduling complete ---\n")
-
-    env = simpy.Environment()
-    stop_event = env.event()
-
-    xray_resources.extend([simpy.PriorityResource(env, capacity=1) for _ in range(NUM_XRAY_ROOMS)])
-    doctors = [simpy.PriorityResource(env, capacity=1) for _ in range(NUM_DOCTORS)]
-
-    print("--- Starting patient generators ---")
-    for i in range(NUM_DOCTORS):
-        doctor_res = doctors[i]
-
-        is_appointment_only = (APPOINTMENT_ONLY_DOCTOR_ID is not None and i == APPOINTMENT_ONLY_DOCTOR_ID)
-        is_walkin_only = (WALKIN_ONLY_DOCTOR_ID is not None and i == WALKIN_ONLY_DOCTOR_ID)
-
-        if is_appointment_only:
-            if all_doctors_schedules[i]:
-                env.process(appointment_generator(env, i, doctor_res, all_doctors_schedules[i]))
-                print(f"  Dr {i+1}: APPOINTMENT-ONLY generator started.")
+                if log is not None:
+                    log(f"WARNING: WALKIN_ONLY_DOCTOR_ID ({self.walkin_only_doctor_id}) invalid. Disabling.")
+                self.walkin_only_doctor_id = None
+
+        if self.appointment_only_doctor_id is not None and self.appointment_only_doctor_id == self.walkin_only_doctor_id:
+            if log is not None:
+                log(f"WARNING: APPOINTMENT_ONLY_DOCTOR_ID and WALKIN_ONLY_DOCTOR_ID assigned to same doctor ({self.appointment_only_doctor_id+1}). This doctor may see no patients. Please adjust IDs.")
+
+    def generate_appointment_schedules(self):
+        log = self._log
+        all_doctors_schedules = []
+        if log is not None:
+            log("\n--- Generating scheduled appointment times ---")
+        for i in range(self.scenario.num_doctors):
+            if self.walkin_only_doctor_id is not None and i == self.walkin_only_doctor_id:
+                all_doctors_schedules.append([])
+                self.appointment_scheduled_times[i] = []
+                if log is not None:
+                    log(f"  Dr {i+1} (Walk-in-only): no appointments scheduled.")
+                continue
+
+            doctor_schedule = []
+            template = self.scenario.appointment_template
+            if template is not None:
+                doctor_schedule = [self.day_start + t for t in template.slot_times(self.scenario, i)]
             else:
-                print(f"  Dr {i+1} (Appointment-only): no scheduled appointments, generator not started.")
-        elif is_walkin_only:
-            env.process(patient_generator(env, i, doctor_res))
-            print(f"  Dr {i+1}: WALK-IN-ONLY generator started.")
-        else:
-            env.process(patient_generator(env, i, doctor_res))
-            if all_doctors_schedules[i]:
-                env.process(appointment_generator(env, i, doctor_res, all_doctors_schedules[i]))
-                print(f"  Dr {i+1}: BOTH appointment and walk-in generators started.")
+                current_scheduled_time = self.day_start
+                day_sim_time = self.day_start + self.scenario.sim_time
+                while True:
+                    interval = self.doctor_samplers[i]["appointment_interval"]()
+                    next_scheduled_time = current_scheduled_time + interval
+                    if next_scheduled_time < day_sim_time:
+                        doctor_schedule.append(next_scheduled_time)
+                        current_scheduled_time = next_scheduled_time
+                    else:
+                        break
+
+            all_doctors_schedules.append(doctor_schedule)
+            self.appointment_scheduled_times[i] = doctor_schedule
+            last_sched_time_str = f"{doctor_schedule[-1]:.2f}" if doctor_schedule else "None"
+            if log is not None:
+                log(f"  Dr {i+1}: {len(doctor_schedule)} appointments scheduled. Last scheduled: {last_sched_time_str} (Limit: {self.scenario.sim_time})")
+        if log is not None:
+            log("--- Scheduling complete ---\n")
+        self.all_doctors_schedules = all_doctors_schedules
+        return all_doctors_schedules
+
+    def start_processes(self):
+        self.start_day_processes()
+        self.env.process(self.simulation_ender())
+
+    def start_day_processes(self):
+        # Generators and lunch managers of one clinic day.
+        log = self._log
+        env = self.env
+        all_doctors_schedules = self.all_doctors_schedules
+        if log is not None:
+            log("--- Starting patient generators ---")
+        for i in range(self.scenario.num_doctors):
+            is_appointment_only = (self.appointment_only_doctor_id is not None and i == self.appointment_only_doctor_id)
+            is_walkin_only = (self.walkin_only_doctor_id is not None and i == self.walkin_only_doctor_id)
+
+            if is_appointment_only:
+                if all_doctors_schedules[i]:
+                    env.process(self.appointment_generator(i, all_doctors_schedules[i]))
+                    if log is not None:
+                        log(f"  Dr {i+1}: APPOINTMENT-ONLY generator started.")
+                else:
+                    if log is not None:
+                        log(f"  Dr {i+1} (Appointment-only): no scheduled appointments, generator not started.")
+            elif is_walkin_only:
+                env.process(self.patient_generator(i))
+                if log is not None:
+                    log(f"  Dr {i+1}: WALK-IN-ONLY generator started.")
+            else:
+                env.process(self.patient_generator(i))
+                if all_doctors_schedules[i]:
+                    env.process(self.appointment_generator(i, all_doctors_schedules[i]))
+                    if log is not None:
+                        log(f"  Dr {i+1}: BOTH appointment and walk-in generators started.")
+                else:
+                    if log is not None:
+                        log(f"  Dr {i+1}: Walk-in generator started (no scheduled appointments).")
+
+            env.process(self.manage_doctor_breaks(i))
+
+    def start(self):
+        # Sets up the day without simulating it; run() continues until the clinic is empty.
+        if not self._roles_validated:
+            self.validate_special_roles()
+        self.generate_appointment_schedules()
+        self.start_processes()
+        return self
+
+    def run(self):
+        # Same as env.run(until=self.stop_event), stepping here to count the events
+        self.start()
+        step = self.env.step
+        stop_event = self.stop_event
+        processed = 0
+        try:
+            while not stop_event.processed:
+                step()
+                processed += 1
+        except simpy.core.EmptySchedule:
+            raise RuntimeError("No scheduled events left but the clinic day has not ended") from None
+        finally:
+            self.events_processed = processed
+        return self
+
+    def add_xray_room(self):
+        # Opens one more X-ray room at the current time, e.g. in a what-if branch (checkpoint.py)
+        room = TrackedPriorityResource(self.env, capacity=1)
+        self.xray_resources.append(room)
+        self.xray_room_patient_count.append(0)
+        self.scenario = self.scenario.replace(num_xray_rooms=len(self.xray_resources))
+        self.xray_dispatcher.add_room()
+        return len(self.xray_resources) - 1
+
+    # ----------- Simulation Processes -----------
+
+    def lunch_window(self):
+        return self.day_start + self.scenario.lunch_start, self.day_start + self.scenario.lunch_end
+
+    def expected_xray_service_time(self, now):
+        expected = self.scenario.xray_service_spec().expected_value()
+        return expected * XRAY_MORNING_SLOWDOWN if now < self.lunch_window()[1] else expected
+
+    def break_windows(self, doctor_id):
+        return [(self.day_start + start, self.day_start + end) for start, end in self.scenario.break_windows(doctor_id)]
+
+    def manage_doctor_breaks(self, doctor_id):
+        # One break request per window on the doctor's own line: it is served ahead of every
+        # waiting patient once the current patient is finished, so patients arriving during
+        # a break simply queue until the doctor is back.
+        log = self._log
+        env = self.env
+        doctor_resource = self.doctors[doctor_id]
+        for break_start, break_end in self.break_windows(doctor_id):
+            yield env.timeout(max(0, break_start - env.now))
+            if log is not None:
+                log(f"--- {env.now:.2f} - Dr {doctor_id+1} BREAK PERIOD STARTED (will finish current patient) ---")
+            with doctor_resource.request_break() as req:
+                yield req
+                if env.now < break_end:
+                    yield env.timeout(break_end - env.now)
+            if log is not None:
+                log(f"--- {env.now:.2f} - Dr {doctor_id+1} BREAK PERIOD ENDED (back to service) ---")
+
+    def patient(self, patient):
+        log = self._log
+        emit = self._emit
+        env = self.env
+        name = patient.name if log is not None else None
+        doctor_id = patient.doctor_id
+        needs_xray = patient.needs_xray
+        actual_arrival_time = patient.arrival_time
+        request_priority = patient.priority
+        doctor_resource = self.doctors[doctor_id]
+        samplers = self.doctor_samplers[doctor_id]
+        # The lunch window and the speed-up are re-read at every service start: a patient
+        # carried over to the next day (multi-day runs) is served under that day's lunch and
+        # afternoon rules, and a what-if branch (checkpoint.py) reaches patients already inside.
+        lunch_start, lunch_end = self.lunch_window()
+
+        pid = patient.pid
+        wait_time_doc1 = wait_time_xray = wait_time_doc2 = float("nan")
+        # A patient resumed mid-visit (digital_twin.py) starts at patient.stage and keeps
+        # the time it joined its current line.
+        resumed_wait_start = patient.wait_start
+        selected_xray_room_idx = -1
+
+        if log is not None:
+            if patient.is_appointment:
+                type_str_detail = f"Sched@{patient.scheduled_time:.2f}"
+            else:
+                type_str_detail = "Walk-in"
+            type_str_base = f"{'Appointment' if patient.is_appointment else 'Walk-in'} Type-{'A' if needs_xray else 'B'}"
+            log(f"{actual_arrival_time:.2f} - {name} ({type_str_base}, {type_str_detail}) ARRIVED for Dr {doctor_id+1}.")
+        if emit is not None:
+            emit(actual_arrival_time, pid, EV_ARRIVED, doctor_id, 1.0 if patient.is_appointment else 0.0)
+
+        try:
+            # First Examination
+            if patient.stage == STAGE_FIRST_EXAM:
+                if log is not None:
+                    log(f"{env.now:.2f} - {name} requests Dr {doctor_id+1} (Prio: {request_priority:.2f}). Queue: {doctor_resource.waiting()}")
+                if emit is not None:
+                    emit(env.now, pid, EV_DOCTOR_REQUEST, doctor_id, doctor_resource.waiting())
+                start_wait_doc1 = env.now if resumed_wait_start is None else resumed_wait_start
+                resumed_wait_start = None
+                with doctor_resource.request(priority=request_priority) as req:
+                    yield req
+                    wait_time_doc1 = env.now - start_wait_doc1
+                    lunch_start, lunch_end = self.lunch_window()
+                    self.doctor_wait_times[doctor_id].append(wait_time_doc1)
+                    if log is not None:
+                        log(f"{env.now:.2f} - {name} 1st EXAM STARTED with Dr {doctor_id+1}. Wait: {wait_time_doc1:.2f} min. (Req Prio: {request_priority:.2f})")
+                    if emit is not None:
+                        emit(env.now, pid, EV_EXAM1_START, doctor_id, wait_time_doc1)
+
+                    service_start_time_doc1 = env.now
+                    base_exam_time = samplers["type_a_first_exam"]() if needs_xray else samplers["type_b_first_exam"]()
+                    exam_time = base_exam_time
+                    speed_up_applied_doc1 = False
+                    if service_start_time_doc1 >= lunch_end:
+                        exam_time = base_exam_time * self.scenario.afternoon_speedup_factor
+                        speed_up_applied_doc1 = True
+
+                    yield env.timeout(exam_time)
+                    self.doctor_patient_count[doctor_id] += 1
+                    if log is not None:
+                        log(f"{env.now:.2f} - {name} 1st EXAM ENDED with Dr {doctor_id+1} (Duration: {exam_time:.2f} min {'[Sped up]' if speed_up_applied_doc1 else ''}).")
+                    if emit is not None:
+                        emit(env.now, pid, EV_EXAM1_END, doctor_id, exam_time)
+
+            # X-ray Process
+            if needs_xray:
+                xray_priority = request_priority
+                if patient.stage <= STAGE_XRAY:
+                    if log is not None:
+                        log(f"{env.now:.2f} - {name} looking for an available X-ray room (Prio: {xray_priority:.2f}).")
+
+                    xray_resources = self.xray_resources
+                    dispatcher = self.xray_dispatcher
+                    xray_pool = dispatcher.pool
+                    start_wait_xray = env.now if resumed_wait_start is None else resumed_wait_start
+                    resumed_wait_start = None
+                    # With a pooled dispatcher the patient first waits in the shared line; a room
+                    # is only chosen once one is free.
+                    with (xray_pool.request(priority=xray_priority) if xray_pool is not None else nullcontext()) as req_pool:
+                        if req_pool is not None:
+                            yield req_pool
+                        selected_xray_room_idx = dispatcher.select()
+                        chosen_xray_resource = xray_resources[selected_xray_room_idx]
+
+                        if log is not None:
+                            log(f"{env.now:.2f} - {name} requests X-ray Room {selected_xray_room_idx+1}. Room queue: {len(chosen_xray_resource.queue)}")
+                        if emit is not None:
+                            emit(env.now, pid, EV_XRAY_REQUEST, selected_xray_room_idx, len(chosen_xray_resource.queue))
+                        with chosen_xray_resource.request(priority=xray_priority) as req_xray:
+                            yield req_xray
+                            wait_time_xray = env.now - start_wait_xray
+                            lunch_start, lunch_end = self.lunch_window()
+                            self.xray_room_wait_times[selected_xray_room_idx].append(wait_time_xray)
+                            if log is not None:
+                                log(f"{env.now:.2f} - {name} X-ray STARTED in Room {selected_xray_room_idx+1}. Wait: {wait_time_xray:.2f} min.")
+                            if emit is not None:
+                                emit(env.now, pid, EV_XRAY_START, selected_xray_room_idx, wait_time_xray)
+
+                            xray_time_val = get_actual_xray_service_time(self.xray_service_sampler, env.now, lunch_end)
+                            yield env.timeout(xray_time_val)
+                            self.xray_patient_count += 1
+                            self.xray_room_patient_count[selected_xray_room_idx] += 1
+                            if log is not None:
+                                log(f"{env.now:.2f} - {name} X-ray ENDED in Room {selected_xray_room_idx+1} (Duration: {xray_time_val:.2f} min).")
+                            if emit is not None:
+                                emit(env.now, pid, EV_XRAY_END, selected_xray_room_idx, xray_time_val)
+
+                # Second Examination
+                if patient.stage <= STAGE_SECOND_EXAM:
+                    second_exam_priority = request_priority
+                    if log is not None:
+                        log(f"{env.now:.2f} - {name} requests Dr {doctor_id+1} for 2nd exam (Prio: {second_exam_priority:.2f}). Queue: {doctor_resource.waiting()}")
+                    if emit is not None:
+                        emit(env.now, pid, EV_EXAM2_REQUEST, doctor_id, doctor_resource.waiting())
+                    start_wait_doc2 = env.now if resumed_wait_start is None else resumed_wait_start
+                    resumed_wait_start = None
+                    with doctor_resource.request(priority=second_exam_priority) as req_doc2:
+                        yield req_doc2
+                        wait_time_doc2 = env.now - start_wait_doc2
+                        lunch_start, lunch_end = self.lunch_window()
+                        self.doctor_wait_times[doctor_id].append(wait_time_doc2)
+                        if log is not None:
+                            log(f"{env.now:.2f} - {name} 2nd EXAM STARTED with Dr {doctor_id+1}. Wait: {wait_time_doc2:.2f} min.")
+                        if emit is not None:
+                            emit(env.now, pid, EV_EXAM2_START, doctor_id, wait_time_doc2)
+
+                        service_start_time_doc2 = env.now
+                        base_second_exam_time = samplers["type_a_second_exam"]()
+                        second_exam_time = base_second_exam_time
+                        speed_up_applied_doc2 = False
+                        if service_start_time_doc2 >= lunch_end:
+                            second_exam_time = base_second_exam_time * self.scenario.afternoon_speedup_factor
+                            speed_up_applied_doc2 = True
+
+                        yield env.timeout(second_exam_time)
+                        self.doctor_second_exam_count[doctor_id] += 1
+                        if log is not None:
+                            log(f"{env.now:.2f} - {name} 2nd EXAM ENDED with Dr {doctor_id+1} (Duration: {second_exam_time:.2f} min {'[Sped up]' if speed_up_applied_doc2 else ''}).")
+                        if emit is not None:
+                            emit(env.now, pid, EV_EXAM2_END, doctor_id, second_exam_time)
+
+            # Departure
+            departure_time = env.now
+            if patient.is_appointment:
+                self.appointment_departure_count += 1
             else:
-                print(f"  Dr {i+1}: Walk-in generator started (no scheduled appointments).")
+                self.walk_in_departure_count += 1
+            self.time_in_system_values.append(departure_time - actual_arrival_time)
+            self.patient_records.add(pid, doctor_id, patient.is_appointment, needs_xray, selected_xray_room_idx,
+                                     actual_arrival_time, wait_time_doc1, wait_time_xray, wait_time_doc2,
+                                     departure_time - actual_arrival_time)
+            if log is not None:
+                log(f"{departure_time:.2f} - {name} DEPARTED. Time in system: {departure_time - actual_arrival_time:.2f} min.")
+            if emit is not None:
+                emit(departure_time, pid, EV_DEPARTED, doctor_id, departure_time - actual_arrival_time)
+        finally:
+            self.patients_currently_in_system -= 1
+            if self.patients_currently_in_system < 0:
+                if log is not None:
+                    log(f"!!!! ERROR !!!! Patient counter dropped below zero at {env.now:.2f} for {patient.name}!")
+                self.patients_currently_in_system = 0
+            if self.patients_currently_in_system == 0 and self.system_empty_event is not None:
+                if not self.system_empty_event.triggered:
+                    self.system_empty_event.succeed()
+
+    def patient_generator(self, doctor_id):
+        log = self._log
+        env = self.env
+        samplers = self.doctor_samplers[doctor_id]
+        xray_probability = self.scenario.doctor_config(doctor_id)["xray_probability"]
+        walkin_cutoff_time = self.day_start + self.scenario.walkin_cutoff_time
+
+        if self.appointment_only_doctor_id is not None and doctor_id == self.appointment_only_doctor_id:
+            if log is not None:
+                log(f"--- Dr {doctor_id+1} is APPOINTMENT-ONLY, so walk-in generator is not started for this doctor. ---")
+            return
+
+        patient_idx_walkin = 0
+        while True:
+            interarrival_time = samplers["arrival"]()
+            potential_next_arrival = env.now + interarrival_time
+            if potential_next_arrival >= walkin_cutoff_time:
+                if log is not None:
+                    log(f"{env.now:.2f} - Dr {doctor_id+1} walk-in generator STOPPING. Next arrival ({potential_next_arrival:.2f}) would exceed cutoff ({walkin_cutoff_time:g}).")
+                break
+            yield env.timeout(max(0, interarrival_time))
+            actual_arrival_time = env.now
+            if actual_arrival_time >= walkin_cutoff_time:
+                break
 
-        env.process(manage_doctor_lunch_state(env, i))
+            patient_idx_walkin += 1
+            self.total_patients_generated += 1
+            self.walk_in_arrival_count += 1
+            self.patients_currently_in_system += 1
+            is_xray_needed = samplers["xray_decision"]() < xray_probability
+            self.xray_referral_count += is_xray_needed
+            self.expected_xray_referrals += xray_probability
+            env.process(self.patient(Patient(self.total_patients_generated, patient_idx_walkin, doctor_id, False,
+                                             is_xray_needed, actual_arrival_time)))
+
+    def appointment_generator(self, doctor_id, scheduled_times_for_this_doctor):
+        log = self._log
+        env = self.env
+        samplers = self.doctor_samplers[doctor_id]
+        xray_probability = self.scenario.doctor_config(doctor_id)["xray_probability"]
+        sim_time = self.day_start + self.scenario.sim_time
+
+        if self.walkin_only_doctor_id is not None and doctor_id == self.walkin_only_doctor_id:
+            if log is not None:
+                log(f"--- Dr {doctor_id+1} is WALK-IN-ONLY, so appointment generator is not started for this doctor. ---")
+            return
+
+        patient_idx_appt = 0
+        for scheduled_time in scheduled_times_for_this_doctor:
+            patient_idx_appt += 1
+            punctuality_deviation = samplers["punctuality"]()
+            actual_arrival_time_candidate = max(self.day_start, scheduled_time + punctuality_deviation)
+
+            delay_until_actual_arrival = actual_arrival_time_candidate - env.now
+            if delay_until_actual_arrival > 0:
+                yield env.timeout(delay_until_actual_arrival)
+
+            current_actual_arrival_time = env.now
+            if current_actual_arrival_time >= sim_time:
+                continue
+
+            self.appointment_actual_arrival_times[doctor_id].append(current_actual_arrival_time)
+            self.total_patients_generated += 1
+            self.appointment_arrival_count += 1
+            self.patients_currently_in_system += 1
+            is_xray_needed = samplers["xray_decision"]() < xray_probability
+            self.xray_referral_count += is_xray_needed
+            self.expected_xray_referrals += xray_probability
+            env.process(self.patient(Patient(self.total_patients_generated, patient_idx_appt, doctor_id, True,
+                                             is_xray_needed, current_actual_arrival_time, scheduled_time)))
+
+    def simulation_ender(self):
+        # The drain phase ends on a countdown event fired by the last departing patient,
+        # so the run stops at the exact time the system becomes empty.
+        log = self._log
+        env = self.env
+        if env.now < self.scenario.sim_time:
+            yield env.timeout(self.scenario.sim_time - env.now)
+
+        if log is not None:
+            log(f"--- {env.now:.2f} - APPOINTMENT CUTOFF ({self.scenario.sim_time} min) reached. Walk-ins stopped at {self.scenario.walkin_cutoff_time} min. Existing patients are finishing. ---")
+
+        if self.patients_currently_in_system > 0:
+            self.system_empty_event = env.event()
+            yield self.system_empty_event | env.timeout(self.scenario.max_drain_time)
+
+        if self.patients_currently_in_system <= 0:
+            if log is not None:
+                log(f"--- {env.now:.2f} - SYSTEM EMPTY (PatientCounter={self.patients_currently_in_system}, all queues/resources empty). Stopping simulation. ---")
+        else:
+            if log is not None:
+                log(f"--- {env.now:.2f} - LONG RUN WARNING. PatientCounter={self.patients_currently_in_system}. Forcing stop. ---")
+        self.stop_event.succeed()
+
+    # ----------- Run Summary -----------
+
+    @property
+    def doctor_traces(self):
+        return [d.trace for d in self.doctors]
+
+    @property
+    def xray_traces(self):
+        return [xr.trace for xr in self.xray_resources]
+
+    def collect_run_summary(self):
+        pool = self.xray_dispatcher.pool
+        return summarize_run(self, self.env.now, self.doctor_traces, self.xray_traces,
+                             pool.trace if pool is not None else None)
+
+    def sample_queue_lengths(self, grid):
+        # Queue lengths of every resource on a common time grid, compact enough to ship back
+        # from worker processes and stack across replications for band plots.
+        return {
+            "doctors": np.array([d.trace.sample(grid) for d in self.doctors], dtype=np.int16),
+            "xray_rooms": np.array([xr.trace.sample(grid) for xr in self.xray_resources], dtype=np.int16),
+        }
+
+# ----------- Run Summary -----------
+
+def summarize_run(stats, end_time, doctor_traces, xray_traces, xray_pool_trace=None):
+    # Flat per-replication metrics from any engine's run statistics; NaN marks a statistic
+    # with no observations in this run. Under pooled X-ray dispatch patients wait in the
+    # pool's shared line rather than at a room, so that line is reported separately.
+    summary = {
+        "end_time": end_time,
+        "overtime": max(0.0, end_time - stats.scenario.sim_time),
+        "patients_generated": stats.total_patients_generated,
+        "appointment_departures": stats.appointment_departure_count,
+        "walkin_departures": stats.walk_in_departure_count,
+        "departures": stats.appointment_departure_count + stats.walk_in_departure_count,
+        "xray_patients": stats.xray_patient_count,
+        "mean_time_in_system": float(np.mean(stats.time_in_system_values)) if stats.time_in_system_values else float("nan"),
+    }
+    for i in range(stats.scenario.num_doctors):
+        waits = stats.doctor_wait_times.get(i, [])
+        summary[f"dr{i+1}_first_exams"] = stats.doctor_patient_count[i]
+        summary[f"dr{i+1}_second_exams"] = stats.doctor_second_exam_count[i]
+        summary[f"dr{i+1}_mean_wait"] = float(np.mean(waits)) if waits else float("nan")
+        summary[f"dr{i+1}_p90_wait"] = float(np.percentile(waits, 90)) if waits else float("nan")
+        summary[f"dr{i+1}_avg_queue"] = doctor_traces[i].average_queue_length(end_time)
+        summary[f"dr{i+1}_utilization"] = doctor_traces[i].utilization(1, end_time)
+    for room_idx in range(stats.scenario.num_xray_rooms):
+        waits = stats.xray_room_wait_times.get(room_idx, [])
+        summary[f"xray{room_idx+1}_patients"] = stats.xray_room_patient_count[room_idx]
+        summary[f"xray{room_idx+1}_mean_wait"] = float(np.mean(waits)) if waits else float("nan")
+        summary[f"xray{room_idx+1}_p90_wait"] = float(np.percentile(waits, 90)) if waits else float("nan")
+        summary[f"xray{room_idx+1}_avg_queue"] = xray_traces[room_idx].average_queue_length(end_time)
+        summary[f"xray{room_idx+1}_utilization"] = xray_traces[room_idx].utilization(1, end_time)
+    summary["xray_pool_avg_queue"] = xray_pool_trace.average_queue_length(end_time) if xray_pool_trace is not None else 0.0
+    return summary
 
-    env.process(track_queues(env, doctors, stop_event))
-    env.process(simulation_ender(env, stop_event, doctors))
-    env.run(until=stop_event)
+# ----------- Main Simulation Execution -----------
+def main(scenario=DEFAULT_SCENARIO, seed=RANDOM_SEED, plots=True, out_dir="outputs"):
+    start_real_time = datetime.datetime.now()
+    print(f"Starting simulation - Appointment cutoff: {scenario.sim_time} min, Walk-in cutoff: {scenario.walkin_cutoff_time} min")
+    print(f"Lunch break PERIOD: {scenario.lunch_start} - {scenario.lunch_end} min")
+    print(f"AFTERNOON SPEEDUP (doctors): service times multiplied by {scenario.afternoon_speedup_factor:.0%} (time >= {scenario.lunch_end})")
+    print(f"Doctors: {scenario.num_doctors}, X-ray rooms: {scenario.num_xray_rooms} (dispatch: {scenario.xray_dispatch})")
+    print(f"X-ray service time: {XRAY_MORNING_SLOWDOWN:g}x slower before lunch end, normal after.")
+    print(f"Appointment punctuality (Uniform): min dev={scenario.punctuality_min} min, max dev={scenario.punctuality_max} min")
+    print(f"Random seed: {seed}")
+
+    model = ClinicModel(seed=seed, event_sink=ConsoleSink(), scenario=scenario)
+    model.run()
+    env = model.env
 
     end_real_time = datetime.datetime.now()
     print(f"\n--- Simulation finished ---")
     print(f"Total simulated time: {env.now:.2f} min")
     print(f"Wall-clock runtime: {end_real_time - start_real_time}")
 
-    # Plotting
-    min_len_ts = len(timestamps)
-    if not timestamps or min_len_ts < 2:
-        print("\nWARNING: Not enough timestamp data for plotting.")
-    else:
-        plot_timestamps = np.array(timestamps)
-
-        plt.figure(figsize=(14, 7))
-        for i in range(NUM_DOCTORS):
-            q_data = queue_lengths.get(i, [])
-            if len(q_data) < min_len_ts:
-                last_val = q_data[-1] if q_data else 0
-                q_data.extend([last_val] * (min_len_ts - len(q_data)))
-            elif len(q_data) > min_len_ts:
-                q_data = q_data[:min_len_ts]
-            plt.plot(plot_timestamps, q_data, label=f'Dr {i+1} Queue', alpha=0.8)
-
-        plt.axvline(x=LUNCH_START, color='grey', linestyle=':', linewidth=1, label=f'Lunch start ({LUNCH_START})')
-        plt.axvline(x=LUNCH_END, color='dimgrey', linestyle='--', linewidth=1.2, label=f'Lunch end / Speedup ({LUNCH_END})')
-        plt.axvline(x=WALKIN_CUTOFF_TIME, color='blue', linestyle='-.', linewidth=1.2, label=f'Walk-in cutoff ({WALKIN_CUTOFF_TIME})')
-        plt.axvline(x=SIM_TIME, color='red', linestyle='-', linewidth=1.5, label=f'Appointment cutoff ({SIM_TIME})')
-
-        title_suffix = ""
-        if APPOINTMENT_ONLY_DOCTOR_ID is not None:
-            title_suffix += f"\nDr {APPOINTMENT_ONLY_DOCTOR_ID+1} Appointment-only"
-        if WALKIN_ONLY_DOCTOR_ID is not None:
-            title_suffix += f", Dr {WALKIN_ONLY_DOCTOR_ID+1} Walk-in-only"
-
-        plt.xlabel("Time (minutes)")
-        plt.ylabel("Queue length")
-        plt.title(
-            f"Doctor Queue Lengths (Punctuality: Uniform [{UNIFORM_MIN_DEVIATION_MINUTES},{UNIFORM_MAX_DEVIATION_MINUTES}])\nSeed: {RANDOM_SEED}{title_suffix}"
-        )
-        plt.legend(fontsize='small', loc='upper left')
-        plt.grid(True, linestyle=':', alpha=0.7)
-        plt.tight_layout()
-        plt.show()
-
-        plt.figure(figsize=(14, 7))
-        for room_idx in range(NUM_XRAY_ROOMS):
-            xray_data_plot = xray_room_queue_lengths.get(room_idx, [])
-            if len(xray_data_plot) < min_len_ts:
-                last_val = xray_data_plot[-1] if xray_data_plot else 0
-                xray_data_plot.extend([last_val] * (min_len_ts - len(xray_data_plot)))
-            elif len(xray_data_plot) > min_len_ts:
-                xray_data_plot = xray_data_plot[:min_len_ts]
-            plt.plot(plot_timestamps, xray_data_plot, label=f"X-ray Room {room_idx+1} Queue", alpha=0.8)
-
-        plt.axvline(x=LUNCH_START, color='grey', linestyle=':', linewidth=1, label=f'Lunch start ({LUNCH_START})')
-        plt.axvline(x=LUNCH_END, color='dimgrey', linestyle='--', linewidth=1.2, label=f'Lunch end ({LUNCH_END})')
-        plt.axvline(x=WALKIN_CUTOFF_TIME, color='blue', linestyle='-.', linewidth=1.2, label=f'Walk-in cutoff ({WALKIN_CUTOFF_TIME})')
-        plt.axvline(x=SIM_TIME, color='red', linestyle='-', linewidth=1.5, label=f'Appointment cutoff ({SIM_TIME})')
-
-        plt.xlabel("Time (minutes)")
-        plt.ylabel("X-ray room queue length")
-        plt.title(f"X-ray Room Queue Lengths ({NUM_XRAY_ROOMS} Rooms, 1.25x slower before lunch)\nSeed: {RANDOM_SEED}{title_suffix}")
-        plt.legend(fontsize='small', loc='upper left')
-        plt.grid(True, linestyle=':', alpha=0.7)
-        plt.tight_layout()
-        plt.show()
-
     print("\n--- Patient Flow Statistics ---")
-    print(f"Total scheduled appointments (all doctors): {sum(len(s) for s in all_doctors_schedules)}")
-    print(f"Total generated patients (processes started): {total_patients_generated}")
-    print(f"  Appointment arrivals (realized): {appointment_arrival_count}")
-    print(f"  Walk-in arrivals: {walk_in_arrival_count}")
+    print(f"Total scheduled appointments (all doctors): {sum(len(s) for s in model.all_doctors_schedules)}")
+    print(f"Total generated patients (processes started): {model.total_patients_generated}")
+    print(f"  Appointment arrivals (realized): {model.appointment_arrival_count}")
+    print(f"  Walk-in arrivals: {model.walk_in_arrival_count}")
 
-    total_departures = appointment_departure_count + walk_in_departure_count
+    total_departures = model.appointment_departure_count + model.walk_in_departure_count
     print(f"\nTotal completed patients: {total_departures}")
-    print(f"  Appointment departures: {appointment_departure_count}")
-    print(f"  Walk-in departures: {walk_in_departure_count}")
+    print(f"  Appointment departures: {model.appointment_departure_count}")
+    print(f"  Walk-in departures: {model.walk_in_departure_count}")
 
-    calculated_remaining = total_patients_generated - total_departures
+    calculated_remaining = model.total_patients_generated - total_departures
     print(f"Patients remaining at end (calculated): {calculated_remaining}")
-    print(f"Patients remaining at end (counter): {patients_currently_in_system}")
-    if calculated_remaining != patients_currently_in_system:
+    print(f"Patients remaining at end (counter): {model.patients_currently_in_system}")
+    if calculated_remaining != model.patients_currently_in_system:
         print("!!! WARNING: Calculated remaining patients and counter value do not match. Please verify.")
 
     print("\n--- Doctor Activity Statistics ---")
     print("Total exams performed by doctors:")
-    for i in range(NUM_DOCTORS):
-        total_exams_by_doc = doctor_patient_count[i] + doctor_second_exam_count[i]
-        print(f"  Doctor {i+1}: {total_exams_by_doc} (1st Exam: {doctor_patient_count[i]}, 2nd Exam: {doctor_second_exam_count[i]})")
-    print(f"\nTotal X-ray patients (all rooms): {xray_patient_count} patients")
+    for i in range(scenario.num_doctors):
+        total_exams_by_doc = model.doctor_patient_count[i] + model.doctor_second_exam_count[i]
+        print(f"  Doctor {i+1}: {total_exams_by_doc} (1st Exam: {model.doctor_patient_count[i]}, 2nd Exam: {model.doctor_second_exam_count[i]})")
+    print(f"\nTotal X-ray patients (all rooms): {model.xray_patient_count} patients")
+
+    print("\n--- Queue and Utilization Statistics (time-weighted) ---")
+    print(f"{'Resource':<14} | {'Avg Queue':<10} | {'Max Queue':<10} | {'Utilization (%)':<16}")
+    print("-" * 60)
+    for i, d_res in enumerate(model.doctors):
+        trace = d_res.trace
+        print(f"{f'Dr {i+1}':<14} | {trace.average_queue_length(env.now):<10.2f} | {trace.max_queue_length():<10} | {trace.utilization(1, env.now) * 100:<16.2f}")
+    for room_idx, xr in enumerate(model.xray_resources):
+        trace = xr.trace
+        print(f"{f'X-ray Room {room_idx+1}':<14} | {trace.average_queue_length(env.now):<10.2f} | {trace.max_queue_length():<10} | {trace.utilization(1, env.now) * 100:<16.2f}")
+    xray_pool = model.xray_dispatcher.pool
+    if xray_pool is not None:
+        trace = xray_pool.trace
+        print(f"{'X-ray pool':<14} | {trace.average_queue_length(env.now):<10.2f} | {trace.max_queue_length():<10} | {trace.utilization(xray_pool.capacity, env.now) * 100:<16.2f}")
 
     # Doctor-level X-ray referral statistics (kept exactly as your logic, only translated)
     print("\n--- Doctor-level X-ray Referral Statistics ---")
     xray_column_header = "Sent to X-ray"
     print(f"{'Doctor':<10} | {'1st Exams':<12} | {xray_column_header:<14} | {'X-ray Rate (%)':<16} | {'Expected Rate (%)':<18}")
     print("-" * 80)
-    for i in range(NUM_DOCTORS):
-        total_first_exams_for_doc = doctor_patient_count[i]
-        patients_to_xray_from_doc = doctor_second_exam_count[i]  # (your logic: second exam count as x-ray referrals)
+    for i in range(scenario.num_doctors):
+        total_first_exams_for_doc = model.doctor_patient_count[i]
+        patients_to_xray_from_doc = model.doctor_second_exam_count[i]  # (your logic: second exam count as x-ray referrals)
 
         xray_referral_rate = 0
         if total_first_exams_for_doc > 0:
             xray_referral_rate = (patients_to_xray_from_doc / total_first_exams_for_doc) * 100
 
-        expected_xray_prob_percent = doctor_configs[i]["xray_probability"] * 100
+        expected_xray_prob_percent = scenario.doctor_config(i)["xray_probability"] * 100
 
         print(f"Dr {i+1:<7} | {total_first_exams_for_doc:<12} | {patients_to_xray_from_doc:<14} | {xray_referral_rate:<16.2f} | {expected_xray_prob_percent:<18.2f}")
 
-    total_first_exams_all_docs = sum(doctor_patient_count)
-    total_second_exams_all_docs = sum(doctor_second_exam_count)
+    total_first_exams_all_docs = sum(model.doctor_patient_count)
+    total_second_exams_all_docs = sum(model.doctor_second_exam_count)
 
-    if total_second_exams_all_docs != xray_patient_count:
-        print(f"\nNote: Total second exams ({total_second_exams_all_docs}) and total X-ray patients ({xray_patient_count}) can differ.")
+    if total_second_exams_all_docs != model.xray_patient_count:
+        print(f"\nNote: Total second exams ({total_second_exams_all_docs}) and total X-ray patients ({model.xray_patient_count}) can differ.")
         print("This can happen if some patients do not return for the second exam before the simulation ends, or if processes are interrupted.")
 
     overall_xray_rate = 0
@@ -601,5 +869,34 @@ def main():
     print("-" * 80)
     print(f"{'Total':<10} | {total_first_exams_all_docs:<12} | {total_second_exams_all_docs:<14} | {overall_xray_rate:<16.2f} | {'N/A':<18}")
 
+    print("\n--- Waiting Time Statistics (minutes, completed patients) ---")
+    print_wait_statistics(WaitStatistics.from_records(model.patient_records.to_array(), scenario.num_doctors))
+
+    # Plotting is a separate reporting stage: figures are rendered off-screen once the run
+    # and its statistics are complete, and matplotlib is never imported when plots are off.
+    if plots:
+        if env.now <= 0:
+            print("\nWARNING: Not enough queue trace data for plotting.")
+        else:
+            import reporting
+            for path in reporting.plot_run_queue_lengths(model, out_dir):
+                print(f"Saved figure: {path}")
+    return model
+
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Run one day of the outpatient clinic simulation.")
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED)
+    parser.add_argument("--no-plots", action="store_true", help="Skip figure generation entirely.")
+    parser.add_argument("--out-dir", default="outputs", help="Directory for the queue-length figures.")
+    parser.add_argument("--xray-dispatch", choices=DISPATCHERS, default=None,
+                        help=f"X-ray room dispatch policy (default: {DEFAULT_DISPATCH}).")
+    parser.add_argument("--config", metavar="PATH", help="Clinic config file (.json, .toml, .yaml), see config.py.")
+    args = parser.parse_args()
+    scenario = DEFAULT_SCENARIO
+    if args.config:
+        import config
+        scenario = config.load_config(args.config)
+    if args.xray_dispatch:
+        scenario = scenario.replace(xray_dispatch=args.xray_dispatch)
+    main(scenario=scenario, seed=args.seed, plots=not args.no_plots, out_dir=args.out_dir)
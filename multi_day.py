@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import math
+import time
+
+import numpy as np
+import simpy
+
+import main as sim
+from replications import DEFAULT_CONFIDENCE, aggregate_summaries
+
+# ----------- Configuration -----------
+DEFAULT_DAYS = 20
+# Minutes from opening to closing; the next day opens at closing time (nights are not simulated)
+DEFAULT_DAY_LENGTH = sim.SIM_TIME + 120
+# Leading days dropped from batch means (the first day starts from an empty clinic)
+DEFAULT_WARMUP_DAYS = 1
+
+# ----------- Multi-day Model -----------
+
+class MultiDayClinicModel(sim.ClinicModel):
+    # Consecutive clinic days in one environment: resources, random streams and statistics are
+    # built once, and every day repeats the appointment schedules, walk-in cutoff and lunch
+    # break relative to its own start. Patients still in the clinic at closing time either
+    # carry over into the next day, keeping their place and priority in the queues, or are
+    # sent home.
+
+    def __init__(self, seed=sim.RANDOM_SEED, event_sink=None, scenario=sim.DEFAULT_SCENARIO,
+                 num_days=DEFAULT_DAYS, day_length=DEFAULT_DAY_LENGTH, carry_over=True):
+        if day_length < scenario.sim_time:
+            raise ValueError(f"day_length ({day_length}) is shorter than the appointment day ({scenario.sim_time} min).")
+        if num_days * day_length >= sim.WALKIN_PRIORITY_OFFSET:
+            raise ValueError(f"{num_days} days of {day_length} min would let appointment priorities overlap walk-in priorities.")
+        super().__init__(seed=seed, event_sink=event_sink, scenario=scenario)
+        self.num_days = num_days
+        self.day_length = day_length
+        self.carry_over = carry_over
+        self.day_schedules = []
+        self.day_end_snapshots = []
+        self._active_patients = {}
+
+    def run(self):
+        if not self._roles_validated:
+            self.validate_special_roles()
+        self.env.process(self.day_cycle())
+        self.env.run(until=self.stop_event)
+        return self
+
+    def day_cycle(self):
+        log = self._log
+        env = self.env
+        for day in range(self.num_days):
+            self.day_start = float(day * self.day_length)
+            if log is not None:
+                log(f"\n=== {env.now:.2f} - DAY {day+1} OPENS ({self.patients_currently_in_system} patients carried over) ===")
+            self.day_schedules.append(self.generate_appointment_schedules())
+            self.start_day_processes()
+            yield env.timeout(self.day_start + self.day_length - env.now)
+
+            self.day_end_snapshots.append({
+                "generated": self.total_patients_generated,
+                "departures": self.appointment_departure_count + self.walk_in_departure_count,
+                "backlog": self.patients_currently_in_system,
+            })
+            if log is not None:
+                log(f"=== {env.now:.2f} - DAY {day+1} CLOSES with {self.patients_currently_in_system} patients in the clinic ===")
+            if not self.carry_over:
+                for process in list(self._active_patients.values()):
+                    process.interrupt("closing time")
+        self.stop_event.succeed()
+
+    def patient(self, patient):
+        # Registers the running process so it can be sent home at closing time.
+        pid = patient.pid
+        self._active_patients[pid] = self.env.active_process
+        try:
+            yield from super().patient(patient)
+        except simpy.Interrupt:
+            if self._log is not None:
+                self._log(f"{self.env.now:.2f} - {patient.name} SENT HOME at closing time.")
+        finally:
+            del self._active_patients[pid]
+
+# ----------- Day-level Batches -----------
+
+def _mean(values):
+    values = values[~np.isnan(values)]
+    return float(values.mean()) if len(values) else float("nan")
+
+def _p90(values):
+    values = values[~np.isnan(values)]
+    return float(np.percentile(values, 90)) if len(values) else float("nan")
+
+def day_summaries(model):
+    # One batch per day. Waits and time in system belong to the day a patient arrived,
+    # throughput and overtime to the day a patient left, time averages to the day's window.
+    records = model.patient_records.to_array()
+    departure_times = records["arrival_time"] + records["time_in_system"]
+    arrival_day = (records["arrival_time"] // model.day_length).astype(np.int64)
+    departure_day = (departure_times // model.day_length).astype(np.int64)
+    sim_time = model.scenario.sim_time
+
+    summaries = []
+    previous = {"generated": 0, "departures": 0}
+    for day, snapshot in enumerate(model.day_end_snapshots):
+        start = day * model.day_length
+        end = start + model.day_length
+        arrived = records[arrival_day == day]
+        departed = departure_times[departure_day == day]
+        summaries.append({
+            "arrivals": snapshot["generated"] - previous["generated"],
+            "departures": snapshot["departures"] - previous["departures"],
+            "backlog_at_close": snapshot["backlog"],
+            "overtime": max(0.0, float(departed.max()) - (start + sim_time)) if len(departed) else 0.0,
+            "mean_doctor_wait": _mean(arrived["doctor_wait"].astype(np.float64)),
+            "p90_doctor_wait": _p90(arrived["doctor_wait"].astype(np.float64)),
+            "mean_xray_wait": _mean(arrived["xray_wait"].astype(np.float64)),
+            "mean_time_in_system": _mean(arrived["time_in_system"]),
+            "p90_time_in_system": _p90(arrived["time_in_system"]),
+            "doctor_utilization": float(np.mean([d.trace.utilization(1, end, start) for d in model.doctors])),
+            "xray_utilization": float(np.mean([xr.trace.utilization(1, end, start) for xr in model.xray_resources])),
+        })
+        previous = snapshot
+    return summaries
+
+def lag1_autocorrelation(values):
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) < 3:
+        return float("nan")
+    centred = values - values.mean()
+    denominator = float(np.dot(centred, centred))
+    return float(np.dot(centred[:-1], centred[1:])) / denominator if denominator > 0 else float("nan")
+
+def batch_means(days, warmup_days=DEFAULT_WARMUP_DAYS, confidence=DEFAULT_CONFIDENCE):
+    # Batch means over whole days after the warm-up. The lag-1 autocorrelation of each
+    # metric shows whether day batches are close enough to independent for the interval.
+    batches = days[warmup_days:]
+    aggregated = aggregate_summaries(batches, confidence)
+    for name, stats in aggregated.items():
+        stats["lag1"] = lag1_autocorrelation([b[name] for b in batches])
+    return aggregated
+
+# ----------- Reporting -----------
+
+def print_day_table(days):
+    print(f"{'Day':>4} | {'Arrivals':>8} | {'Departed':>8} | {'Backlog':>7} | {'Overtime':>8} | {'Dr Wait':>7} | {'TIS':>7} | {'Dr Util':>7}")
+    print("-" * 83)
+    for day, summary in enumerate(days):
+        print(f"{day+1:>4} | {summary['arrivals']:>8} | {summary['departures']:>8} | {summary['backlog_at_close']:>7} | "
+              f"{summary['overtime']:>8.2f} | {summary['mean_doctor_wait']:>7.2f} | {summary['mean_time_in_system']:>7.2f} | "
+              f"{summary['doctor_utilization'] * 100:>6.1f}%")
+
+def print_batch_means(aggregated, confidence=DEFAULT_CONFIDENCE):
+    ci_header = f"{confidence:.0%} CI"
+    print(f"{'Metric':<22} | {'Mean':>10} | {ci_header:>23} | {'Lag-1 r':>8}")
+    print("-" * 72)
+    for name, stats in aggregated.items():
+        ci_str = f"[{stats['ci_low']:.2f}, {stats['ci_high']:.2f}]"
+        lag1 = "n/a" if math.isnan(stats["lag1"]) else f"{stats['lag1']:.2f}"
+        print(f"{name:<22} | {stats['mean']:>10.2f} | {ci_str:>23} | {lag1:>8}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate consecutive clinic days in one environment.")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED)
+    parser.add_argument("--day-length", type=float, default=DEFAULT_DAY_LENGTH,
+                        help="Minutes from opening to closing; the next day opens at closing time.")
+    parser.add_argument("--no-carry-over", action="store_true",
+                        help="Send patients still in the clinic home at closing time instead of carrying them over.")
+    parser.add_argument("--warmup-days", type=int, default=DEFAULT_WARMUP_DAYS)
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    start = time.perf_counter()
+    model = MultiDayClinicModel(seed=args.seed, num_days=args.days, day_length=args.day_length,
+                                carry_over=not args.no_carry_over).run()
+    elapsed = time.perf_counter() - start
+    days = day_summaries(model)
+    print(f"Days: {args.days} x {args.day_length:g} min, carry-over: {'off' if args.no_carry_over else 'on'}, "
+          f"seed: {args.seed}, wall-clock: {elapsed:.2f} s ({elapsed / args.days * 1000:.1f} ms/day)")
+    print_day_table(days)
+    print(f"\n--- Batch means over days {args.warmup_days + 1}-{args.days} ---")
+    print_batch_means(batch_means(days, args.warmup_days, args.confidence), args.confidence)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from estimators import DEFAULT_COMPRESSION, RunningMoments, TDigest
+
+# ----------- Configuration -----------
+DEFAULT_QUANTILES = (50, 90, 99)
+
+# One row per departed patient. Waits a patient never had (X-ray and second exam of
+# Type-B patients) are NaN; xray_room is -1 for them. Patient ids are engine-specific.
+PATIENT_DTYPE = np.dtype([
+    ("patient_id", "i4"),
+    ("doctor_id", "i2"),
+    ("is_appointment", "?"),
+    ("needs_xray", "?"),
+    ("xray_room", "i1"),
+    ("arrival_time", "f8"),
+    ("doctor_wait", "f4"),
+    ("xray_wait", "f4"),
+    ("second_exam_wait", "f4"),
+    ("time_in_system", "f8"),
+])
+
+WAIT_METRICS = ("doctor_wait", "xray_wait", "second_exam_wait", "time_in_system")
+
+# ----------- Records -----------
+
+class RecordBuffer:
+    # Rows are buffered as tuples and converted to typed chunks, as ColumnarEventLog does.
+
+    def __init__(self, dtype, chunk_size=65536):
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self._pending = []
+        self._chunks = []
+
+    def append(self, row):
+        pending = self._pending
+        pending.append(row)
+        if len(pending) >= self.chunk_size:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        if self._pending:
+            self._chunks.append(np.array(self._pending, dtype=self.dtype))
+            self._pending = []
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._chunks) + len(self._pending)
+
+    def to_array(self):
+        self._flush_pending()
+        if not self._chunks:
+            return np.empty(0, dtype=self.dtype)
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0]
+
+class PatientRecords(RecordBuffer):
+
+    def __init__(self, chunk_size=65536):
+        super().__init__(PATIENT_DTYPE, chunk_size)
+
+    def add(self, patient_id, doctor_id, is_appointment, needs_xray, xray_room, arrival_time,
+            doctor_wait, xray_wait, second_exam_wait, time_in_system):
+        self.append((patient_id, doctor_id, is_appointment, needs_xray, xray_room, arrival_time,
+                     doctor_wait, xray_wait, second_exam_wait, time_in_system))
+
+# ----------- Streaming Wait Statistics -----------
+
+def record_groups(records, num_doctors):
+    # (group name, row mask) pairs: everyone, each doctor, patient type, appointment vs walk-in.
+    groups = [("all", np.ones(len(records), dtype=bool))]
+    doctor_ids = records["doctor_id"]
+    groups.extend((f"Dr {i+1}", doctor_ids == i) for i in range(num_doctors))
+    needs_xray = records["needs_xray"]
+    groups.extend([("Type A", needs_xray), ("Type B", ~needs_xray)])
+    is_appointment = records["is_appointment"]
+    groups.extend([("Appointment", is_appointment), ("Walk-in", ~is_appointment)])
+    return groups
+
+class WaitStatistics:
+    # Mean/variance and a t-digest per (group, metric), fed from patient record arrays and
+    # mergeable across replications and worker processes; memory does not grow with the
+    # number of patients seen.
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.moments = {}
+        self.digests = {}
+
+    @classmethod
+    def from_records(cls, records, num_doctors, compression=DEFAULT_COMPRESSION):
+        return cls(compression).update(records, num_doctors)
+
+    def _entry(self, key):
+        if key not in self.moments:
+            self.moments[key] = RunningMoments()
+            self.digests[key] = TDigest(self.compression)
+        return self.moments[key], self.digests[key]
+
+    def update(self, records, num_doctors):
+        for group, mask in record_groups(records, num_doctors):
+            rows = records[mask]
+            for metric in WAIT_METRICS:
+                moments, digest = self._entry((group, metric))
+                values = rows[metric]
+                moments.update(values)
+                digest.update(values)
+        return self
+
+    def merge(self, other):
+        for key, moments in other.moments.items():
+            own_moments, own_digest = self._entry(key)
+            own_moments.merge(moments)
+            own_digest.merge(other.digests[key])
+        return self
+
+    def report(self, quantiles=DEFAULT_QUANTILES):
+        # Rows of {group, metric, n, mean, std, p50, ...} in insertion order.
+        rows = []
+        for (group, metric), moments in self.moments.items():
+            row = {"group": group, "metric": metric, "n": moments.count, "mean": moments.mean if moments.count else float("nan"),
+                   "std": moments.std}
+            values = self.digests[(group, metric)].quantile(np.asarray(quantiles) / 100)
+            row.update({f"p{q}": float(v) for q, v in zip(quantiles, np.atleast_1d(values))})
+            rows.append(row)
+        return rows
+
+def print_wait_statistics(wait_stats, quantiles=DEFAULT_QUANTILES, metrics=WAIT_METRICS):
+    pct_headers = " | ".join(f"{f'p{q}':>7}" for q in quantiles)
+    print(f"{'Group':<12} | {'Metric':<16} | {'N':>7} | {'Mean':>7} | {'Std':>7} | {pct_headers}")
+    print("-" * (63 + 10 * len(quantiles)))
+    for row in wait_stats.report(quantiles):
+        if row["metric"] not in metrics or not row["n"]:
+            continue
+        pct_str = " | ".join(f"{row[f'p{q}']:>7.2f}" for q in quantiles)
+        print(f"{row['group']:<12} | {row['metric']:<16} | {row['n']:>7} | {row['mean']:>7.2f} | {row['std']:>7.2f} | {pct_str}")
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+import simpy
+
+import main as sim
+from event_log import ColumnarEventLog, ConsoleSink
+
+# ----------- Configuration -----------
+DEFAULT_TOP = 25
+# Generator methods of ClinicModel (and subclasses) that run as SimPy processes
+PROCESS_METHODS = ("patient", "patient_generator", "appointment_generator", "manage_doctor_breaks",
+                   "simulation_ender", "day_cycle")
+
+# ----------- Timers -----------
+
+class TimerStat:
+    __slots__ = ("calls", "seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {"calls": self.calls, "seconds": self.seconds}
+
+def _timed_call(function, stat):
+    perf_counter = time.perf_counter
+
+    def timed(*args):
+        start = perf_counter()
+        try:
+            return function(*args)
+        finally:
+            stat.calls += 1
+            stat.seconds += perf_counter() - start
+    return timed
+
+def _timed_steps(generator, stat):
+    # Drives a process generator on SimPy's behalf and times every step (from one resume
+    # to the next yield), forwarding sent values and thrown exceptions unchanged.
+    perf_counter = time.perf_counter
+    stat.started += 1
+    value = None
+    error = None
+    while True:
+        thrown, error = error, None
+        start = perf_counter()
+        try:
+            event = generator.throw(thrown) if thrown is not None else generator.send(value)
+        except StopIteration as stop:
+            stat.steps += 1
+            stat.seconds += perf_counter() - start
+            return stop.value
+        stat.steps += 1
+        stat.seconds += perf_counter() - start
+        try:
+            value = yield event
+        except GeneratorExit:
+            generator.close()
+            raise
+        except BaseException as exc:
+            value = None
+            error = exc
+
+class ProcessStat:
+    __slots__ = ("started", "steps", "seconds")
+
+    def __init__(self):
+        self.started = 0
+        self.steps = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {"started": self.started, "steps": self.steps, "seconds": self.seconds}
+
+class _TimedTrace:
+    # Stands in for a resource's StepTrace: times record() and passes everything else through.
+
+    def __init__(self, trace, stat):
+        self.trace = trace
+        self.record = _timed_call(trace.record, stat)
+
+    def __getattr__(self, name):
+        return getattr(self.trace, name)
+
+# ----------- Model Instrumentation -----------
+
+class ModelProfiler:
+    # Opt-in instrumentation of one SimPy model, attached before the run: per-process-type
+    # step counts and times (inclusive of the sampling, logging and queue tracking done
+    # inside a step), SimPy events scheduled by type, and timers around every random
+    # stream, the event sink and the queue traces. Timers add a little overhead per call.
+    # Models without SimPy processes (the fast engine) are only timed as a whole.
+
+    def __init__(self, model):
+        self.model = model
+        self.instrumented = isinstance(model, sim.ClinicModel)
+        self.processes = {}
+        self.events = Counter()
+        self.sampling = {}
+        self.logging = {}
+        self.queue_tracking = TimerStat()
+
+    def attach(self):
+        if not self.instrumented:
+            return self
+        model = self.model
+        for name in PROCESS_METHODS:
+            method = getattr(model, name, None)
+            if method is not None:
+                setattr(model, name, self._wrap_process(method, self.processes.setdefault(name, ProcessStat())))
+
+        for doctor_samplers in model.doctor_samplers:
+            for name, sampler in doctor_samplers.items():
+                doctor_samplers[name] = _timed_call(sampler, self.sampling.setdefault(name, TimerStat()))
+        model.xray_service_sampler = _timed_call(model.xray_service_sampler,
+                                                 self.sampling.setdefault("xray_service", TimerStat()))
+        model.xray_room_choice_sampler = _timed_call(model.xray_room_choice_sampler,
+                                                     self.sampling.setdefault("xray_room_choice", TimerStat()))
+        if hasattr(model.xray_dispatcher, "choice_sampler"):
+            model.xray_dispatcher.choice_sampler = model.xray_room_choice_sampler
+
+        if model._log is not None:
+            model._log = _timed_call(model._log, self.logging.setdefault("write", TimerStat()))
+        if model._emit is not None:
+            model._emit = _timed_call(model._emit, self.logging.setdefault("emit", TimerStat()))
+
+        resources = model.doctors + model.xray_resources
+        if model.xray_dispatcher.pool is not None:
+            resources.append(model.xray_dispatcher.pool)
+        for resource in resources:
+            resource.trace = _TimedTrace(resource.trace, self.queue_tracking)
+
+        env = model.env
+        schedule = env.schedule
+        events = self.events
+
+        def counting_schedule(event, priority=simpy.events.NORMAL, delay=0):
+            events[type(event).__name__] += 1
+            return schedule(event, priority, delay)
+        env.schedule = counting_schedule
+        return self
+
+    def _wrap_process(self, method, stat):
+        def start(*args):
+            return _timed_steps(method(*args), stat)
+        return start
+
+    def report(self, wall_seconds):
+        process_seconds = sum(stat.seconds for stat in self.processes.values())
+        report = {
+            "model": type(self.model).__name__,
+            "seed": self.model.seed,
+            "model_version": sim.MODEL_VERSION,
+            "instrumented": self.instrumented,
+            "wall_seconds": wall_seconds,
+            "patients": self.model.total_patients_generated,
+        }
+        if self.instrumented:
+            report.update({
+                "processes": {name: stat.as_dict() for name, stat in self.processes.items()},
+                # Event loop, scheduling and resource bookkeeping outside process steps
+                "kernel_seconds": wall_seconds - process_seconds,
+                "simpy_events": dict(self.events.most_common()),
+                "simpy_events_total": sum(self.events.values()),
+                "sampling": {name: stat.as_dict() for name, stat in self.sampling.items()},
+                "sampling_seconds": sum(stat.seconds for stat in self.sampling.values()),
+                "logging": {name: stat.as_dict() for name, stat in self.logging.items()},
+                "logging_seconds": sum(stat.seconds for stat in self.logging.values()),
+                "queue_tracking": self.queue_tracking.as_dict(),
+            })
+        return report
+
+# ----------- Profiled Runs -----------
+
+def _top_functions(profile, top):
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = []
+    for (filename, line, function), (_, calls, self_seconds, cumulative_seconds, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({function})", "calls": calls,
+                     "self_seconds": self_seconds, "cumulative_seconds": cumulative_seconds})
+    rows.sort(key=lambda r: r["self_seconds"], reverse=True)
+    return rows[:top]
+
+def profile_model(model, cprofile=False, trace_memory=False, top=DEFAULT_TOP):
+    # Runs a freshly built model with instrumentation and returns its profile report;
+    # cProfile and tracemalloc are opt-in because they slow the run down considerably.
+    profiler = ModelProfiler(model).attach()
+    profile = cProfile.Profile() if cprofile else None
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if profile is not None:
+        profile.enable()
+    try:
+        model.run()
+    finally:
+        if profile is not None:
+            profile.disable()
+    report = profiler.report(time.perf_counter() - start)
+    if profile is not None:
+        report["cprofile"] = _top_functions(profile, top)
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        report["tracemalloc"] = {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": [{"location": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:top]],
+        }
+    return report
+
+def save_report(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+def print_report(report):
+    wall = report["wall_seconds"]
+    print(f"{report['model']} seed {report['seed']}: {wall * 1000:.1f} ms, {report['patients']} patients")
+    if not report["instrumented"]:
+        return
+    print(f"\n{'Process':<26} | {'Started':>8} | {'Steps':>8} | {'ms':>8} | {'% wall':>6}")
+    print("-" * 68)
+    for name, stat in report["processes"].items():
+        print(f"{name:<26} | {stat['started']:>8} | {stat['steps']:>8} | {stat['seconds'] * 1000:>8.2f} | {stat['seconds'] / wall:>6.1%}")
+    print(f"{'(SimPy kernel)':<26} | {'':>8} | {'':>8} | {report['kernel_seconds'] * 1000:>8.2f} | {report['kernel_seconds'] / wall:>6.1%}")
+    print(f"\nInside process steps: sampling {report['sampling_seconds'] * 1000:.2f} ms, "
+          f"logging {report['logging_seconds'] * 1000:.2f} ms, "
+          f"queue tracking {report['queue_tracking']['seconds'] * 1000:.2f} ms")
+    print(f"SimPy events scheduled: {report['simpy_events_total']} "
+          f"({', '.join(f'{name}: {count}' for name, count in report['simpy_events'].items())})")
+    if "cprofile" in report:
+        print(f"\n{'Function (by self time)':<60} | {'Calls':>8} | {'Self ms':>8} | {'Cum ms':>8}")
+        print("-" * 94)
+        for row in report["cprofile"]:
+            print(f"{row['function'][:60]:<60} | {row['calls']:>8} | {row['self_seconds'] * 1000:>8.2f} | {row['cumulative_seconds'] * 1000:>8.2f}")
+    if "tracemalloc" in report:
+        print(f"\nPeak traced memory: {report['tracemalloc']['peak_bytes'] / 2**20:.2f} MiB")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Profile one run of the clinic simulation.")
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED)
+    parser.add_argument("--engine", choices=("simpy", "fast"), default="simpy")
+    parser.add_argument("--event-log", choices=("none", "columnar", "console"), default="none",
+                        help="Event sink to include in the profile (console output goes to stderr).")
+    parser.add_argument("--cprofile", action="store_true", help="Add the top functions from cProfile.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Add peak memory and top allocation sites.")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP)
+    parser.add_argument("--out", metavar="PATH", help="Write the JSON profile report here.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    import replications
+    args = parse_args()
+    event_sink = {"none": None, "columnar": ColumnarEventLog(), "console": ConsoleSink(sys.stderr)}[args.event_log]
+    model = replications.build_model(args.seed, sim.DEFAULT_SCENARIO, args.engine, event_sink)
+    report = profile_model(model, cprofile=args.cprofile, trace_memory=args.tracemalloc, top=args.top)
+    print_report(report)
+    if args.out:
+        save_report(report, args.out)
+        print(f"\nSaved profile report: {args.out}")
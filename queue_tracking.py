@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+from operator import attrgetter
+
+import numpy as np
+import simpy
+from simpy.resources.resource import PriorityRequest, SortedQueue
+
+# ----------- Configuration -----------
+INITIAL_TRACE_CAPACITY = 512
+# Breaks are served ahead of every waiting request
+BREAK_PRIORITY = float("-inf")
+_request_key = attrgetter("key")
+
+# ----------- Step Traces -----------
+
+class StepTrace:
+    # Right-continuous step functions of queue length and busy servers for one resource.
+    # A point is stored only when one of the two values changes; simultaneous changes at
+    # the same instant collapse into a single point.
+    __slots__ = ("times", "queue_lengths", "busy", "size", "_last_time", "_last_queue", "_last_busy")
+
+    def __init__(self, capacity=INITIAL_TRACE_CAPACITY, start_time=0.0):
+        self.times = np.empty(capacity, dtype=np.float64)
+        self.queue_lengths = np.empty(capacity, dtype=np.int32)
+        self.busy = np.empty(capacity, dtype=np.int32)
+        self.times[0] = start_time
+        self.queue_lengths[0] = 0
+        self.busy[0] = 0
+        self.size = 1
+        self._last_time = start_time
+        self._last_queue = 0
+        self._last_busy = 0
+
+    def record(self, time, queue_length, busy):
+        if queue_length == self._last_queue and busy == self._last_busy:
+            return
+        idx = self.size - 1
+        if time != self._last_time:
+            idx += 1
+            if idx == len(self.times):
+                self._grow()
+            self.times[idx] = time
+            self.size = idx + 1
+            self._last_time = time
+        self.queue_lengths[idx] = queue_length
+        self.busy[idx] = busy
+        self._last_queue = queue_length
+        self._last_busy = busy
+
+    @classmethod
+    def from_points(cls, points, start_time=0.0):
+        # Builds a trace from a flat sequence (ideally an array('d') buffer) of time, queue
+        # length, busy triples in time order, e.g. as collected by an engine without SimPy
+        # resources. Of several points at the same instant only the last is kept, as record() does.
+        raw = np.concatenate(([start_time, 0, 0], np.asarray(points, dtype=np.float64))).reshape(-1, 3)
+        keep = np.empty(len(raw), dtype=bool)
+        np.not_equal(raw[1:, 0], raw[:-1, 0], out=keep[:-1])
+        keep[-1] = True
+        raw = raw[keep]
+        n = len(raw)
+        trace = cls(capacity=n, start_time=start_time)
+        trace.times[:] = raw[:, 0]
+        trace.queue_lengths[:] = raw[:, 1]
+        trace.busy[:] = raw[:, 2]
+        trace.size = n
+        trace._last_time = float(trace.times[n - 1])
+        trace._last_queue = int(trace.queue_lengths[n - 1])
+        trace._last_busy = int(trace.busy[n - 1])
+        return trace
+
+    def _grow(self):
+        new_capacity = 2 * len(self.times)
+        for name in ("times", "queue_lengths", "busy"):
+            old = getattr(self, name)
+            new = np.empty(new_capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def arrays(self):
+        n = self.size
+        return self.times[:n], self.queue_lengths[:n], self.busy[:n]
+
+    def time_average(self, values, t_end, t_start=0.0):
+        # Exact integral of the step function over [t_start, t_end] divided by its length.
+        if t_end <= t_start:
+            return float("nan")
+        n = self.size
+        clipped = np.clip(self.times[:n], t_start, t_end)
+        durations = np.diff(np.append(clipped, t_end))
+        return float(np.dot(durations, values[:n])) / (t_end - t_start)
+
+    def average_queue_length(self, t_end, t_start=0.0):
+        return self.time_average(self.queue_lengths, t_end, t_start)
+
+    def utilization(self, capacity, t_end, t_start=0.0):
+        return self.time_average(self.busy, t_end, t_start) / capacity
+
+    def max_queue_length(self):
+        return int(self.queue_lengths[:self.size].max())
+
+    def sample(self, grid):
+        # Values of the step function at arbitrary times, e.g. a common plotting grid.
+        n = self.size
+        idx = np.searchsorted(self.times[:n], grid, side="right") - 1
+        idx = np.clip(idx, 0, n - 1)
+        return self.queue_lengths[idx]
+
+# ----------- Tracked Resources -----------
+
+class ObservedSortedQueue(SortedQueue):
+    # SimPy's priority waiting line, calling on_change after every insertion and removal,
+    # including the removal of a request cancelled before it was granted. A request is
+    # inserted by binary search after any equal keys, the order SimPy's stable re-sort of the
+    # whole line gives, so long pooled lines do not cost a sort per request.
+    on_change = None
+
+    def append(self, item):
+        if self.maxlen is not None and len(self) >= self.maxlen:
+            raise RuntimeError("Cannot append event. Queue is full.")
+        bisect.insort_right(self, item, key=_request_key)
+        if self.on_change is not None:
+            self.on_change()
+
+    def pop(self, index=-1):
+        item = super().pop(index)
+        if self.on_change is not None:
+            self.on_change()
+        return item
+
+    def remove(self, item):
+        super().remove(item)
+        if self.on_change is not None:
+            self.on_change()
+
+class BreakRequest(PriorityRequest):
+    # Takes a server off duty: it is granted ahead of every waiting request as soon as a
+    # server is free (the current user is never preempted) and held until released. Held
+    # and waiting breaks count neither as busy servers nor as queue length in the trace.
+    def __init__(self, resource):
+        resource.pending_breaks += 1
+        super().__init__(resource, priority=BREAK_PRIORITY, preempt=False)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        self.resource.pending_breaks -= 1
+
+class TrackedPriorityResource(simpy.PriorityResource):
+    # Records a trace point from inside SimPy's own request/release handling, so every
+    # change of the queue or of the number of users is captured at the instant it happens.
+    # A request cancelled before it is granted (e.g. on interrupt) is only reflected in the
+    # trace at the next request or release of the resource. on_change, if set, is called
+    # after every change of the queue or the users, cancellations included; it may be
+    # called more than once per change, so listeners read the state rather than count calls.
+    PutQueue = ObservedSortedQueue
+
+    def __init__(self, env, capacity=1):
+        super().__init__(env, capacity)
+        self.trace = StepTrace(start_time=env.now)
+        self.on_change = None
+        self.pending_breaks = 0
+
+    def watch(self, listener):
+        self.on_change = listener
+        self.put_queue.on_change = listener
+
+    def request_break(self):
+        return BreakRequest(self)
+
+    def waiting(self):
+        # Patients waiting, i.e. the queue without any break request
+        if not self.pending_breaks:
+            return len(self.put_queue)
+        return sum(1 for request in self.put_queue if not isinstance(request, BreakRequest))
+
+    def serving(self):
+        if not self.pending_breaks:
+            return len(self.users)
+        return sum(1 for request in self.users if not isinstance(request, BreakRequest))
+
+    def _trigger_put(self, get_event):
+        super()._trigger_put(get_event)
+        self.trace.record(self._env.now, self.waiting(), self.serving())
+        if self.on_change is not None:
+            self.on_change()
+
+    def _trigger_get(self, put_event):
+        super()._trigger_get(put_event)
+        self.trace.record(self._env.now, self.waiting(), self.serving())
+        if self.on_change is not None:
+            self.on_change()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import functools
+import math
+import os
+import shutil
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import main as sim
+from cache import DEFAULT_CACHE_MAX_BYTES, ResultCache
+from event_log import ColumnarEventLog
+from patient_records import WaitStatistics, print_wait_statistics
+from sampling import NATIVE
+
+# ----------- Configuration -----------
+DEFAULT_REPLICATIONS = 200
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_PERCENTILES = (5, 50, 95)
+ENGINES = ("simpy", "fast")
+
+# ----------- Seeds -----------
+
+def spawn_seeds(base_seed, num_replications):
+    # Independent, reproducible per-replication seeds: replication i gets the same seed
+    # for a given base seed, so scenarios can be compared on common random numbers.
+    children = np.random.SeedSequence(base_seed).spawn(num_replications)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+# ----------- Workers -----------
+
+def build_model(seed, scenario=sim.DEFAULT_SCENARIO, engine="simpy", event_sink=None, variates=NATIVE):
+    if engine == "fast":
+        if event_sink is not None:
+            raise ValueError("The fast engine does not write event logs; use the simpy engine with a trace directory.")
+        import fast_engine
+        return fast_engine.FastClinicModel(seed=seed, scenario=scenario, variates=variates)
+    if engine != "simpy":
+        raise ValueError(f"Unknown engine '{engine}'. Choose from: {', '.join(ENGINES)}")
+    return sim.ClinicModel(seed=seed, event_sink=event_sink, scenario=scenario, variates=variates)
+
+def run_single_replication(seed, trace_dir=None, scenario=sim.DEFAULT_SCENARIO, engine="simpy"):
+    # Replications run with logging off unless a trace directory asks for a columnar event log.
+    event_sink = ColumnarEventLog() if trace_dir is not None else None
+    model = build_model(seed, scenario, engine, event_sink).run()
+    summary = model.collect_run_summary()
+    if event_sink is not None:
+        event_sink.save(trace_file(trace_dir, seed))
+    summary["seed"] = seed
+    summary["events_processed"] = model.events_processed
+    return summary
+
+def run_replication_with_extras(seed, trace_dir=None, scenario=sim.DEFAULT_SCENARIO, engine="simpy",
+                                queue_grid=None, wait_stats=False, profile_dir=None, export_dir=None,
+                                export_format="npy"):
+    # Same as run_single_replication, plus optional per-replication extras: queue lengths
+    # sampled on queue_grid for band plots and streaming waiting-time estimators. Only these
+    # small objects travel back to the parent, never the per-patient records themselves.
+    # With profile_dir the run is instrumented and its profile report saved there; with
+    # export_dir its patient records and queue traces are written there as partitions.
+    event_sink = ColumnarEventLog() if trace_dir is not None else None
+    model = build_model(seed, scenario, engine, event_sink)
+    if profile_dir is not None:
+        import profiling
+        profiling.save_report(profiling.profile_model(model), profile_file(profile_dir, seed))
+    else:
+        model.run()
+    if event_sink is not None:
+        event_sink.save(trace_file(trace_dir, seed))
+    if export_dir is not None:
+        import results_export
+        results_export.write_replication(export_dir, seed, model, export_format)
+    summary = model.collect_run_summary()
+    summary["seed"] = seed
+    summary["events_processed"] = model.events_processed
+    extras = {}
+    if queue_grid is not None:
+        extras["queue_samples"] = model.sample_queue_lengths(queue_grid)
+    if wait_stats:
+        extras["wait_stats"] = WaitStatistics.from_records(model.patient_records.to_array(), scenario.num_doctors)
+    return summary, extras
+
+# ----------- Aggregation -----------
+
+def t_critical(confidence, df):
+    p = 0.5 + confidence / 2
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    # Cornish-Fisher expansion of the Student-t quantile around the normal quantile.
+    z = statistics.NormalDist().inv_cdf(p)
+    return (z
+            + (z**3 + z) / (4 * df)
+            + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3))
+
+def aggregate_summaries(summaries, confidence=DEFAULT_CONFIDENCE, percentiles=DEFAULT_PERCENTILES):
+    aggregated = {}
+    if not summaries:
+        return aggregated
+    metric_names = [name for name in summaries[0] if name != "seed"]
+    for name in metric_names:
+        values = np.array([s[name] for s in summaries], dtype=float)
+        values = values[~np.isnan(values)]
+        n = len(values)
+        stats = {"n": n, "mean": float("nan"), "std": float("nan"),
+                 "ci_low": float("nan"), "ci_high": float("nan")}
+        if n > 0:
+            mean = float(values.mean())
+            stats["mean"] = mean
+            if n > 1:
+                std = float(values.std(ddof=1))
+                half_width = t_critical(confidence, n - 1) * std / math.sqrt(n)
+                stats.update(std=std, ci_low=mean - half_width, ci_high=mean + half_width)
+        for q in percentiles:
+            stats[f"p{q}"] = float(np.percentile(values, q)) if n > 0 else float("nan")
+        aggregated[name] = stats
+    return aggregated
+
+# ----------- Runner -----------
+
+def trace_file(trace_dir, seed):
+    return os.path.join(trace_dir, f"events-{seed}.npy")
+
+def profile_file(profile_dir, seed):
+    return os.path.join(profile_dir, f"profile-{seed}.json")
+
+def run_replications(num_replications=DEFAULT_REPLICATIONS, base_seed=sim.RANDOM_SEED, workers=None,
+                     chunksize=None, confidence=DEFAULT_CONFIDENCE, percentiles=DEFAULT_PERCENTILES,
+                     trace_dir=None, scenario=sim.DEFAULT_SCENARIO, cache=None, queue_grid=None, engine="simpy",
+                     wait_stats=False, profile_dir=None, export_dir=None, export_format="npy"):
+    seeds = spawn_seeds(base_seed, num_replications)
+    workers = workers or os.cpu_count() or 1
+    if trace_dir is not None:
+        os.makedirs(trace_dir, exist_ok=True)
+    if export_dir is not None:
+        import results_export
+        results_export.prepare(export_dir)
+
+    # Replications already in the result cache are not simulated again. The cache holds no
+    # queue samples, waiting-time estimators, profiles or exported records, so every
+    # replication is run when they are requested.
+    with_extras = queue_grid is not None or wait_stats or profile_dir is not None or export_dir is not None
+    summaries = [None] * num_replications
+    if cache is not None and not with_extras:
+        for idx, seed in enumerate(seeds):
+            cached = cache.get(scenario, seed, with_trace=trace_dir is not None, engine=engine)
+            if cached is not None:
+                summaries[idx] = cached
+                if trace_dir is not None:
+                    shutil.copyfile(cache.trace_path(scenario, seed, engine), trace_file(trace_dir, seed))
+    pending = [idx for idx, summary in enumerate(summaries) if summary is None]
+    pending_seeds = [seeds[idx] for idx in pending]
+
+    if not with_extras:
+        run_one = functools.partial(run_single_replication, trace_dir=trace_dir, scenario=scenario, engine=engine)
+    else:
+        run_one = functools.partial(run_replication_with_extras, trace_dir=trace_dir, scenario=scenario,
+                                    engine=engine, queue_grid=queue_grid, wait_stats=wait_stats,
+                                    profile_dir=profile_dir, export_dir=export_dir, export_format=export_format)
+    if workers == 1 or len(pending_seeds) <= 1:
+        computed = [run_one(seed) for seed in pending_seeds]
+    else:
+        # Several replications per task keep IPC overhead small relative to simulation work.
+        if chunksize is None:
+            chunksize = max(1, len(pending_seeds) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            computed = list(executor.map(run_one, pending_seeds, chunksize=chunksize))
+
+    extras = []
+    if with_extras:
+        computed, extras = zip(*computed) if computed else ((), ())
+
+    for idx, summary in zip(pending, computed):
+        summaries[idx] = summary
+        if cache is not None:
+            seed = seeds[idx]
+            cache.put(scenario, seed, summary, trace_file(trace_dir, seed) if trace_dir is not None else None,
+                      engine=engine)
+
+    results = {
+        "base_seed": base_seed,
+        "seeds": seeds,
+        "replications": summaries,
+        "cache_hits": num_replications - len(pending),
+        "summary": aggregate_summaries(summaries, confidence, percentiles),
+    }
+    if queue_grid is not None:
+        results["queue_grid"] = queue_grid
+        results["queue_samples"] = {name: np.stack([e["queue_samples"][name] for e in extras])
+                                    for name in ("doctors", "xray_rooms")}
+    if export_dir is not None:
+        results["export_dir"] = results_export.finalize(export_dir, summaries, scenario, engine, export_format)
+    if wait_stats:
+        results["wait_stats"] = functools.reduce(WaitStatistics.merge, (e["wait_stats"] for e in extras),
+                                                 WaitStatistics())
+    return results
+
+def print_summary_table(results, confidence=DEFAULT_CONFIDENCE, percentiles=DEFAULT_PERCENTILES):
+    summary = results["summary"]
+    ci_header = f"{confidence:.0%} CI"
+    pct_headers = " | ".join(f"{f'p{q}':>8}" for q in percentiles)
+    print(f"{'Metric':<24} | {'Mean':>10} | {ci_header:>23} | {pct_headers}")
+    print("-" * (66 + 11 * len(percentiles)))
+    for name, stats in summary.items():
+        ci_str = f"[{stats['ci_low']:.2f}, {stats['ci_high']:.2f}]"
+        pct_str = " | ".join(f"{stats[f'p{q}']:>8.2f}" for q in percentiles)
+        print(f"{name:<24} | {stats['mean']:>10.2f} | {ci_str:>23} | {pct_str}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run independent replications of the outpatient clinic simulation.")
+    parser.add_argument("-n", "--replications", type=int, default=DEFAULT_REPLICATIONS)
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED, help="Base seed for the replication seed sequence.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--trace-dir", default=None, help="Save a columnar event log (.npy) per replication here.")
+    parser.add_argument("--cache-dir", default=None, help="Reuse and store per-replication results in this cache.")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_MAX_BYTES / 2**20)
+    parser.add_argument("--engine", choices=ENGINES, default="simpy",
+                        help="simpy (reference model) or fast (heap-based event loop, no event logs).")
+    parser.add_argument("--plot-bands", action="store_true",
+                        help="Write median/percentile queue-length band figures across all replications.")
+    parser.add_argument("--out-dir", default="outputs", help="Directory for band figures.")
+    parser.add_argument("--wait-stats", action="store_true",
+                        help="Report p50/p90/p99 waits by doctor, patient type and arrival kind, merged over replications.")
+    parser.add_argument("--config", metavar="PATH", help="Clinic config file (.json, .toml, .yaml), see config.py.")
+    parser.add_argument("--export-dir", default=None,
+                        help="Write patient records, queue traces and summaries here as a columnar result set.")
+    parser.add_argument("--export-format", choices=("npy", "parquet"), default="npy")
+    parser.add_argument("--profile-dir", default=None,
+                        help="Instrument every replication and save its JSON profile report here.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    cache = ResultCache(args.cache_dir, int(args.cache_max_mb * 2**20)) if args.cache_dir else None
+    scenario = sim.DEFAULT_SCENARIO
+    if args.config:
+        import config
+        scenario = config.load_config(args.config)
+    queue_grid = None
+    if args.plot_bands:
+        import reporting
+        queue_grid = reporting.band_grid(scenario)
+    results = run_replications(args.replications, base_seed=args.seed, workers=args.workers,
+                               chunksize=args.chunksize, confidence=args.confidence, trace_dir=args.trace_dir,
+                               cache=cache, queue_grid=queue_grid, engine=args.engine, wait_stats=args.wait_stats,
+                               scenario=scenario, profile_dir=args.profile_dir, export_dir=args.export_dir,
+                               export_format=args.export_format)
+    print(f"Replications: {args.replications} ({results['cache_hits']} from cache), base seed: {args.seed}")
+    print_summary_table(results, confidence=args.confidence)
+    if args.export_dir:
+        print(f"\nExported result set: {args.export_dir}")
+    if args.wait_stats:
+        print("\n--- Waiting Time Statistics (minutes, all replications) ---")
+        print_wait_statistics(results["wait_stats"])
+    if args.plot_bands:
+        for path in reporting.plot_queue_bands(results["queue_samples"], queue_grid, scenario, args.out_dir):
+            print(f"Saved figure: {path}")
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+
+import main as sim
+
+# ----------- Configuration -----------
+OUTPUT_DIR = "outputs"
+BAND_PERCENTILES = (10, 25, 50, 75, 90)
+DEFAULT_BAND_STEP = 1.0
+
+# ----------- Backend -----------
+
+def get_pyplot():
+    # matplotlib is imported only when a figure is actually rendered, always with the
+    # non-interactive Agg backend so reporting works on headless batch nodes.
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def _save(fig, out_dir, filename):
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, filename)
+    fig.savefig(path, dpi=110)
+    return path
+
+def _mark_day_phases(ax, scenario, lunch_end_label="Lunch end"):
+    ax.axvline(x=scenario.lunch_start, color='grey', linestyle=':', linewidth=1, label=f'Lunch start ({scenario.lunch_start})')
+    ax.axvline(x=scenario.lunch_end, color='dimgrey', linestyle='--', linewidth=1.2, label=f'{lunch_end_label} ({scenario.lunch_end})')
+    ax.axvline(x=scenario.walkin_cutoff_time, color='blue', linestyle='-.', linewidth=1.2, label=f'Walk-in cutoff ({scenario.walkin_cutoff_time})')
+    ax.axvline(x=scenario.sim_time, color='red', linestyle='-', linewidth=1.5, label=f'Appointment cutoff ({scenario.sim_time})')
+
+# ----------- Single Run -----------
+
+def plot_run_queue_lengths(model, out_dir=OUTPUT_DIR):
+    plt = get_pyplot()
+    scenario = model.scenario
+    end_time = model.env.now
+    paths = []
+
+    title_suffix = ""
+    if model.appointment_only_doctor_id is not None:
+        title_suffix += f"\nDr {model.appointment_only_doctor_id+1} Appointment-only"
+    if model.walkin_only_doctor_id is not None:
+        title_suffix += f", Dr {model.walkin_only_doctor_id+1} Walk-in-only"
+
+    fig, ax = plt.subplots(figsize=(14, 7))
+    for i, d_res in enumerate(model.doctors):
+        trace_times, trace_queue, _ = d_res.trace.arrays()
+        ax.step(np.append(trace_times, end_time), np.append(trace_queue, trace_queue[-1]),
+                where='post', label=f'Dr {i+1} Queue', alpha=0.8)
+    _mark_day_phases(ax, scenario, "Lunch end / Speedup")
+    ax.set_xlabel("Time (minutes)")
+    ax.set_ylabel("Queue length")
+    ax.set_title(f"Doctor Queue Lengths (Punctuality: Uniform [{scenario.punctuality_min},{scenario.punctuality_max}])\nSeed: {model.seed}{title_suffix}")
+    ax.legend(fontsize='small', loc='upper left')
+    ax.grid(True, linestyle=':', alpha=0.7)
+    fig.tight_layout()
+    paths.append(_save(fig, out_dir, "doctor_queue_lengths.png"))
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(14, 7))
+    for room_idx, xr in enumerate(model.xray_resources):
+        trace_times, trace_queue, _ = xr.trace.arrays()
+        ax.step(np.append(trace_times, end_time), np.append(trace_queue, trace_queue[-1]),
+                where='post', label=f"X-ray Room {room_idx+1} Queue", alpha=0.8)
+    _mark_day_phases(ax, scenario)
+    ax.set_xlabel("Time (minutes)")
+    ax.set_ylabel("X-ray room queue length")
+    ax.set_title(f"X-ray Room Queue Lengths ({scenario.num_xray_rooms} Rooms, {sim.XRAY_MORNING_SLOWDOWN:g}x slower before lunch)\nSeed: {model.seed}{title_suffix}")
+    ax.legend(fontsize='small', loc='upper left')
+    ax.grid(True, linestyle=':', alpha=0.7)
+    fig.tight_layout()
+    paths.append(_save(fig, out_dir, "xray_queue_lengths.png"))
+    plt.close(fig)
+    return paths
+
+# ----------- Replication Bands -----------
+
+def band_grid(scenario, step=DEFAULT_BAND_STEP, horizon=None):
+    # Runs end at different times; past its end a run's queues are empty, which the step
+    # traces already report, so one common grid covers every replication.
+    if horizon is None:
+        horizon = 1.5 * scenario.sim_time
+    return np.arange(0.0, horizon + step, step)
+
+def queue_bands(samples, percentiles=BAND_PERCENTILES):
+    # samples: (replications, resources, grid points) -> {percentile: (resources, grid points)}
+    stacked = np.asarray(samples, dtype=np.float32)
+    return {q: np.percentile(stacked, q, axis=0) for q in percentiles}
+
+def _plot_band_panels(plt, grid, bands, labels, scenario, title, ylabel):
+    n = len(labels)
+    cols = min(n, 4)
+    rows = (n + cols - 1) // cols
+    fig, axes = plt.subplots(rows, cols, figsize=(4.2 * cols, 3.2 * rows), sharex=True, squeeze=False)
+    for idx, label in enumerate(labels):
+        ax = axes[idx // cols][idx % cols]
+        ax.fill_between(grid, bands[10][idx], bands[90][idx], step='post', alpha=0.2, color='tab:blue', label='p10-p90')
+        ax.fill_between(grid, bands[25][idx], bands[75][idx], step='post', alpha=0.35, color='tab:blue', label='p25-p75')
+        ax.step(grid, bands[50][idx], where='post', color='tab:blue', linewidth=1.2, label='median')
+        ax.axvspan(scenario.lunch_start, scenario.lunch_end, color='grey', alpha=0.1)
+        ax.axvline(x=scenario.walkin_cutoff_time, color='blue', linestyle='-.', linewidth=0.8)
+        ax.axvline(x=scenario.sim_time, color='red', linestyle='-', linewidth=0.8)
+        ax.set_title(label, fontsize='small')
+        ax.grid(True, linestyle=':', alpha=0.7)
+        if idx % cols == 0:
+            ax.set_ylabel(ylabel)
+    for idx in range(n, rows * cols):
+        axes[idx // cols][idx % cols].set_visible(False)
+    axes[0][0].legend(fontsize='x-small', loc='upper left')
+    fig.suptitle(title)
+    fig.supxlabel("Time (minutes)")
+    fig.tight_layout()
+    return fig
+
+def plot_queue_bands(queue_samples, grid, scenario, out_dir=OUTPUT_DIR, percentiles=BAND_PERCENTILES):
+    plt = get_pyplot()
+    num_replications = len(queue_samples["doctors"])
+    paths = []
+
+    bands = queue_bands(queue_samples["doctors"], percentiles)
+    labels = [f"Dr {i+1}" for i in range(bands[50].shape[0])]
+    fig = _plot_band_panels(plt, grid, bands, labels, scenario,
+                            f"Doctor Queue Lengths across {num_replications} replications", "Queue length")
+    paths.append(_save(fig, out_dir, "doctor_queue_bands.png"))
+    plt.close(fig)
+
+    bands = queue_bands(queue_samples["xray_rooms"], percentiles)
+    labels = [f"X-ray Room {i+1}" for i in range(bands[50].shape[0])]
+    fig = _plot_band_panels(plt, grid, bands, labels, scenario,
+                            f"X-ray Room Queue Lengths across {num_replications} replications", "Queue length")
+    paths.append(_save(fig, out_dir, "xray_queue_bands.png"))
+    plt.close(fig)
+    return paths
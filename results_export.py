@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+import main as sim
+from cache import scenario_fingerprint
+from patient_records import PATIENT_DTYPE
+
+# ----------- Configuration -----------
+EXPORT_FORMATS = ("npy", "parquet")
+TABLES = ("patients", "traces", "summaries")
+MANIFEST_NAME = "manifest.json"
+
+# Resource kinds in the traces table
+RESOURCE_DOCTOR, RESOURCE_XRAY_ROOM, RESOURCE_XRAY_POOL = 0, 1, 2
+
+EXPORT_PATIENT_DTYPE = np.dtype([("seed", "i8")] + [(name, PATIENT_DTYPE.fields[name][0]) for name in PATIENT_DTYPE.names])
+TRACE_DTYPE = np.dtype([
+    ("seed", "i8"),
+    ("resource_kind", "i1"),
+    ("resource_id", "i2"),
+    ("time", "f8"),
+    ("queue_length", "i4"),
+    ("busy", "i4"),
+])
+
+# ----------- Layout -----------
+# A result set is a directory with one subdirectory per table. Every replication is written
+# by the worker that ran it, as its own partition file named by seed, so workers never share
+# a file or need a lock; files appear atomically (written under a temporary name, then
+# renamed). The parent adds the summaries table and a manifest once the run is complete and
+# can merge the NumPy partitions of each table into one file that is read back memory-mapped.
+#
+#   <dir>/manifest.json
+#   <dir>/patients/part-<seed>.npy     one row per departed patient (PATIENT_DTYPE plus seed)
+#   <dir>/traces/part-<seed>.npy       queue step traces of every resource (TRACE_DTYPE)
+#   <dir>/summaries/part-0.npy         one row per replication (seed plus every summary metric)
+
+def partition_path(out_dir, table, part, fmt="npy"):
+    return os.path.join(out_dir, table, f"part-{part}.{fmt}")
+
+def table_path(out_dir, table):
+    return os.path.join(out_dir, f"{table}.npy")
+
+def _write_atomic(array, path, fmt):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("Writing Parquet result sets requires pyarrow (pip install pyarrow).") from exc
+        pq.write_table(pa.table({name: array[name] for name in array.dtype.names}), tmp_path)
+    else:
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+    os.replace(tmp_path, path)
+    return path
+
+def _read_partition(path):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        columns = {name: table.column(name).to_numpy() for name in table.column_names}
+        array = np.empty(table.num_rows, dtype=[(name, column.dtype) for name, column in columns.items()])
+        for name, column in columns.items():
+            array[name] = column
+        return array
+    return np.load(path, mmap_mode="r")
+
+# ----------- Writers -----------
+
+def prepare(out_dir):
+    # Removes the tables and manifest of an earlier result set in out_dir, so partitions of
+    # two runs are never mixed; other files in the directory are left alone.
+    os.makedirs(out_dir, exist_ok=True)
+    stale = [os.path.join(out_dir, MANIFEST_NAME)] + [table_path(out_dir, table) for table in TABLES]
+    for table in TABLES:
+        stale += glob.glob(os.path.join(out_dir, table, "part-*"))
+    for path in stale:
+        if os.path.exists(path):
+            os.remove(path)
+
+def patient_table(seed, model):
+    records = model.patient_records.to_array()
+    table = np.empty(len(records), dtype=EXPORT_PATIENT_DTYPE)
+    table["seed"] = seed
+    for name in PATIENT_DTYPE.names:
+        table[name] = records[name]
+    return table
+
+def trace_table(seed, model):
+    traces = [(RESOURCE_DOCTOR, i, trace) for i, trace in enumerate(model.doctor_traces)]
+    traces += [(RESOURCE_XRAY_ROOM, i, trace) for i, trace in enumerate(model.xray_traces)]
+    dispatcher = getattr(model, "xray_dispatcher", None)
+    if dispatcher is not None and dispatcher.pool is not None:
+        traces.append((RESOURCE_XRAY_POOL, 0, dispatcher.pool.trace))
+    table = np.empty(sum(trace.size for _, _, trace in traces), dtype=TRACE_DTYPE)
+    table["seed"] = seed
+    start = 0
+    for kind, resource_id, trace in traces:
+        times, queue_lengths, busy = trace.arrays()
+        rows = table[start:start + len(times)]
+        rows["resource_kind"] = kind
+        rows["resource_id"] = resource_id
+        rows["time"] = times
+        rows["queue_length"] = queue_lengths
+        rows["busy"] = busy
+        start += len(times)
+    return table
+
+def write_replication(out_dir, seed, model, fmt="npy"):
+    # Called in the worker right after its run: only this replication's partitions are written.
+    _write_atomic(patient_table(seed, model), partition_path(out_dir, "patients", seed, fmt), fmt)
+    _write_atomic(trace_table(seed, model), partition_path(out_dir, "traces", seed, fmt), fmt)
+
+def summary_table(summaries):
+    names = [name for name in summaries[0] if name != "seed"] if summaries else []
+    table = np.empty(len(summaries), dtype=[("seed", "i8")] + [(name, "f8") for name in names])
+    table["seed"] = [s["seed"] for s in summaries]
+    for name in names:
+        table[name] = [s[name] for s in summaries]
+    return table
+
+def write_summaries(out_dir, summaries, fmt="npy"):
+    return _write_atomic(summary_table(summaries), partition_path(out_dir, "summaries", 0, fmt), fmt)
+
+def consolidate(out_dir, table):
+    # Streams the NumPy partitions of one table into a single .npy file, one partition in
+    # memory at a time, and removes them; the merged file is read back memory-mapped.
+    parts = sorted(glob.glob(os.path.join(out_dir, table, "part-*.npy")))
+    if not parts:
+        return None
+    arrays = [np.load(path, mmap_mode="r") for path in parts]
+    path = table_path(out_dir, table)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    merged = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=arrays[0].dtype,
+                                       shape=(sum(len(a) for a in arrays),))
+    start = 0
+    for array in arrays:
+        merged[start:start + len(array)] = array
+        start += len(array)
+    merged.flush()
+    del merged, arrays
+    os.replace(tmp_path, path)
+    for part in parts:
+        os.remove(part)
+    os.rmdir(os.path.join(out_dir, table))
+    return path
+
+def finalize(out_dir, summaries, scenario, engine="simpy", fmt="npy", merge=True):
+    # Parent side, after all replications: summaries table, manifest and (NumPy only) merged tables.
+    write_summaries(out_dir, summaries, fmt)
+    if fmt == "npy" and merge:
+        for table in TABLES:
+            consolidate(out_dir, table)
+    manifest = {
+        "format": fmt,
+        "model_version": sim.MODEL_VERSION,
+        "engine": engine,
+        "seeds": [s["seed"] for s in summaries],
+        "scenario": scenario_fingerprint(scenario),
+        "tables": {"patients": EXPORT_PATIENT_DTYPE.descr, "traces": TRACE_DTYPE.descr},
+        "resource_kinds": {"doctor": RESOURCE_DOCTOR, "xray_room": RESOURCE_XRAY_ROOM, "xray_pool": RESOURCE_XRAY_POOL},
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return out_dir
+
+# ----------- Readers -----------
+
+class ResultSet:
+    # Read side of a result set. Merged NumPy tables and NumPy partitions are memory-mapped,
+    # so columns are only paged in when used; Parquet partitions are decoded on read.
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+        self.manifest = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def partition_paths(self, table):
+        return sorted(glob.glob(os.path.join(self.out_dir, table, "part-*.npy"))
+                      + glob.glob(os.path.join(self.out_dir, table, "part-*.parquet")))
+
+    def partitions(self, table):
+        # One array per partition, e.g. to process a result set larger than memory.
+        merged = table_path(self.out_dir, table)
+        if os.path.exists(merged):
+            yield np.load(merged, mmap_mode="r")
+            return
+        for path in self.partition_paths(table):
+            yield _read_partition(path)
+
+    def table(self, table):
+        # Zero-copy for merged tables; partitions are concatenated (copied) otherwise.
+        merged = table_path(self.out_dir, table)
+        if os.path.exists(merged):
+            return np.load(merged, mmap_mode="r")
+        arrays = list(self.partitions(table))
+        if not arrays:
+            raise FileNotFoundError(f"No '{table}' table in {self.out_dir}")
+        return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+def open_results(out_dir):
+    return ResultSet(out_dir)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Describe or merge an exported result set.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--merge", action="store_true", help="Merge NumPy partitions into one file per table.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.merge:
+        for table in TABLES:
+            consolidate(args.out_dir, table)
+    results = open_results(args.out_dir)
+    for table in TABLES:
+        merged = os.path.exists(table_path(args.out_dir, table))
+        files = 1 if merged else len(results.partition_paths(table))
+        rows = sum(len(part) for part in results.partitions(table))
+        print(f"{table:<10} {rows:>10} rows in {files} {'merged file' if merged else 'partition(s)'}")
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+# ----------- Configuration -----------
+DEFAULT_BLOCK_SIZE = 128
+
+# How samplers turn a stream into variates: numpy's native generators (the default), or
+# inverse-transform sampling of u or of its mirror 1 - u, which makes two runs of one seed
+# an antithetic pair.
+NATIVE, INVERSE, ANTITHETIC = "native", "inverse", "antithetic"
+VARIATES = (NATIVE, INVERSE, ANTITHETIC)
+# Uniforms are kept this far inside (0, 1) so that u and 1 - u both have finite quantiles
+UNIFORM_MARGIN = 2.0 ** -53
+# Knots of the per-shape gamma quantile tables, evenly spaced in logit(u)
+QUANTILE_TABLE_SIZE = 4097
+
+# Stable stream identifiers. Every (stream, doctor) pair gets its own generator derived from
+# the run seed, so changing how often one stream is used never shifts the draws of another
+# (common random numbers across scenarios).
+STREAM_IDS = {
+    "arrival": 0,
+    "type_a_first_exam": 1,
+    "type_b_first_exam": 2,
+    "type_a_second_exam": 3,
+    "appointment_interval": 4,
+    "punctuality": 5,
+    "xray_decision": 6,
+    "xray_service": 7,
+    "xray_room_choice": 8,
+    # Multi-specialty departments (department.py)
+    "routing": 9,
+    "clinician_choice": 10,
+    "imaging_service": 11,
+    "imaging_room_choice": 12,
+}
+
+# ----------- Distribution Specs -----------
+
+@dataclass(frozen=True)
+class Exponential:
+    mean: float
+
+    def draw(self, generator, size):
+        return generator.exponential(self.mean, size)
+
+    def inverse_cdf(self, u):
+        return -self.mean * np.log1p(-u)
+
+    def expected_value(self):
+        return self.mean
+
+@dataclass(frozen=True)
+class Gamma:
+    shape: float
+    scale: float
+    floor: Optional[float] = None
+
+    def draw(self, generator, size):
+        values = generator.gamma(self.shape, self.scale, size)
+        if self.floor is not None:
+            np.maximum(values, self.floor, out=values)
+        return values
+
+    def inverse_cdf(self, u):
+        values = self.scale * gamma_quantile_table(self.shape)(u)
+        if self.floor is not None:
+            np.maximum(values, self.floor, out=values)
+        return values
+
+    def expected_value(self):
+        # Mean of the unfloored gamma; the floor only moves a small lower tail.
+        return self.shape * self.scale
+
+@dataclass(frozen=True)
+class Uniform:
+    low: float
+    high: float
+    floor: Optional[float] = None
+
+    def draw(self, generator, size):
+        values = generator.uniform(self.low, self.high, size)
+        if self.floor is not None:
+            np.maximum(values, self.floor, out=values)
+        return values
+
+    def inverse_cdf(self, u):
+        values = self.low + (self.high - self.low) * u
+        if self.floor is not None:
+            np.maximum(values, self.floor, out=values)
+        return values
+
+    def expected_value(self):
+        if self.floor is None or self.floor <= self.low:
+            return (self.low + self.high) / 2
+        if self.floor >= self.high:
+            return self.floor
+        # E[max(U, f)] = f * P(U < f) + E[U; U >= f]
+        width = self.high - self.low
+        return (self.floor * (self.floor - self.low) + (self.high**2 - self.floor**2) / 2) / width
+
+UNIT_UNIFORM = Uniform(0.0, 1.0)
+
+# ----------- Inverse Transform -----------
+
+def regularized_gamma_p(a, x):
+    # Lower regularized incomplete gamma P(a, x) for an array x >= 0: the power series below
+    # x = a + 1 and the continued fraction of Q = 1 - P (modified Lentz) above, as in
+    # Numerical Recipes 6.2, iterated until every element has converged.
+    x = np.asarray(x, dtype=np.float64)
+    result = np.zeros_like(x)
+    log_gamma_a = math.lgamma(a)
+    series = (x > 0) & (x < a + 1)
+    if series.any():
+        xs = x[series]
+        term = np.full_like(xs, 1.0 / a)
+        total = term.copy()
+        denominator = a
+        for _ in range(1000):
+            denominator += 1.0
+            term *= xs / denominator
+            total += term
+            if np.all(np.abs(term) < np.abs(total) * 1e-15):
+                break
+        result[series] = total * np.exp(a * np.log(xs) - xs - log_gamma_a)
+    fraction = x >= a + 1
+    if fraction.any():
+        xf = x[fraction]
+        tiny = 1e-300
+        b = xf + 1.0 - a
+        c = np.full_like(xf, 1.0 / tiny)
+        d = 1.0 / b
+        h = d.copy()
+        for i in range(1, 1000):
+            an = -i * (i - a)
+            b += 2.0
+            d = an * d + b
+            d[np.abs(d) < tiny] = tiny
+            c = b + an / c
+            c[np.abs(c) < tiny] = tiny
+            d = 1.0 / d
+            delta = d * c
+            h *= delta
+            if np.all(np.abs(delta - 1.0) < 1e-15):
+                break
+        result[fraction] = 1.0 - np.exp(a * np.log(xf) - xf - log_gamma_a) * h
+    return result
+
+def gamma_quantile(a, u):
+    # Inverse of P(a, .) for unit-scale gamma variates, by Halley iterations from the
+    # Numerical Recipes starting point (Wilson-Hilferty for a > 1). Vectorized over u.
+    u = np.asarray(u, dtype=np.float64)
+    log_gamma_a = math.lgamma(a)
+    if a > 1:
+        tail = np.where(u < 0.5, u, 1.0 - u)
+        t = np.sqrt(-2.0 * np.log(tail))
+        z = (2.30753 + t * 0.27061) / (1.0 + t * (0.99229 + t * 0.04481)) - t
+        z = np.where(u < 0.5, z, -z)
+        x = np.maximum(1e-3, a * (1.0 - 1.0 / (9.0 * a) - z / (3.0 * math.sqrt(a))) ** 3)
+    else:
+        t = 1.0 - a * (0.253 + a * 0.12)
+        x = np.where(u < t, (u / t) ** (1.0 / a), 1.0 - np.log1p(-(u - t) / (1.0 - t)))
+    for _ in range(100):
+        density = np.exp((a - 1.0) * np.log(x) - x - log_gamma_a)
+        step = (regularized_gamma_p(a, x) - u) / density
+        step = step / (1.0 - 0.5 * np.minimum(1.0, step * ((a - 1.0) / x - 1.0)))
+        updated = x - step
+        x = np.where(updated <= 0, 0.5 * x, updated)
+        if np.all(np.abs(step) <= 1e-12 * x):
+            break
+    return x
+
+class QuantileTable:
+    # Fast gamma quantiles: log x as a function of s = logit(u) is smooth and close to linear
+    # in both tails, so a cubic Hermite interpolant through exact quantiles, with exact slopes
+    # dy/ds = u (1 - u) / (x f(x)), stays within about 1e-10 (relative) of gamma_quantile.
+    def __init__(self, a, size=QUANTILE_TABLE_SIZE):
+        limit = math.log(1.0 / UNIFORM_MARGIN - 1.0)
+        u = np.unique(np.clip(1.0 / (1.0 + np.exp(-np.linspace(-limit, limit, size))),
+                              UNIFORM_MARGIN, 1.0 - UNIFORM_MARGIN))
+        x = gamma_quantile(a, u)
+        self.s = np.log(u) - np.log1p(-u)
+        self.y = np.log(x)
+        self.slopes = u * (1.0 - u) / np.exp(a * self.y - x - math.lgamma(a))
+
+    def __call__(self, u):
+        s = np.log(u) - np.log1p(-u)
+        k = np.clip(np.searchsorted(self.s, s) - 1, 0, len(self.s) - 2)
+        width = self.s[k + 1] - self.s[k]
+        t = (s - self.s[k]) / width
+        t2 = t * t
+        t3 = t2 * t
+        y = ((2 * t3 - 3 * t2 + 1) * self.y[k] + (t3 - 2 * t2 + t) * width * self.slopes[k]
+             + (3 * t2 - 2 * t3) * self.y[k + 1] + (t3 - t2) * width * self.slopes[k + 1])
+        return np.exp(y)
+
+@functools.lru_cache(maxsize=None)
+def gamma_quantile_table(a):
+    # Built once per shape and process
+    return QuantileTable(a)
+
+@dataclass(frozen=True)
+class InverseTransform:
+    # Draws a spec's variates as inverse_cdf(u) of the stream's uniforms, or of 1 - u
+    spec: object
+    antithetic: bool = False
+
+    def draw(self, generator, size):
+        u = np.clip(generator.random(size), UNIFORM_MARGIN, 1.0 - UNIFORM_MARGIN)
+        return self.spec.inverse_cdf(1.0 - u if self.antithetic else u)
+
+    def expected_value(self):
+        return self.spec.expected_value()
+
+# ----------- Buffered Samplers -----------
+
+class BufferedSampler:
+    # Hands out one variate per call from a block drawn in bulk; refills when exhausted.
+    __slots__ = ("spec", "generator", "block_size", "_buffer")
+
+    def __init__(self, spec, generator, block_size=DEFAULT_BLOCK_SIZE):
+        self.spec = spec
+        self.generator = generator
+        self.block_size = block_size
+        self._buffer = iter(())
+
+    def __call__(self):
+        try:
+            return next(self._buffer)
+        except StopIteration:
+            self._buffer = iter(self.spec.draw(self.generator, self.block_size).tolist())
+            return next(self._buffer)
+
+class SamplerStreams:
+    # Factory for independent, reproducible streams keyed by (stream name, doctor id).
+
+    def __init__(self, seed, block_size=DEFAULT_BLOCK_SIZE, variates=NATIVE):
+        if variates not in VARIATES:
+            raise ValueError(f"Unknown variates '{variates}'. Choose from: {', '.join(VARIATES)}")
+        self.seed = seed
+        self.block_size = block_size
+        self.variates = variates
+
+    def generator(self, stream, doctor_id=None):
+        spawn_key = (STREAM_IDS[stream],) if doctor_id is None else (STREAM_IDS[stream], doctor_id)
+        return np.random.Generator(np.random.PCG64(np.random.SeedSequence(self.seed, spawn_key=spawn_key)))
+
+    def sampler(self, stream, spec, doctor_id=None):
+        if self.variates != NATIVE:
+            spec = InverseTransform(spec, antithetic=self.variates == ANTITHETIC)
+        return BufferedSampler(spec, self.generator(stream, doctor_id), self.block_size)
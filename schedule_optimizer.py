@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+import main as sim
+import replications
+
+# ----------- Configuration -----------
+# Objective weights per minute of: mean patient wait, doctor idle time, overtime past SIM_TIME
+DEFAULT_WEIGHTS = {"wait": 1.0, "idle": 0.5, "overtime": 2.0}
+DEFAULT_BATCH_SEEDS = 10
+DEFAULT_MIN_SEEDS = 20
+DEFAULT_MAX_SEEDS = 100
+DEFAULT_ELIMINATION_CONFIDENCE = 0.95
+
+# ----------- Slot Templates -----------
+# Templates replace the random appointment intervals with deterministic slot times per doctor.
+# Spacings are given as a scale of each doctor's mean configured interval, so one template
+# keeps the doctors' relative booking loads.
+
+def mean_slot_interval(scenario, doctor_id):
+    return scenario.doctor_config(doctor_id)["appointment_interval"].expected_value()
+
+def _slots(start, end, interval, per_slot=1):
+    times = []
+    k = 0
+    while start + k * interval < end:
+        times.extend([start + k * interval] * per_slot)
+        k += 1
+    return times
+
+@dataclass(frozen=True)
+class FixedInterval:
+    # Equally spaced single slots, the first one interval after opening.
+    scale: float = 1.0
+
+    def slot_times(self, scenario, doctor_id):
+        interval = self.scale * mean_slot_interval(scenario, doctor_id)
+        return _slots(interval, scenario.sim_time, interval)
+
+    @property
+    def label(self):
+        return f"fixed x{self.scale:g}"
+
+@dataclass(frozen=True)
+class BlockBooking:
+    # block_size patients booked into the same slot, blocks block_size intervals apart
+    # (the same booked load as FixedInterval with this scale).
+    block_size: int = 2
+    scale: float = 1.0
+
+    def slot_times(self, scenario, doctor_id):
+        block_interval = self.block_size * self.scale * mean_slot_interval(scenario, doctor_id)
+        return _slots(block_interval, scenario.sim_time, block_interval, self.block_size)
+
+    @property
+    def label(self):
+        return f"blocks of {self.block_size} x{self.scale:g}"
+
+@dataclass(frozen=True)
+class FrontLoaded:
+    # Denser slots before lunch and sparser ones after it; nothing is booked into lunch.
+    morning_scale: float = 0.9
+    afternoon_scale: float = 1.2
+
+    def slot_times(self, scenario, doctor_id):
+        mean_interval = mean_slot_interval(scenario, doctor_id)
+        morning = self.morning_scale * mean_interval
+        afternoon = self.afternoon_scale * mean_interval
+        return (_slots(morning, scenario.lunch_start, morning)
+                + _slots(scenario.lunch_end, scenario.sim_time, afternoon))
+
+    @property
+    def label(self):
+        return f"front-loaded x{self.morning_scale:g}/x{self.afternoon_scale:g}"
+
+def template_label(template):
+    return "random intervals" if template is None else template.label
+
+def default_candidates():
+    # The current random intervals plus a grid over the three template families.
+    return ([None]
+            + [FixedInterval(scale) for scale in (0.8, 0.9, 1.0, 1.1, 1.2, 1.35)]
+            + [BlockBooking(2, scale) for scale in (0.9, 1.0, 1.1, 1.2)]
+            + [FrontLoaded(morning, afternoon) for morning, afternoon in ((0.8, 1.2), (0.9, 1.1), (0.9, 1.3), (1.0, 1.25))])
+
+# ----------- Objective -----------
+
+def schedule_objective(model, weights=DEFAULT_WEIGHTS):
+    # Weighted cost of one run: mean total wait (doctor, X-ray, second exam) per completed
+    # patient, mean doctor idle time during opening hours outside lunch, and overtime.
+    scenario = model.scenario
+    records = model.patient_records.to_array()
+    waits = np.nansum(np.stack([records[name].astype(np.float64)
+                                for name in ("doctor_wait", "xray_wait", "second_exam_wait")]), axis=0)
+    windows = ((0.0, scenario.lunch_start), (scenario.lunch_end, scenario.sim_time))
+    idle = [sum((end - start) * (1.0 - trace.utilization(1, end, start)) for start, end in windows)
+            for trace in model.doctor_traces]
+    components = {
+        "wait": float(waits.mean()) if len(waits) else 0.0,
+        "idle": float(np.mean(idle)),
+        "overtime": model.collect_run_summary()["overtime"],
+    }
+    return sum(weights[name] * components[name] for name in weights), components
+
+def evaluate_schedule(task):
+    # Worker: one candidate on a batch of seeds -> rows of (objective, wait, idle, overtime).
+    candidate_idx, template, seeds, scenario, weights, engine = task
+    candidate_scenario = scenario.replace(appointment_template=template)
+    rows = []
+    for seed in seeds:
+        model = replications.build_model(seed, candidate_scenario, engine).run()
+        objective, components = schedule_objective(model, weights)
+        rows.append((objective, components["wait"], components["idle"], components["overtime"]))
+    return candidate_idx, rows
+
+# ----------- Racing -----------
+
+def race_schedules(candidates=None, scenario=sim.DEFAULT_SCENARIO, weights=DEFAULT_WEIGHTS,
+                   base_seed=sim.RANDOM_SEED, batch_seeds=DEFAULT_BATCH_SEEDS, min_seeds=DEFAULT_MIN_SEEDS,
+                   max_seeds=DEFAULT_MAX_SEEDS, confidence=DEFAULT_ELIMINATION_CONFIDENCE, workers=None,
+                   engine="simpy"):
+    # Racing on common random numbers: all surviving candidates run on the same batch of
+    # seeds, and once min_seeds are in, a candidate whose paired difference to the current
+    # leader is significantly positive is dropped. The simulation budget therefore goes to
+    # the schedules still in contention.
+    candidates = default_candidates() if candidates is None else list(candidates)
+    seeds = replications.spawn_seeds(base_seed, max_seeds)
+    workers = workers or os.cpu_count() or 1
+    rows = {idx: [] for idx in range(len(candidates))}
+    alive = list(range(len(candidates)))
+    eliminated_after = {}
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for start in range(0, max_seeds, batch_seeds):
+            batch = seeds[start:start + batch_seeds]
+            tasks = [(idx, candidates[idx], batch, scenario, weights, engine) for idx in alive]
+            results = executor.map(evaluate_schedule, tasks) if executor is not None else map(evaluate_schedule, tasks)
+            for idx, batch_rows in results:
+                rows[idx].extend(batch_rows)
+
+            objectives = {idx: np.array([row[0] for row in rows[idx]]) for idx in alive}
+            leader = min(alive, key=lambda idx: objectives[idx].mean())
+            n = len(objectives[leader])
+            if n >= min_seeds:
+                t_value = replications.t_critical(confidence, n - 1)
+                for idx in list(alive):
+                    if idx == leader:
+                        continue
+                    diff = objectives[idx] - objectives[leader]
+                    if diff.mean() - t_value * diff.std(ddof=1) / math.sqrt(n) > 0:
+                        alive.remove(idx)
+                        eliminated_after[idx] = n
+            if len(alive) == 1:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    ranking = []
+    for idx, template in enumerate(candidates):
+        values = np.array(rows[idx])
+        ranking.append({
+            "template": template,
+            "label": template_label(template),
+            "seeds": len(values),
+            "objective": float(values[:, 0].mean()),
+            "wait": float(values[:, 1].mean()),
+            "idle": float(values[:, 2].mean()),
+            "overtime": float(values[:, 3].mean()),
+            "status": "in contention" if idx in alive else f"dropped after {eliminated_after[idx]}",
+        })
+    ranking.sort(key=lambda r: (r["status"] != "in contention", r["objective"]))
+    return {
+        "ranking": ranking,
+        "runs": sum(r["seeds"] for r in ranking),
+        "full_budget": len(candidates) * max_seeds,
+    }
+
+def print_ranking(result):
+    print(f"{'Schedule':<26} | {'Seeds':>5} | {'Objective':>9} | {'Wait':>7} | {'Idle':>7} | {'Overtime':>8} | Status")
+    print("-" * 100)
+    for row in result["ranking"]:
+        print(f"{row['label']:<26} | {row['seeds']:>5} | {row['objective']:>9.2f} | {row['wait']:>7.2f} | "
+              f"{row['idle']:>7.2f} | {row['overtime']:>8.2f} | {row['status']}")
+    print(f"\nSimulation runs: {result['runs']} of {result['full_budget']} for a full evaluation of every candidate")
+
+def parse_weights(text):
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, text.split(",")):
+        name, value = item.split("=", 1)
+        if name not in weights:
+            raise ValueError(f"Unknown objective term '{name}'. Choose from: {', '.join(weights)}")
+        weights[name] = float(value)
+    return weights
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Search appointment slot templates by racing simulated candidates.")
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED)
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH_SEEDS, help="Seeds added per racing round.")
+    parser.add_argument("--min-seeds", type=int, default=DEFAULT_MIN_SEEDS, help="Seeds before any candidate is dropped.")
+    parser.add_argument("--max-seeds", type=int, default=DEFAULT_MAX_SEEDS, help="Seeds per candidate at most.")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_ELIMINATION_CONFIDENCE)
+    parser.add_argument("--weights", default="", metavar="wait=1,idle=0.5,overtime=2")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", choices=replications.ENGINES, default="simpy")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = race_schedules(weights=parse_weights(args.weights), base_seed=args.seed, batch_seeds=args.batch,
+                            min_seeds=args.min_seeds, max_seeds=args.max_seeds, confidence=args.confidence,
+                            workers=args.workers, engine=args.engine)
+    print_ranking(result)
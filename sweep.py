@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import fields
+
+import numpy as np
+
+import main as sim
+import replications
+from cache import DEFAULT_CACHE_MAX_BYTES, ResultCache
+from dispatch import DISPATCHERS
+
+# ----------- Configuration -----------
+DEFAULT_SWEEP_REPLICATIONS = 30
+DEFAULT_TASK_SIZE = 10
+# Structured fields (templates, config-file profiles, break timetables) are set through
+# their own tools, not swept
+STRUCTURED_PARAMETERS = {"appointment_template", "doctor_profiles", "doctor_breaks", "xray_service_time"}
+SWEEP_PARAMETERS = {f.name: f for f in fields(sim.Scenario) if f.name not in STRUCTURED_PARAMETERS}
+OPTIONAL_INT_PARAMETERS = {"appointment_only_doctor_id", "walkin_only_doctor_id"}
+INTEGER_PARAMETERS = {"num_doctors", "num_xray_rooms"} | OPTIONAL_INT_PARAMETERS
+CHOICE_PARAMETERS = {"xray_dispatch": tuple(DISPATCHERS)}
+
+# ----------- Designs -----------
+
+def parse_parameter_value(name, text):
+    if name not in SWEEP_PARAMETERS:
+        raise ValueError(f"Unknown scenario parameter '{name}'. Choose from: {', '.join(SWEEP_PARAMETERS)}")
+    if name in OPTIONAL_INT_PARAMETERS and text.strip().lower() in ("none", ""):
+        return None
+    if name in CHOICE_PARAMETERS:
+        if text.strip() not in CHOICE_PARAMETERS[name]:
+            raise ValueError(f"Invalid value '{text}' for {name}. Choose from: {', '.join(CHOICE_PARAMETERS[name])}")
+        return text.strip()
+    if name in INTEGER_PARAMETERS:
+        return int(text)
+    return float(text)
+
+def grid_design(parameter_grid):
+    # Full factorial design: one cell per combination of the listed values.
+    names = list(parameter_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(parameter_grid[n] for n in names))]
+
+def latin_hypercube_design(parameter_ranges, num_cells, seed=sim.RANDOM_SEED):
+    # One stratum per cell in every dimension, strata shuffled independently per parameter.
+    rng = np.random.default_rng(seed)
+    design = [{} for _ in range(num_cells)]
+    for name, (low, high) in parameter_ranges.items():
+        strata = (rng.permutation(num_cells) + rng.random(num_cells)) / num_cells
+        values = low + strata * (high - low)
+        for cell, value in zip(design, values):
+            cell[name] = int(round(value)) if name in INTEGER_PARAMETERS else float(value)
+    return design
+
+def estimate_cell_cost(scenario):
+    # Relative work of one replication: expected patients times the resource visits they make.
+    cost = 0.0
+    for i in range(scenario.num_doctors):
+        config = scenario.doctor_config(i)
+        walkins = 0.0 if i == scenario.appointment_only_doctor_id else scenario.walkin_cutoff_time / config["arrival"].expected_value()
+        appointments = 0.0 if i == scenario.walkin_only_doctor_id else scenario.sim_time / config["appointment_interval"].expected_value()
+        cost += (walkins + appointments) * (1 + 2 * config["xray_probability"])
+    return cost
+
+# ----------- Workers -----------
+
+def run_cell_replications(scenario, seeds, engine="simpy"):
+    return [replications.run_single_replication(seed, scenario=scenario, engine=engine) for seed in seeds]
+
+# ----------- Sweep Runner -----------
+
+def run_sweep(design, num_replications=DEFAULT_SWEEP_REPLICATIONS, base_seed=sim.RANDOM_SEED, workers=None,
+              base_scenario=sim.DEFAULT_SCENARIO, task_size=DEFAULT_TASK_SIZE, cache=None, engine="simpy"):
+    # Every cell uses the same replication seeds (common random numbers across cells).
+    seeds = replications.spawn_seeds(base_seed, num_replications)
+    scenarios = [base_scenario.replace(**cell) for cell in design]
+
+    results = {}
+    if cache is not None:
+        for cell_id, scenario in enumerate(scenarios):
+            for rep_idx, seed in enumerate(seeds):
+                cached = cache.get(scenario, seed, engine=engine)
+                if cached is not None:
+                    results[(cell_id, rep_idx)] = cached
+
+    # Tasks are chunks of one cell's uncached replications, submitted most expensive first so
+    # the longest cells do not end up as stragglers at the tail of the sweep.
+    tasks = []
+    for cell_id, scenario in enumerate(scenarios):
+        cost = estimate_cell_cost(scenario)
+        missing = [rep_idx for rep_idx in range(num_replications) if (cell_id, rep_idx) not in results]
+        for start in range(0, len(missing), task_size):
+            tasks.append((cost, cell_id, missing[start:start + task_size]))
+    tasks.sort(key=lambda task: -task[0])
+
+    def store(cell_id, rep_indices, summaries):
+        for rep_idx, summary in zip(rep_indices, summaries):
+            results[(cell_id, rep_idx)] = summary
+            if cache is not None:
+                cache.put(scenarios[cell_id], seeds[rep_idx], summary, engine=engine)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for _, cell_id, rep_indices in tasks:
+            store(cell_id, rep_indices, run_cell_replications(scenarios[cell_id], [seeds[i] for i in rep_indices], engine))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_cell_replications, scenarios[cell_id], [seeds[i] for i in rep_indices], engine):
+                       (cell_id, rep_indices) for _, cell_id, rep_indices in tasks}
+            for future in as_completed(futures):
+                store(*futures[future], future.result())
+
+    rows = []
+    for cell_id, cell in enumerate(design):
+        for rep_idx in range(num_replications):
+            rows.extend(_tidy_rows(cell_id, cell, rep_idx, results[(cell_id, rep_idx)]))
+    return rows
+
+def _tidy_rows(cell_id, cell, replication, summary):
+    # Long format: one row per (cell, replication, metric) observation.
+    seed = summary["seed"]
+    return [{"cell_id": cell_id, **cell, "replication": replication, "seed": seed, "metric": metric, "value": value}
+            for metric, value in summary.items() if metric != "seed"]
+
+def summarize_sweep(rows, confidence=replications.DEFAULT_CONFIDENCE):
+    by_cell = {}
+    for row in rows:
+        per_rep = by_cell.setdefault(row["cell_id"], {})
+        per_rep.setdefault(row["replication"], {"seed": row["seed"]})[row["metric"]] = row["value"]
+    return {cell_id: replications.aggregate_summaries(list(per_rep.values()), confidence)
+            for cell_id, per_rep in sorted(by_cell.items())}
+
+def write_results_table(rows, path, parameter_names):
+    columns = ["cell_id", *parameter_names, "replication", "seed", "metric", "value"]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+# ----------- Command Line -----------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run replications for every cell of a scenario design.")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2,...",
+                        help="Grid values for a Scenario field (repeatable).")
+    parser.add_argument("--lhs", type=int, default=None, metavar="CELLS",
+                        help="Use a Latin-hypercube design with this many cells over the --range bounds.")
+    parser.add_argument("--range", action="append", default=[], metavar="NAME=LOW:HIGH",
+                        help="Bounds of a Scenario field for --lhs (repeatable).")
+    parser.add_argument("-n", "--replications", type=int, default=DEFAULT_SWEEP_REPLICATIONS)
+    parser.add_argument("--seed", type=int, default=sim.RANDOM_SEED)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--task-size", type=int, default=DEFAULT_TASK_SIZE)
+    parser.add_argument("--out", default="outputs/sweep_results.csv")
+    parser.add_argument("--cache-dir", default=None, help="Reuse and store per-replication results in this cache.")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_MAX_BYTES / 2**20)
+    parser.add_argument("--engine", choices=replications.ENGINES, default="simpy")
+    parser.add_argument("--config", metavar="PATH", help="Base clinic config file the design varies, see config.py.")
+    parser.add_argument("--prune-load", type=float, default=None, metavar="LOAD",
+                        help="Skip cells whose busiest doctor or X-ray room has an analytic load of at least LOAD "
+                             "(see analytic.py).")
+    return parser.parse_args(argv)
+
+def design_from_args(args):
+    if args.lhs is not None:
+        ranges = {}
+        for spec in args.range:
+            name, bounds = spec.split("=", 1)
+            if name in CHOICE_PARAMETERS:
+                raise ValueError(f"{name} has no numeric range; list its values with --param instead.")
+            low, high = bounds.split(":", 1)
+            ranges[name] = (parse_parameter_value(name, low), parse_parameter_value(name, high))
+        return latin_hypercube_design(ranges, args.lhs, seed=args.seed)
+    grid = {}
+    for spec in args.param:
+        name, values = spec.split("=", 1)
+        grid[name] = [parse_parameter_value(name, v) for v in values.split(",")]
+    return grid_design(grid)
+
+if __name__ == "__main__":
+    args = parse_args()
+    design = design_from_args(args)
+    parameter_names = list(design[0]) if design else []
+    cache = ResultCache(args.cache_dir, int(args.cache_max_mb * 2**20)) if args.cache_dir else None
+    base_scenario = sim.DEFAULT_SCENARIO
+    if args.config:
+        import config
+        base_scenario = config.load_config(args.config)
+    if args.prune_load is not None:
+        import analytic
+        design, pruned = analytic.prune_design(design, base_scenario, args.prune_load)
+        print(f"Pruned {len(pruned)} overloaded cell(s) (analytic load >= {args.prune_load:g}).")
+    rows = run_sweep(design, args.replications, base_seed=args.seed, workers=args.workers, task_size=args.task_size,
+                     cache=cache, engine=args.engine, base_scenario=base_scenario)
+    write_results_table(rows, args.out, parameter_names)
+
+    print(f"Cells: {len(design)}, replications per cell: {args.replications}, rows written: {len(rows)} -> {args.out}")
+    summary = summarize_sweep(rows)
+    for cell_id, cell in enumerate(design):
+        stats = summary[cell_id]
+        cell_str = ", ".join(f"{k}={v}" for k, v in cell.items())
+        print(f"[{cell_id}] {cell_str}: overtime {stats['overtime']['mean']:.1f} "
+              f"[{stats['overtime']['ci_low']:.1f}, {stats['overtime']['ci_high']:.1f}], "
+              f"time in system {stats['mean_time_in_system']['mean']:.1f} min")